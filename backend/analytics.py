@@ -0,0 +1,100 @@
+from datetime import date
+
+import numpy as np
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .config import settings
+from .db.changes import get_data_version
+from .models.models import HealthWatchData
+from .utils.cache import TTLCache
+
+# Health analytics of a year of HealthWatch data, computed in one vectorized pass over a (days x metrics)
+# array so clients get a few statistics instead of the raw series. Results only depend on the data:
+# they are cached per user and data version, any write to the user's data makes them stale.
+
+METRICS = {
+    "sleep": (
+        HealthWatchData.sleep_duration_light
+        + HealthWatchData.sleep_duration_deep
+        + HealthWatchData.sleep_duration_rem
+    ),
+    "hrv": HealthWatchData.hrv,
+    "strain": HealthWatchData.strain,
+    "recovery": HealthWatchData.recovery,
+    "resting_hr": HealthWatchData.resting_hr,
+}
+LATEST_COUNT = 30  # Days of the latest window, trends compare it to the previous LATEST_COUNT days
+TRAILING_WINDOW = 7  # Days of the trailing mean, always the latest ones
+SERIES = ("hrv", "strain", "recovery")  # Daily values of the window, for the strain/recovery chart
+
+analytics_cache = TTLCache(settings.STATS_CACHE_SIZE, settings.STATS_CACHE_TTL)
+
+
+def compute_health_analytics(values: np.ndarray, latest_only: bool) -> dict:
+    # `values` holds one row per day in date order, one column per metric
+    window = values[-LATEST_COUNT:] if latest_only else values
+    mean = window.mean(axis=0)
+    std = window.std(axis=0)
+    quartiles = np.quantile(window, [0, 0.25, 0.5, 0.75, 1], axis=0)  # Linear, as the frontend gauges
+    trailing = values[-TRAILING_WINDOW:].mean(axis=0)
+    # How unusual the last day is within the window
+    zscores = np.divide(values[-1] - mean, std, out=np.zeros_like(mean), where=std > 0)
+
+    previous = None
+    if latest_only and len(values) > 2 * LATEST_COUNT:
+        previous = values[-2 * LATEST_COUNT : -LATEST_COUNT].mean(axis=0)
+
+    stats = np.vstack([mean, std, quartiles, trailing, zscores]).round(2)
+    metrics = {}
+    for i, metric in enumerate(METRICS):
+        average, deviation, low, q1, median, q3, high, trailing_mean, zscore = stats[:, i].tolist()
+        metrics[metric] = {
+            "average": average,
+            "std": deviation,
+            "min": low,
+            "q1": q1,
+            "median": median,
+            "q3": q3,
+            "max": high,
+            "trailing_7d_mean": trailing_mean,
+            "zscore": zscore,
+            "trend": None,
+        }
+        if previous is not None:
+            change = round(float(mean[i] - previous[i]), 2)
+            metrics[metric]["trend"] = {
+                "previous": round(float(previous[i]), 2),
+                "change": change,
+                "direction": "up" if change > 0 else "down" if change < 0 else "",
+            }
+
+    columns = list(METRICS)
+    series = {metric: window[:, columns.index(metric)].round(2).tolist() for metric in SERIES}
+    return {"count": len(window), "latest": None, "metrics": metrics, "series": series}
+
+
+async def get_health_analytics(session: AsyncSession, username: str, year: int, latest_only: bool) -> dict:
+    version = await get_data_version(session, username)
+    key = (username, year, latest_only, version)
+    cached = analytics_cache.get(key)
+    if cached is not None:
+        return cached
+
+    rows = (
+        await session.exec(
+            select(HealthWatchData.cdate, *METRICS.values())
+            .where(HealthWatchData.user == username)
+            .where(HealthWatchData.cdate >= date(year, 1, 1), HealthWatchData.cdate < date(year + 1, 1, 1))
+            .order_by(HealthWatchData.cdate)
+        )
+    ).all()
+
+    empty_series = {"dates": [], **{metric: [] for metric in SERIES}}
+    analytics = {"count": 0, "latest": None, "metrics": {}, "series": empty_series}
+    if rows:
+        analytics = compute_health_analytics(np.array([row[1:] for row in rows], dtype=float), latest_only)
+        analytics["latest"] = rows[-1].cdate
+        analytics["series"]["dates"] = [row.cdate for row in rows[-analytics["count"] :]]
+    analytics_cache.set(key, analytics)
+    return analytics
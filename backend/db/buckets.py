@@ -0,0 +1,93 @@
+from datetime import date, timedelta
+
+from fastapi import HTTPException
+from sqlmodel import func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from ..models.models import DurationRollup
+from .dialect import dialect_of
+
+# Time bucketing of the duration rollups by "day", "week" (ISO), "month" or "quarter".
+# Buckets are whole periods: a [start, end] range is widened to the bounds of its first and last bucket.
+# One grouped query reads the rollups on a plain range of their `start` (served by the primary key),
+# buckets without any duration are filled with zeros.
+
+UNITS = ("day", "week", "month", "quarter")
+
+
+def bucket_start(day: date, unit: str) -> date:
+    if unit == "week":
+        return day - timedelta(days=day.weekday())
+    if unit == "month":
+        return day.replace(day=1)
+    if unit == "quarter":
+        return date(day.year, day.month - (day.month - 1) % 3, 1)
+    return day
+
+
+def next_bucket(start: date, unit: str) -> date:
+    try:
+        if unit in ("day", "week"):
+            return start + timedelta(days=1 if unit == "day" else 7)
+
+        months = start.month - 1 + (1 if unit == "month" else 3)
+        return date(start.year + months // 12, months % 12 + 1, 1)
+    except (OverflowError, ValueError):
+        # No bucket after date.max
+        raise HTTPException(status_code=400, detail="Bad request")
+
+
+def bucket_count(start: date, end: date, unit: str) -> int:
+    # len(bucket_starts(start, end, unit)), without building them
+    first, last = bucket_start(start, unit), bucket_start(end, unit)
+    if unit in ("day", "week"):
+        return (last - first).days // (1 if unit == "day" else 7) + 1
+
+    months = (last.year - first.year) * 12 + last.month - first.month
+    return months // (1 if unit == "month" else 3) + 1
+
+
+def bucket_starts(start: date, end: date, unit: str) -> list[date]:
+    buckets = [bucket_start(start, unit)]
+    while (following := next_bucket(buckets[-1], unit)) <= end:
+        buckets.append(following)
+    return buckets
+
+
+def iso_year_range(year: int) -> tuple[date, date]:
+    # ISO years hold 52 or 53 whole weeks, from the Monday of week 1 to the Sunday of the last one
+    try:
+        return date.fromisocalendar(year, 1, 1), date.fromisocalendar(year + 1, 1, 1) - timedelta(days=1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Bad request")
+
+
+def bucket_totals(series: dict[int, list[int]], size: int) -> list[int]:
+    return [sum(durations) for durations in zip(*series.values())] or [0] * size
+
+
+async def duration_buckets(
+    session: AsyncSession, username: str, unit: str, buckets: list[date]
+) -> dict[int, list[int]]:
+    # {category_id: [duration of each bucket]}, for the categories having any duration in the buckets
+    bucket = DurationRollup.start
+    if unit in ("month", "quarter"):
+        bucket = dialect_of(await session.connection()).date_trunc(unit, DurationRollup.start)
+
+    query = (
+        select(
+            bucket.label("bucket"),
+            DurationRollup.category_id,
+            func.sum(DurationRollup.duration).label("duration"),
+        )
+        .where(DurationRollup.user == username)
+        .where(DurationRollup.period == ("week" if unit == "week" else "day"))
+        .where(DurationRollup.start >= buckets[0], DurationRollup.start < next_bucket(buckets[-1], unit))
+        .group_by("bucket", DurationRollup.category_id)
+    )
+
+    index = {start: i for i, start in enumerate(buckets)}
+    series = {}
+    for row in await session.exec(query):
+        series.setdefault(row.category_id, [0] * len(buckets))[index[row.bucket]] = row.duration
+    return series
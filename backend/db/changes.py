@@ -0,0 +1,142 @@
+import time
+
+from sqlalchemy import bindparam, event, insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from sqlmodel import delete, func, select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from ..models.models import (
+    PR,
+    Bloc,
+    ChangeLog,
+    DataVersion,
+    PRValue,
+    Program,
+    ProgramStep,
+    ProgramStepBloc,
+    Stash,
+)
+from .dialect import dialect_of
+
+# Every user has a data version, bumped in the same transaction as any change to one of its rows.
+# Read endpoints derive their ETag from it, see deps.check_etag.
+# Changes to synced entities are also appended to the change log, read by /api/sync.
+# The change log only covers CHANGELOG_RETENTION_DAYS: older rows are compacted and a user's sync_floor
+# records the last compacted sequence, cursors before it get a full resync.
+
+ENTITIES = {"blocs": Bloc, "pr": PR, "programs": Program, "stash": Stash}
+OPS = {"new": "insert", "dirty": "update", "deleted": "delete"}
+
+
+def _owner(session: Session, obj) -> str | None:
+    if isinstance(obj, DataVersion):
+        return None
+
+    if isinstance(obj, PRValue):
+        pr = session.get(PR, obj.pr_id) if obj.pr_id else obj.pr
+        return pr.user if pr else None
+
+    # BlocResult has no owner, but it is always added or removed along with its bloc
+    return getattr(obj, "user", None)
+
+
+def _synced_entity(session: Session, obj, op: str) -> tuple[str, int | object, str] | None:
+    # (entity, id or object whose id is known after the flush, op), children update their parent
+    for entity, model in ENTITIES.items():
+        if isinstance(obj, model):
+            return entity, obj, op
+
+    if isinstance(obj, PRValue):
+        return "pr", obj.pr_id or obj.pr, "update"
+
+    if isinstance(obj, ProgramStepBloc):
+        obj = session.get(ProgramStep, obj.program_step_id) if obj.program_step_id else obj.program_steps
+    if isinstance(obj, ProgramStep):
+        return "programs", obj.program_id or obj.program, "update"
+    return None
+
+
+def _bump_stmt(connection, username: str):
+    return (
+        dialect_of(connection)
+        .insert(DataVersion)
+        .values(user=username, version=1)
+        .on_conflict_do_update(index_elements=["user"], set_={"version": DataVersion.version + 1})
+    )
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_changes(session: Session, flush_context, instances):
+    changed_users = session.info.setdefault("changed_users", set())
+    changes = session.info.setdefault("changes", [])
+    for state, op in OPS.items():
+        for obj in getattr(session, state):
+            username = _owner(session, obj)
+            if not username:
+                continue
+
+            changed_users.add(username)
+            change = _synced_entity(session, obj, op)
+            if change and change[1] is not None:
+                changes.append((username, *change))
+
+
+@event.listens_for(Session, "after_flush")
+def _record_changes(session: Session, flush_context):
+    connection = session.connection()
+    for username in session.info.pop("changed_users", ()):
+        connection.execute(_bump_stmt(connection, username))
+
+    rows = []
+    for username, entity, target, op in session.info.pop("changes", ()):
+        entity_id = target if isinstance(target, int) else target.id
+        rows.append({"user": username, "entity": entity, "entity_id": entity_id, "op": op, "ts": time.time()})
+    if rows:
+        connection.execute(insert(ChangeLog), rows)
+
+
+async def bump_data_version(session: AsyncSession, username: str):
+    # For bulk statements, which bypass the flush
+    connection = await session.connection()
+    await connection.execute(_bump_stmt(connection, username))
+
+
+async def record_bulk_changes(session: AsyncSession, username: str, entity: str, ids: list[int], op: str):
+    await bump_data_version(session, username)
+    connection = await session.connection()
+    if ids:
+        await connection.execute(
+            insert(ChangeLog),
+            [{"user": username, "entity": entity, "entity_id": i, "op": op, "ts": time.time()} for i in ids],
+        )
+
+
+async def get_data_version(session: AsyncSession, username: str) -> int:
+    version = (await session.exec(select(DataVersion.version).where(DataVersion.user == username))).first()
+    return version or 0
+
+
+async def get_sync_floor(session: AsyncSession, username: str) -> int:
+    floor = (await session.exec(select(DataVersion.sync_floor).where(DataVersion.user == username))).first()
+    return floor or 0
+
+
+def compact_change_log(connection: Connection, before: float) -> int:
+    # The last row is always kept: SQLite reuses the ids of an emptied table, sequences must never go back
+    last = connection.execute(select(func.max(ChangeLog.id))).scalar()
+    if last is None:
+        return 0
+
+    compacted = (ChangeLog.ts < before, ChangeLog.id < last)
+    floors = connection.execute(
+        select(ChangeLog.user, func.max(ChangeLog.id)).where(*compacted).group_by(ChangeLog.user)
+    ).all()
+    if floors:
+        connection.execute(
+            update(DataVersion)
+            .where(DataVersion.user == bindparam("username"))
+            .values(sync_floor=bindparam("floor")),
+            [{"username": username, "floor": floor} for username, floor in floors],
+        )
+    return connection.execute(delete(ChangeLog).where(*compacted)).rowcount
@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+from ..config import settings
+from ..utils.logging import app_logger
+from .changes import compact_change_log
+from .shards import user_data_engines
+
+# Change log retention: every CHANGELOG_COMPACT_INTERVAL, change log rows older than CHANGELOG_RETENTION_DAYS
+# are dropped from every open database, see changes.compact_change_log.
+
+_compactor: asyncio.Task | None = None
+
+
+async def compact_change_logs() -> int:
+    before = time.time() - settings.CHANGELOG_RETENTION_DAYS * 86400
+    compacted = 0
+    for engine in user_data_engines():
+        async with engine.begin() as conn:
+            compacted += await conn.run_sync(compact_change_log, before)
+    return compacted
+
+
+async def _compact_forever():
+    while True:
+        await asyncio.sleep(settings.CHANGELOG_COMPACT_INTERVAL)
+        try:
+            await compact_change_logs()
+        except Exception as exc:
+            app_logger.error(f"[change_log_compactor] Exception: {exc}")
+
+
+def start_compactor():
+    global _compactor
+    _compactor = asyncio.create_task(_compact_forever())
+
+
+async def stop_compactor():
+    global _compactor
+    if _compactor:
+        _compactor.cancel()
+        try:
+            await _compactor
+        except asyncio.CancelledError:
+            pass
+        _compactor = None
@@ -1,36 +1,64 @@
 from sqlalchemy import event
-from sqlalchemy.engine import Engine
-from sqlmodel import Session, SQLModel, create_engine
+from sqlalchemy.engine import URL
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.orm import ORMExecuteState, Session, raiseload
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from ..config import settings
 from ..models.models import BlocCategory
+from . import changes  # noqa: F401, registers the data version listeners
+from . import rollups  # noqa: F401, registers the duration rollup listener
+from .dialect import database_url, get_dialect
+from .migrations import run_migrations
 
 _engine = None
+_read_engine = None
+
+
+def _raise_on_lazy_load(state: ORMExecuteState):
+    # Relationships a query did not ask for raise instead of being loaded one row at a time
+    if state.is_select and not state.is_relationship_load and not state.is_column_load:
+        state.statement = state.statement.options(raiseload("*"))
+
+
+if settings.SQL_RAISE_ON_LAZY_LOAD:
+    event.listen(Session, "do_orm_execute", _raise_on_lazy_load)
+
+
+def build_engine(url: URL | None = None, read_only: bool = False) -> AsyncEngine:
+    url = url or database_url()
+    dialect = get_dialect(url)
+    engine = create_async_engine(dialect.async_url(url), **dialect.engine_kwargs(read_only))
+    dialect.register(engine.sync_engine, read_only)
+    return engine
 
 
 def get_engine():
     global _engine
     if not _engine:
-        _engine = create_engine(
-            f"sqlite:///{settings.SQLITE_FILE}",
-            connect_args={"check_same_thread": False},
-        )
+        _engine = build_engine()
     return _engine
 
 
-@event.listens_for(Engine, "connect")
-def set_sqlite_pragma(dbapi_connection, connection_record):
-    cursor = dbapi_connection.cursor()
-    cursor.execute("PRAGMA foreign_keys=ON")
-    cursor.close()
+def get_read_engine():
+    global _read_engine
+    if not _read_engine:
+        _read_engine = build_engine(read_only=True)
+    return _read_engine
+
+
+async def init_schema(engine: AsyncEngine):
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    await run_migrations(engine)
 
 
-def init_db():
-    engine = get_engine()
-    SQLModel.metadata.create_all(engine)
+async def init_db():
+    await init_schema(get_engine())
 
 
-def init_user_data(session: Session, username: str):
+async def init_user_data(session: AsyncSession, username: str):
     categories = [
         {"user": username, "name": "note", "color": "#909090", "weight": 1},
         {"user": username, "name": "(p)rehab", "color": "#18a773", "weight": 2},
@@ -43,4 +71,4 @@ def init_user_data(session: Session, username: str):
     ]
 
     session.add_all([BlocCategory(**c) for c in categories])
-    session.commit()
+    await session.commit()
@@ -0,0 +1,128 @@
+from abc import ABC, abstractmethod
+
+from sqlalchemy import Date, Integer, TextClause, event, func, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.sql.elements import ColumnElement
+
+from ..config import settings
+
+
+class DialectAdapter(ABC):
+    """Everything that differs between the supported databases lives behind this interface."""
+
+    name: str = ""
+    async_driver: str = ""
+
+    def async_url(self, url: URL) -> URL:
+        return url.set(drivername=f"{self.name}+{self.async_driver}")
+
+    def engine_kwargs(self, read_only: bool = False) -> dict:
+        return {
+            "pool_size": settings.DATABASE_POOL_SIZE,
+            "max_overflow": settings.DATABASE_MAX_OVERFLOW,
+            "pool_pre_ping": settings.DATABASE_POOL_PRE_PING,
+            "pool_recycle": settings.DATABASE_POOL_RECYCLE,
+        }
+
+    def on_connect(self, dbapi_connection, read_only: bool = False): ...
+
+    @abstractmethod
+    def insert(self, table):
+        # Dialect specific INSERT, supporting on_conflict_do_nothing / on_conflict_do_update
+        ...
+
+    def register(self, engine: Engine, read_only: bool = False):
+        @event.listens_for(engine, "connect")
+        def set_connection_options(dbapi_connection, connection_record):
+            self.on_connect(dbapi_connection, read_only)
+
+    def add_days(self, column, days: int) -> ColumnElement:
+        return column + days
+
+    def date_trunc(self, unit: str, column) -> ColumnElement:
+        # First day of the "day", "week" (ISO, Monday), "month" or "quarter" holding the date
+        return func.date_trunc(unit, column).cast(Date)
+
+    def begin_snapshot(self) -> TextClause:
+        # First statement of a transaction whose reads must all see the same snapshot
+        return text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+
+
+class SQLiteAdapter(DialectAdapter):
+    name = "sqlite"
+    async_driver = "aiosqlite"
+
+    def engine_kwargs(self, read_only: bool = False) -> dict:
+        kwargs = {"connect_args": {"timeout": settings.SQLITE_BUSY_TIMEOUT / 1000}}
+        if read_only:
+            kwargs["pool_size"] = settings.SQLITE_READ_POOL_SIZE
+        return kwargs
+
+    def on_connect(self, dbapi_connection, read_only: bool = False):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT)}")
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+        cursor.execute(f"PRAGMA cache_size={int(settings.SQLITE_CACHE_SIZE)}")
+        cursor.execute(f"PRAGMA temp_store={settings.SQLITE_TEMP_STORE}")
+        if read_only:
+            # Readers never take the write lock, in WAL mode they do not wait on writers either
+            cursor.execute("PRAGMA query_only=ON")
+        else:
+            # journal_mode is persisted in the database file, setting it once from the writer is enough
+            cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+        cursor.close()
+
+    def insert(self, table):
+        return sqlite.insert(table)
+
+    def add_days(self, column, days: int) -> ColumnElement:
+        return func.date(column, f"{int(days):+d} days")
+
+    def date_trunc(self, unit: str, column) -> ColumnElement:
+        modifiers = {"day": [], "week": ["-6 days", "weekday 1"], "month": ["start of month"]}.get(unit)
+        if unit == "quarter":
+            months_in = (func.strftime("%m", column).cast(Integer) - 1) % 3
+            modifiers = ["start of month", (-months_in).concat(" months")]
+        return func.date(column, *modifiers, type_=Date)
+
+    def begin_snapshot(self) -> TextClause:
+        # pysqlite only opens a transaction before a write, each read would otherwise see its own snapshot
+        return text("BEGIN")
+
+
+class PostgreSQLAdapter(DialectAdapter):
+    name = "postgresql"
+    async_driver = "asyncpg"
+
+    def insert(self, table):
+        return postgresql.insert(table)
+
+    def engine_kwargs(self, read_only: bool = False) -> dict:
+        kwargs = super().engine_kwargs(read_only)
+        if read_only:
+            # Set at connection startup: a SET run from the connect event is rolled back with the
+            # transaction the asyncpg adapter opens around it
+            kwargs["connect_args"] = {"server_settings": {"default_transaction_read_only": "on"}}
+        return kwargs
+
+
+DIALECTS = {adapter.name: adapter for adapter in (SQLiteAdapter(), PostgreSQLAdapter())}
+
+
+def database_url() -> URL:
+    return make_url(settings.DATABASE_URL or f"sqlite:///{settings.SQLITE_FILE}")
+
+
+def dialect_of(connection) -> DialectAdapter:
+    # Shards are always SQLite, whatever the main database is
+    return DIALECTS[connection.dialect.name]
+
+
+def get_dialect(url: URL | None = None) -> DialectAdapter:
+    backend = (url or database_url()).get_backend_name()
+    if backend not in DIALECTS:
+        raise ValueError(f"Unsupported database: {backend}")
+    return DIALECTS[backend]
@@ -0,0 +1,140 @@
+import hashlib
+import time
+
+from sqlalchemy import Index, MetaData, Table, inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from ..utils.logging import app_logger
+from .rollups import rebuild_rollups
+from .search import drop_search, install_search, rebuild_search_index
+
+# Migrations are applied in order, once, and the last applied version is recorded in `schema_version`.
+# They must be idempotent: on a fresh database `create_all` already built the current schema.
+# Never edit a released migration, append a new one instead.
+
+
+def _create_index(conn: Connection, table_name: str, name: str, columns: list[str], unique: bool = False):
+    table = Table(table_name, MetaData(), autoload_with=conn)
+    Index(name, *[table.c[c] for c in columns], unique=unique).create(conn, checkfirst=True)
+
+
+def _add_column(conn: Connection, table_name: str, name: str, definition: str):
+    if name not in {column["name"] for column in inspect(conn).get_columns(table_name)}:
+        conn.execute(text(f'ALTER TABLE {table_name} ADD COLUMN "{name}" {definition}'))
+
+
+def _keep_latest_duplicate(conn: Connection, table_name: str, columns: list[str]):
+    # Unique indexes cannot be built over duplicated rows, keep the most recent one
+    group_by = ", ".join(f'"{c}"' for c in columns)
+    deleted = conn.execute(
+        text(
+            f"DELETE FROM {table_name} WHERE id NOT IN "
+            f"(SELECT MAX(id) FROM {table_name} GROUP BY {group_by})"
+        )
+    ).rowcount
+    if deleted:
+        app_logger.warning(
+            f"[migrations] Deleted {deleted} duplicated {table_name} rows, kept the latest per {group_by}"
+        )
+
+
+def _m001_hot_query_indexes(conn: Connection):
+    _create_index(conn, "bloc", "ix_bloc_user_cdate_id", ["user", "cdate", "id"])
+    _create_index(conn, "bloc", "ix_bloc_category_id", ["category_id"])
+    _create_index(conn, "bloccategory", "ix_bloccategory_user", ["user"])
+    _create_index(conn, "stash", "ix_stash_user", ["user"])
+    _create_index(conn, "pr", "ix_pr_user", ["user"])
+    _create_index(conn, "program", "ix_program_user", ["user"])
+    _create_index(conn, "programstep", "ix_programstep_user_program_id", ["user", "program_id"])
+    _create_index(conn, "user", "ix_user_api_token", ["api_token"])
+
+    _keep_latest_duplicate(conn, "prvalue", ["pr_id", "cdate"])
+    _create_index(conn, "prvalue", "ix_prvalue_pr_id_cdate", ["pr_id", "cdate"], unique=True)
+
+    _keep_latest_duplicate(conn, "healthwatchdata", ["user", "cdate"])
+    _create_index(conn, "healthwatchdata", "ix_healthwatchdata_user_cdate", ["user", "cdate"], unique=True)
+
+
+def _m002_hash_api_tokens(conn: Connection):
+    # Tokens were stored in clear, keep only their digest. Raw tokens are UUIDs (36 chars), digests are 64
+    rows = conn.execute(text('SELECT username, api_token FROM "user" WHERE api_token IS NOT NULL')).all()
+    for username, api_token in rows:
+        if len(api_token) == 64:
+            continue
+        conn.execute(
+            text('UPDATE "user" SET api_token = :digest WHERE username = :username'),
+            {"digest": hashlib.sha256(api_token.encode()).hexdigest(), "username": username},
+        )
+
+
+def _m003_programstepbloc_category_index(conn: Connection):
+    _create_index(conn, "programstepbloc", "ix_programstepbloc_category_id", ["category_id"])
+
+
+def _m004_search_index(conn: Connection):
+    install_search(conn)
+    rebuild_search_index(conn)
+
+
+def _m005_duration_rollups(conn: Connection):
+    rebuild_rollups(conn)
+
+
+def _m006_change_log_retention(conn: Connection):
+    _add_column(conn, "changelog", "ts", "FLOAT")
+    _add_column(conn, "dataversion", "sync_floor", "INTEGER NOT NULL DEFAULT 0")
+    # Existing rows get a whole retention window
+    conn.execute(text("UPDATE changelog SET ts = :now WHERE ts IS NULL"), {"now": time.time()})
+
+
+def _m007_job_heartbeat(conn: Connection):
+    _add_column(conn, "job", "owner", "VARCHAR")
+    _add_column(conn, "job", "heartbeat", "FLOAT")
+
+
+def _m008_job_params(conn: Connection):
+    _add_column(conn, "job", "params", "JSON")
+
+
+def _m009_search_index_owner(conn: Connection):
+    # The index gains an indexed `owner` column, FTS5 tables cannot be altered
+    drop_search(conn)
+    install_search(conn)
+    rebuild_search_index(conn)
+
+
+MIGRATIONS = [
+    (1, "Indexes for hot queries", _m001_hot_query_indexes),
+    (2, "Hash API tokens", _m002_hash_api_tokens),
+    (3, "Index ProgramStepBloc.category_id", _m003_programstepbloc_category_index),
+    (4, "Full-text search index", _m004_search_index),
+    (5, "Backfill duration rollups", _m005_duration_rollups),
+    (6, "Change log retention", _m006_change_log_retention),
+    (7, "Job heartbeat", _m007_job_heartbeat),
+    (8, "Job parameters", _m008_job_params),
+    (9, "Search index scoped per user", _m009_search_index_owner),
+]
+
+
+def get_schema_version(conn: Connection) -> int:
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+    return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+
+def _apply(conn: Connection, version: int, migrate):
+    migrate(conn)
+    conn.execute(text("INSERT INTO schema_version (version) VALUES (:version)"), {"version": version})
+
+
+async def run_migrations(engine: AsyncEngine):
+    async with engine.begin() as conn:
+        current = await conn.run_sync(get_schema_version)
+
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+
+        app_logger.info(f"[run_migrations] Applying migration {version}: {description}")
+        async with engine.begin() as conn:
+            await conn.run_sync(_apply, version, migrate)
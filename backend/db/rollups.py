@@ -0,0 +1,101 @@
+from collections.abc import Iterable
+from datetime import date, timedelta
+
+from sqlalchemy import and_, delete, event, except_, func, insert, inspect, literal, or_, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from ..models.models import Bloc, DurationRollup
+from .buckets import bucket_start
+from .dialect import dialect_of
+
+# Bloc durations pre-aggregated per user, category and day / ISO week, read by the statistics endpoints.
+# Rows of every day a write touches (and of its week) are recomputed from the blocs in the write's
+# transaction: by the flush listener below for ORM writes, by refresh_rollups for set based statements.
+# rebuild_rollups recomputes everything, for backfills and to check the incremental maintenance.
+
+COLUMNS = ["user", "category_id", "period", "start", "duration"]
+TRACKED = ("cdate", "category_id", "duration")
+
+
+def _rollup_rows(connection: Connection, period: str, *criteria):
+    start = Bloc.cdate if period == "day" else dialect_of(connection).date_trunc("week", Bloc.cdate)
+    return (
+        select(Bloc.user, Bloc.category_id, literal(period), start, func.sum(Bloc.duration))
+        .where(Bloc.duration.isnot(None), *criteria)
+        .group_by(Bloc.user, Bloc.category_id, start)
+    )
+
+
+def _refresh(connection: Connection, username: str, days: Iterable[date]):
+    days = sorted(days)
+    weeks = sorted({bucket_start(day, "week") for day in days})
+    connection.execute(
+        delete(DurationRollup).where(
+            DurationRollup.user == username,
+            or_(
+                and_(DurationRollup.period == "day", DurationRollup.start.in_(days)),
+                and_(DurationRollup.period == "week", DurationRollup.start.in_(weeks)),
+            ),
+        )
+    )
+    connection.execute(
+        insert(DurationRollup).from_select(
+            COLUMNS, _rollup_rows(connection, "day", Bloc.user == username, Bloc.cdate.in_(days))
+        )
+    )
+    # The cdate range keeps the week rows on ix_bloc_user_cdate_id
+    week_rows = _rollup_rows(
+        connection,
+        "week",
+        Bloc.user == username,
+        Bloc.cdate >= weeks[0],
+        Bloc.cdate < weeks[-1] + timedelta(days=7),
+        dialect_of(connection).date_trunc("week", Bloc.cdate).in_(weeks),
+    )
+    connection.execute(insert(DurationRollup).from_select(COLUMNS, week_rows))
+
+
+@event.listens_for(Session, "after_flush")
+def _refresh_touched_days(session: Session, flush_context):
+    # New, dirty and deleted collections and attribute histories still hold their pre-flush state here
+    touched = {}
+    for state in ("new", "dirty", "deleted"):
+        for obj in getattr(session, state):
+            if not isinstance(obj, Bloc):
+                continue
+
+            attrs = inspect(obj).attrs
+            if state == "dirty" and not any(attrs[key].history.has_changes() for key in TRACKED):
+                continue
+            # Both the old and the new day of a moved bloc
+            touched.setdefault(obj.user, set()).update(d for d in attrs.cdate.history.sum() if d)
+
+    connection = session.connection()
+    for username, days in touched.items():
+        if days:
+            _refresh(connection, username, days)
+
+
+async def refresh_rollups(session: AsyncSession, username: str, days: Iterable[date]):
+    # For bulk statements, which bypass the flush. `days` must hold the days of the blocs before and after
+    days = set(days)
+    if days:
+        await (await session.connection()).run_sync(_refresh, username, days)
+
+
+def rebuild_rollups(connection: Connection) -> int:
+    # Returns how many rows differed from a fresh computation, 0 when the incremental maintenance is right
+    mismatches = 0
+    for period in ("day", "week"):
+        stored = select(*[DurationRollup.__table__.c[c] for c in COLUMNS])
+        stored = stored.where(DurationRollup.period == period)
+        fresh = _rollup_rows(connection, period)
+        for compound in (except_(stored, fresh), except_(fresh, stored)):
+            mismatches += connection.execute(select(func.count()).select_from(compound.subquery())).scalar()
+
+    connection.execute(delete(DurationRollup))
+    for period in ("day", "week"):
+        connection.execute(insert(DurationRollup).from_select(COLUMNS, _rollup_rows(connection, period)))
+    return mismatches
@@ -0,0 +1,101 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+# Full-text search (SQLite FTS5 only). Searchable rows of every table are indexed in `search_index`,
+# kept in sync by triggers. Index rowids are `id * 8 + code` so triggers update a row by rowid, not by scan.
+# Searches are scoped to a user within the MATCH: `owner` is an indexed column holding one token per user,
+# the hex of the username (usernames themselves would be split into several tokens by the tokenizer).
+# {code: (table, entity, body)}, `{t}` is the row prefix: "new." / "old." in triggers, the table in rebuilds
+SOURCES = {
+    1: (
+        "bloc",
+        "bloc",
+        "{t}content || ' ' || "
+        "coalesce((SELECT comment FROM blocresult WHERE blocresult.id = {t}result_id), '')",
+    ),
+    2: ("stash", "stash", "{t}content"),
+    3: ("program", "program", "{t}name || ' ' || coalesce({t}description, '')"),
+    4: ("programstepbloc", "program_bloc", "{t}content"),
+}
+
+
+COLUMNS = "rowid, body, owner, user, entity, entity_id"
+
+
+def owner_token(username: str) -> str:
+    # Same as the `owner` column: 'u' || hex(user)
+    return "u" + username.encode().hex().upper()
+
+
+def _owner(prefix: str) -> str:
+    return f"'u' || hex({prefix}user)"
+
+
+def _index_row(code: int, prefix: str) -> str:
+    table, entity, body = SOURCES[code]
+    return (
+        f"INSERT INTO search_index ({COLUMNS}) VALUES ({prefix}id * 8 + {code}, {body.format(t=prefix)}, "
+        f"{_owner(prefix)}, {prefix}user, '{entity}', {prefix}id);"
+    )
+
+
+def _unindex_row(code: int, prefix: str) -> str:
+    return f"DELETE FROM search_index WHERE rowid = {prefix}id * 8 + {code};"
+
+
+def install_search(conn: Connection):
+    if conn.dialect.name != "sqlite":
+        return
+
+    conn.execute(
+        text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+            "body, owner, user UNINDEXED, entity UNINDEXED, entity_id UNINDEXED, "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+    )
+    for code, (table, _, _) in SOURCES.items():
+        index, unindex = _index_row(code, "new."), _unindex_row(code, "old.")
+        triggers = {
+            "ai": f"AFTER INSERT ON {table} BEGIN {index} END",
+            "au": f"AFTER UPDATE ON {table} BEGIN {unindex} {index} END",
+            "ad": f"AFTER DELETE ON {table} BEGIN {unindex} END",
+        }
+        for suffix, trigger in triggers.items():
+            conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS search_{table}_{suffix} {trigger}"))
+
+    # A result comment is part of its bloc's document
+    conn.execute(
+        text(
+            "CREATE TRIGGER IF NOT EXISTS search_blocresult_au AFTER UPDATE OF comment ON blocresult BEGIN "
+            "DELETE FROM search_index WHERE rowid IN (SELECT id * 8 + 1 FROM bloc WHERE result_id = new.id); "
+            f"INSERT INTO search_index ({COLUMNS}) "
+            f"SELECT id * 8 + 1, content || ' ' || coalesce(new.comment, ''), {_owner('')}, user, 'bloc', id "
+            "FROM bloc WHERE result_id = new.id; END"
+        )
+    )
+
+
+def drop_search(conn: Connection):
+    if conn.dialect.name != "sqlite":
+        return
+
+    for table in [table for table, _, _ in SOURCES.values()] + ["blocresult"]:
+        for suffix in ("ai", "au", "ad"):
+            conn.execute(text(f"DROP TRIGGER IF EXISTS search_{table}_{suffix}"))
+    conn.execute(text("DROP TABLE IF EXISTS search_index"))
+
+
+def rebuild_search_index(conn: Connection):
+    if conn.dialect.name != "sqlite":
+        return
+
+    conn.execute(text("DELETE FROM search_index"))
+    for code, (table, entity, body) in SOURCES.items():
+        conn.execute(
+            text(
+                f"INSERT INTO search_index ({COLUMNS}) SELECT id * 8 + {code}, {body.format(t=f'{table}.')}, "
+                f"{_owner(f'{table}.')}, user, '{entity}', id FROM {table}"
+            )
+        )
+    conn.execute(text("INSERT INTO search_index (search_index) VALUES ('optimize')"))
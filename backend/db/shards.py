@@ -0,0 +1,103 @@
+import asyncio
+import hashlib
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import delete
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from ..config import settings
+from ..models.models import User
+from .core import build_engine, get_engine, get_read_engine, init_schema
+
+# In sharded mode, users live in the main (catalog) database while their data lives in SQLite shards.
+# A user's import only locks its own shard instead of the whole database.
+
+_engines: dict[tuple[str, bool], AsyncEngine] = {}  # {(shard, read_only): engine}
+_registered: set[tuple[str, str]] = set()  # {(shard, username)}
+_lock = asyncio.Lock()
+
+
+def shard_name(username: str) -> str:
+    digest = hashlib.sha256(username.encode()).hexdigest()
+    if settings.SHARD_MODE == "bucket":
+        return f"bucket_{int(digest, 16) % settings.SHARD_BUCKETS:03d}"
+    return f"user_{digest[:32]}"
+
+
+def shard_path(name: str) -> Path:
+    return Path(settings.SHARDS_FOLDER) / f"{name}.sqlite"
+
+
+async def _init_shard(name: str, username: str):
+    if (name, False) not in _engines:
+        path = shard_path(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        url = make_url(f"sqlite:///{path}")
+
+        engine = build_engine(url)
+        await init_schema(engine)
+        _engines[(name, False)] = engine
+        _engines[(name, True)] = build_engine(url, read_only=True)
+
+    # Data rows reference user.username, the shard keeps a stub row for every user it stores
+    async with _engines[(name, False)].begin() as conn:
+        await conn.execute(
+            insert(User)
+            .values(username=username, password="", is_active=True, is_su=False, mfa_enabled=False)
+            .on_conflict_do_nothing()
+        )
+    _registered.add((name, username))
+
+
+def user_data_engines() -> list[AsyncEngine]:
+    # Engines holding user data, for maintenance. Shards are only opened once one of their users is active.
+    if not settings.SHARD_MODE:
+        return [get_engine()]
+    return [engine for (_, read_only), engine in _engines.items() if not read_only]
+
+
+async def get_user_engine(username: str, read_only: bool = False) -> AsyncEngine:
+    if not settings.SHARD_MODE:
+        return get_read_engine() if read_only else get_engine()
+
+    name = shard_name(username)
+    if (name, username) not in _registered:
+        async with _lock:
+            if (name, username) not in _registered:
+                await _init_shard(name, username)
+    return _engines[(name, read_only)]
+
+
+@asynccontextmanager
+async def user_session(username: str, read_only: bool = False):
+    engine = await get_user_engine(username, read_only)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        yield session
+
+
+async def drop_user_data(username: str):
+    if not settings.SHARD_MODE:
+        return  # Cascaded from the user row
+
+    name = shard_name(username)
+    if settings.SHARD_MODE == "bucket":
+        async with user_session(username) as session:
+            await session.exec(delete(User).where(User.username == username))
+            await session.commit()
+        _registered.discard((name, username))
+        return
+
+    async with _lock:
+        for read_only in (False, True):
+            engine = _engines.pop((name, read_only), None)
+            if engine:
+                await engine.dispose()
+        _registered.discard((name, username))
+
+        path = shard_path(name)
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{path}{suffix}").unlink(missing_ok=True)
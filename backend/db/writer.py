@@ -0,0 +1,128 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from ..config import settings
+from ..utils.logging import app_logger
+from .shards import get_user_engine, user_session
+
+# Group commit (WRITE_BATCHING): small writes are queued and a single writer task applies them in shared
+# transactions of at most WRITE_BATCH_SIZE writes, waiting at most WRITE_BATCH_DELAY ms for a batch to fill.
+# One commit (one fsync) then covers the whole batch.
+#
+# Ordering: writes are applied in submission order, within and across batches.
+# Durability: a caller only gets its result once the transaction holding its write is committed, with the
+# same guarantees as a direct commit (see SQLITE_SYNCHRONOUS). Nothing is acknowledged before that, a crash
+# loses only writes whose callers have not been answered yet.
+# Failures: if a write raises, the batch is rolled back and every write of the batch is replayed in its own
+# transaction, so only the faulty write fails. Writes must therefore only touch the session they are given
+# and build their objects inside the callable, as they can run twice.
+
+Write = Callable[[AsyncSession], Awaitable[Any]]
+
+
+class WriteQueue:
+    def __init__(self):
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if not self._task:
+            return
+
+        await self._queue.put(None)  # Pending writes before the sentinel are still committed
+        await self._task
+        self._task = None
+
+    async def submit(self, username: str, write: Write) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((username, write, future))
+        return await future
+
+    async def _next_batch(self) -> tuple[list, bool]:
+        item = await self._queue.get()
+        if item is None:
+            return [], True
+
+        batch = [item]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.WRITE_BATCH_DELAY / 1000
+        while len(batch) < settings.WRITE_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = await self._next_batch()
+
+            # Writes of a batch can target different shards, each one gets its own transaction
+            groups = {}
+            for username, write, future in batch:
+                try:
+                    engine = await get_user_engine(username)
+                except Exception as exc:
+                    future.set_exception(exc)
+                    continue
+                groups.setdefault(engine, []).append((write, future))
+
+            for engine, writes in groups.items():
+                try:
+                    await self._commit(engine, writes)
+                except Exception as exc:  # The writer task must survive anything
+                    app_logger.error(f"[WriteQueue] Exception: {exc}")
+                    for _, future in writes:
+                        if not future.done():
+                            future.set_exception(exc)
+
+    async def _commit(self, engine, writes: list):
+        results = []
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            try:
+                for write, _ in writes:
+                    results.append(await write(session))
+                await session.commit()
+            except Exception as exc:
+                await session.rollback()
+                if len(writes) == 1:
+                    if not writes[0][1].done():
+                        writes[0][1].set_exception(exc)
+                    return
+
+                for write, future in writes:
+                    await self._commit(engine, [(write, future)])
+                return
+
+        for (_, future), result in zip(writes, results):
+            if not future.done():  # The caller may have been cancelled
+                future.set_result(result)
+
+
+write_queue = WriteQueue()
+
+
+async def submit_write(username: str, write: Write) -> Any:
+    if settings.WRITE_BATCHING:
+        return await write_queue.submit(username, write)
+
+    async with user_session(username) as session:
+        result = await write(session)
+        await session.commit()
+        return result
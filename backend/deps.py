@@ -1,36 +1,105 @@
+import hashlib
 from typing import Annotated
 
 import jwt
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Request, Response
 from fastapi.security import OAuth2PasswordBearer
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from .config import settings
-from .db.core import get_engine
+from .db.changes import get_data_version
+from .db.core import get_engine, get_read_engine
+from .db.shards import user_session
 from .models.models import User
+from .utils.cache import TTLCache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+# {username: is_active}, spares a catalog query per authenticated request.
+# Writes to a user must call invalidate_user, other workers see the change after AUTH_CACHE_TTL at most.
+auth_cache = TTLCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL)
+# {token digest: username}, a verified token is not decoded again until its expiry
+jwt_cache = TTLCache(settings.JWT_CACHE_SIZE, settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60)
 
-def get_session():
+
+def invalidate_user(username: str):
+    auth_cache.pop(username)
+
+
+async def get_catalog_session():
     engine = get_engine()
-    with Session(engine) as session:
+    # Objects stay usable after commit, reloading them would need an awaited query
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        yield session
+
+
+async def get_catalog_read_session():
+    engine = get_read_engine()
+    async with AsyncSession(engine, expire_on_commit=False) as session:
         yield session
 
 
-SessionDep = Annotated[Session, Depends(get_session)]
+# Catalog sessions hold the users, the other sessions hold the current user's data (its shard if sharded)
+CatalogSessionDep = Annotated[AsyncSession, Depends(get_catalog_session)]
+CatalogReadSessionDep = Annotated[AsyncSession, Depends(get_catalog_read_session)]
+
 
+async def get_current_username(
+    token: Annotated[str, Depends(oauth2_scheme)], session: CatalogReadSessionDep
+) -> str:
+    digest = hashlib.sha256(token.encode()).digest()
+    username = jwt_cache.get(digest)
+    if username is None:
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            username = payload.get("sub")
+            if not username:
+                raise HTTPException(status_code=401, detail="Invalid Token")
+        except jwt.InvalidTokenError:
+            raise HTTPException(status_code=401, detail="Invalid Token")
+        jwt_cache.set(digest, username, expires_at=payload.get("exp"))
 
-def get_current_username(token: Annotated[str, Depends(oauth2_scheme)], session: SessionDep) -> str:
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        username = payload.get("sub")
-        if not username:
+    is_active = auth_cache.get(username)
+    if is_active is None:
+        user = await session.get(User, username)
+        if not user:
             raise HTTPException(status_code=401, detail="Invalid Token")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid Token")
+        is_active = user.is_active
+        auth_cache.set(username, is_active)
+
+    if not is_active:
+        raise HTTPException(status_code=401, detail="User is disabled")
+    return username
+
+
+async def get_session(current_user: Annotated[str, Depends(get_current_username)]):
+    async with user_session(current_user) as session:
+        yield session
+
+
+async def get_read_session(current_user: Annotated[str, Depends(get_current_username)]):
+    async with user_session(current_user, read_only=True) as session:
+        yield session
+
+
+SessionDep = Annotated[AsyncSession, Depends(get_session)]
+ReadSessionDep = Annotated[AsyncSession, Depends(get_read_session)]
+
+
+async def check_etag(
+    request: Request,
+    response: Response,
+    session: ReadSessionDep,
+    current_user: Annotated[str, Depends(get_current_username)],
+):
+    # Weak ETag from the user's data version and the request, unchanged data is answered with a 304
+    # before the route runs its query
+    version = await get_data_version(session, current_user)
+    key = f"{current_user}:{request.url.path}?{sorted(request.query_params.multi_items())}"
+    etag = f'W/"{version}-{hashlib.sha256(key.encode()).hexdigest()[:16]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
 
-    user = session.get(User, username)
-    if not user:
-        raise HTTPException(status_code=401, detail="Invalid Token")
-    return user.username
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")):
+        raise HTTPException(status_code=304, headers=headers)
+    response.headers.update(headers)
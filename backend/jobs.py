@@ -0,0 +1,249 @@
+import asyncio
+import shutil
+import time
+from collections.abc import Awaitable, Callable
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import NoReturn
+from uuid import uuid4
+
+from fastapi import HTTPException
+from sqlmodel import or_, select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .config import settings
+from .db.core import get_engine
+from .models.models import Job
+from .utils.logging import app_logger
+
+# Long imports run as background jobs: the endpoint stores the upload in JOBS_FOLDER (or the job's params,
+# e.g. a link to download) and answers 202 with the job id, GET /api/jobs/{id} then reports the job's
+# progress, counts, result or error.
+#
+# Jobs are rows of the main database, run by an in-process runner, at most JOBS_MAX_CONCURRENCY at a time.
+# A job is claimed (pending -> running) with a conditional update, so it runs once whatever the number of
+# workers. Any worker can cancel a job: its runner notices at the job's next progress report.
+# A claimed job records its runner (owner), which refreshes the heartbeat of its running jobs every
+# JOBS_HEARTBEAT_INTERVAL. Restarts: pending jobs are resumed. Jobs of the restarted runner, or of a runner
+# silent for JOBS_HEARTBEAT_TIMEOUT, are failed: their import may be partially applied and is not
+# necessarily safe to replay. Jobs running on other live workers are left alone.
+
+
+class JobError(Exception):
+    pass
+
+
+class JobContext:
+    def __init__(self, job: Job):
+        self.id = job.id
+        self.username = job.user
+        self.input = job.input
+        self.params = job.params or {}
+
+    async def progress(self, progress: float, counts: dict | None = None):
+        async with AsyncSession(get_engine()) as session:
+            result = await session.exec(
+                update(Job)
+                .where(Job.id == self.id, Job.status == "running")
+                .values(progress=min(progress, 1), counts=counts, heartbeat=time.time())
+            )
+            await session.commit()
+
+        if not result.rowcount:
+            raise asyncio.CancelledError()  # Cancelled from another worker
+
+    def fail(self, error: str) -> NoReturn:
+        # Ends the job, failed with this error
+        raise JobError(error)
+
+
+# Handlers return the job's result, JobContext.fail fails the job. HTTPException raised by the helpers jobs
+# share with the routes fails it too, with its detail
+JobHandler = Callable[[JobContext], Awaitable[dict | None]]
+HANDLERS: dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str):
+    def register(handler: JobHandler) -> JobHandler:
+        HANDLERS[kind] = handler
+        return handler
+
+    return register
+
+
+def _remove_input(path: str | None):
+    if path:
+        Path(path).unlink(missing_ok=True)
+
+
+class JobRunner:
+    def __init__(self):
+        self.owner = uuid4().hex
+        self._tasks: dict[int, asyncio.Task] = {}
+        self._semaphore: asyncio.Semaphore | None = None
+        self._heartbeat: asyncio.Task | None = None
+        self._stopping = False
+
+    async def start(self):
+        self._semaphore = asyncio.Semaphore(settings.JOBS_MAX_CONCURRENCY)
+        self._stopping = False
+        Path(settings.JOBS_FOLDER).mkdir(parents=True, exist_ok=True)
+
+        await self._fail_interrupted(own=True)
+        async with AsyncSession(get_engine()) as session:
+            pending = await session.exec(select(Job.id).where(Job.status == "pending").order_by(Job.id))
+            pending = pending.all()
+
+        for job_id in pending:
+            self._schedule(job_id)
+        self._heartbeat = asyncio.create_task(self._beat_forever())
+
+    async def stop(self):
+        # Running jobs are interrupted, pending ones stay pending and are resumed on the next start
+        self._stopping = True
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            try:
+                await self._heartbeat
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat = None
+
+    async def _fail_interrupted(self, own: bool = False):
+        # Running jobs whose runner is gone: silent for too long, or this runner before its restart (own)
+        interrupted = or_(
+            Job.heartbeat.is_(None), Job.heartbeat < time.time() - settings.JOBS_HEARTBEAT_TIMEOUT
+        )
+        if own:
+            interrupted = or_(interrupted, Job.owner == self.owner)
+
+        async with AsyncSession(get_engine()) as session:
+            query = select(Job.id, Job.input).where(Job.status == "running", interrupted)
+            jobs = (await session.exec(query)).all()
+            if not jobs:
+                return
+            await session.exec(
+                update(Job)
+                .where(Job.id.in_([job.id for job in jobs]), Job.status == "running", interrupted)
+                .values(status="failed", error="Interrupted by a restart", finished_at=datetime.now(UTC))
+            )
+            await session.commit()
+
+        for job in jobs:
+            _remove_input(job.input)
+
+    async def _beat_forever(self):
+        while True:
+            await asyncio.sleep(settings.JOBS_HEARTBEAT_INTERVAL)
+            try:
+                async with AsyncSession(get_engine()) as session:
+                    await session.exec(
+                        update(Job)
+                        .where(Job.owner == self.owner, Job.status == "running")
+                        .values(heartbeat=time.time())
+                    )
+                    await session.commit()
+                await self._fail_interrupted()
+            except Exception as exc:
+                app_logger.error(f"[job_runner] Heartbeat exception: {exc}")
+
+    async def submit(
+        self, username: str, kind: str, input_path: str | None = None, params: dict | None = None
+    ) -> Job:
+        if kind not in HANDLERS:
+            raise ValueError(f"Unknown job kind {kind}")
+
+        if input_path:
+            # Temporary files may not survive a restart, the job's input must
+            stored = Path(settings.JOBS_FOLDER) / uuid4().hex
+            shutil.move(input_path, stored)
+            input_path = str(stored)
+
+        job = Job(user=username, kind=kind, input=input_path, params=params)
+        async with AsyncSession(get_engine(), expire_on_commit=False) as session:
+            session.add(job)
+            await session.commit()
+
+        self._schedule(job.id)
+        return job
+
+    async def cancel(self, job: Job) -> Job:
+        async with AsyncSession(get_engine(), expire_on_commit=False) as session:
+            was_pending = await session.exec(
+                update(Job)
+                .where(Job.id == job.id, Job.status == "pending")
+                .values(status="cancelled", finished_at=datetime.now(UTC))
+            )
+            await session.exec(
+                update(Job)
+                .where(Job.id == job.id, Job.status == "running")
+                .values(status="cancelled", finished_at=datetime.now(UTC))
+            )
+            await session.commit()
+            cancelled = await session.get(Job, job.id)
+
+        # A running job's input is removed by its runner, wherever it runs
+        if was_pending.rowcount:
+            _remove_input(job.input)
+
+        task = self._tasks.get(job.id)
+        if task:
+            task.cancel()
+        return cancelled
+
+    def _schedule(self, job_id: int):
+        self._tasks[job_id] = asyncio.create_task(self._run(job_id))
+
+    async def _claim(self, job_id: int) -> Job | None:
+        async with AsyncSession(get_engine(), expire_on_commit=False) as session:
+            claimed = await session.exec(
+                update(Job)
+                .where(Job.id == job_id, Job.status == "pending")
+                .values(status="running", owner=self.owner, heartbeat=time.time())
+            )
+            await session.commit()
+            if not claimed.rowcount:
+                return None  # Cancelled, or claimed by another worker
+            return await session.get(Job, job_id)
+
+    async def _finish(self, job: Job, status: str, **values):
+        async with AsyncSession(get_engine()) as session:
+            query = update(Job).where(Job.id == job.id)
+            if status != "done":
+                # A cancellation wins over a failure, not over a completed import
+                query = query.where(Job.status == "running")
+            await session.exec(query.values(status=status, finished_at=datetime.now(UTC), **values))
+            await session.commit()
+        _remove_input(job.input)
+
+    async def _run(self, job_id: int):
+        job = None
+        try:
+            async with self._semaphore:
+                job = await self._claim(job_id)
+                if not job:
+                    return
+
+                result = await HANDLERS[job.kind](JobContext(job))
+                await self._finish(job, "done", progress=1, result=result)
+        except asyncio.CancelledError:
+            if job:
+                status = "failed" if self._stopping else "cancelled"
+                error = "Interrupted by a shutdown" if self._stopping else None
+                await asyncio.shield(self._finish(job, status, error=error))
+        except JobError as exc:
+            await self._finish(job, "failed", error=str(exc))
+        except HTTPException as exc:
+            await self._finish(job, "failed", error=str(exc.detail))
+        except Exception as exc:
+            app_logger.error(f"[job_runner][{job.user if job else job_id}] Job {job_id} failed: {exc}")
+            if job:
+                await self._finish(job, "failed", error="An error occurred")
+        finally:
+            self._tasks.pop(job_id, None)
+
+
+job_runner = JobRunner()
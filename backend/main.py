@@ -8,10 +8,16 @@ from starlette.middleware.gzip import GZipMiddleware
 
 from . import __version__
 from .config import settings
+from .db.compaction import start_compactor, stop_compactor
 from .db.core import init_db
-from .routers import admin, auth, blocs, categories, pr, programs
+from .db.writer import write_queue
+from .jobs import job_runner
+from .oidc import close_http_client
+from .pending_mfa import start_sweeper, stop_sweeper
+from .routers import admin, auth, blocs, categories, jobs, pr, programs
 from .routers import settings as settings_r
-from .routers import stash, statistics
+from .routers import search, stash, statistics, sync
+from .security import shutdown_hash_pool
 from .utils.logging import request_logger
 from .utils.date import dt_utc_str
 
@@ -28,6 +34,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "X-Prev-Cursor"],
 )
 
 app.add_middleware(GZipMiddleware, minimum_size=1000)
@@ -36,11 +43,14 @@ app.include_router(admin.router)
 app.include_router(auth.router)
 app.include_router(blocs.router)
 app.include_router(categories.router)
+app.include_router(jobs.router)
 app.include_router(pr.router)
 app.include_router(programs.router)
+app.include_router(search.router)
 app.include_router(settings_r.router)
 app.include_router(stash.router)
 app.include_router(statistics.router)
+app.include_router(sync.router)
 
 
 @app.get("/api/info")
@@ -75,8 +85,23 @@ async def http_logger__spa_handler(request: Request, call_next):
 
 
 @app.on_event("startup")
-def startup_event():
-    init_db()
+async def startup_event():
+    await init_db()
+    start_sweeper()
+    start_compactor()
+    if settings.WRITE_BATCHING:
+        write_queue.start()
+    await job_runner.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await job_runner.stop()
+    await write_queue.stop()
+    await stop_sweeper()
+    await stop_compactor()
+    await close_http_client()
+    shutdown_hash_pool()
 
 
 app.mount("/api/assets", StaticFiles(directory=settings.ASSETS_FOLDER), name="static")
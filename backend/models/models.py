@@ -2,12 +2,12 @@ import re
 import secrets
 from datetime import UTC, date, datetime
 from enum import Enum
-from typing import Annotated
+from typing import Annotated, Literal
 
 from pydantic import BaseModel, StringConstraints
 from pydantic_settings import BaseSettings
 from sqlmodel import Field, SQLModel, Relationship
-from sqlalchemy import MetaData
+from sqlalchemy import JSON, Index, MetaData
 
 
 convention = {
@@ -106,7 +106,7 @@ class User(UserBase, table=True):
     is_active: bool = True
     is_su: bool = False
     last_connect: datetime | None = Field(default_factory=lambda: datetime.now(UTC))
-    api_token: str | None = None
+    api_token: str | None = Field(default=None, index=True)  # sha256 hex digest, see hash_api_token
     mfa_enabled: bool = False
     mfa_secret: str | None = None
 
@@ -131,6 +131,88 @@ class UserRead(UserBase):
         )
 
 
+class PendingMFA(SQLModel, table=True):
+    username: str = Field(primary_key=True)
+    pending_code: str
+    exp: float = Field(index=True)  # UTC timestamp
+
+
+class RateLimitHit(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    key: str = Field(index=True)
+    ts: float = Field(index=True)  # UTC timestamp
+
+
+class Job(SQLModel, table=True):
+    # Background job, see jobs.py
+    id: int | None = Field(default=None, primary_key=True)
+    user: str = Field(foreign_key="user.username", ondelete="CASCADE", index=True)
+    kind: str  # A registered handler, e.g. "whoop_archive"
+    status: str = Field(default="pending", index=True)  # pending, running, done, failed or cancelled
+    input: str | None = None  # Uploaded file, removed once the job is over
+    params: dict | None = Field(default=None, sa_type=JSON)  # Handler arguments, e.g. a link to download
+    progress: float = 0  # 0 to 1
+    counts: dict | None = Field(default=None, sa_type=JSON)
+    result: dict | None = Field(default=None, sa_type=JSON)
+    error: str | None = None
+    owner: str | None = None  # Runner of the claimed job
+    heartbeat: float | None = None  # time.time() of the owner's last sign of life
+    created_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+    finished_at: datetime | None = None
+
+
+class JobRead(SQLModel):
+    id: int
+    kind: str
+    status: str
+    progress: float
+    counts: dict | None
+    result: dict | None
+    error: str | None
+    created_at: datetime
+    finished_at: datetime | None
+
+    @classmethod
+    def serialize(cls, obj: Job) -> "JobRead":
+        return cls(
+            id=obj.id,
+            kind=obj.kind,
+            status=obj.status,
+            progress=obj.progress,
+            counts=obj.counts,
+            result=obj.result,
+            error=obj.error,
+            created_at=obj.created_at,
+            finished_at=obj.finished_at,
+        )
+
+
+class DataVersion(SQLModel, table=True):
+    user: str = Field(primary_key=True, foreign_key="user.username", ondelete="CASCADE")
+    version: int = 0
+    sync_floor: int = 0  # Change log rows up to this sequence were compacted
+
+
+class ChangeLog(SQLModel, table=True):
+    __table_args__ = (Index("ix_changelog_user_id", "user", "id"),)
+
+    id: int | None = Field(default=None, primary_key=True)  # Sync sequence
+    user: str = Field(foreign_key="user.username", ondelete="CASCADE")
+    entity: str  # "blocs", "pr", "programs" or "stash"
+    entity_id: int
+    op: str  # "insert", "update" or "delete"
+    ts: float | None = None
+
+
+class DurationRollup(SQLModel, table=True):
+    # Sum of bloc durations per user, category and day or week, kept up to date by db/rollups.py
+    user: str = Field(primary_key=True, foreign_key="user.username", ondelete="CASCADE")
+    period: str = Field(primary_key=True)  # "day" or "week" (ISO week, starting on Monday)
+    start: date = Field(primary_key=True)
+    category_id: int = Field(primary_key=True, foreign_key="bloccategory.id", ondelete="CASCADE")
+    duration: int
+
+
 class StashBase(SQLModel):
     content: str
 
@@ -138,7 +220,7 @@ class StashBase(SQLModel):
 class Stash(StashBase, table=True):
     id: int | None = Field(default=None, primary_key=True)
     cdate: date = Field(default_factory=lambda: datetime.now(UTC).date())
-    user: str = Field(foreign_key="user.username", ondelete="CASCADE")
+    user: str = Field(foreign_key="user.username", ondelete="CASCADE", index=True)
 
 
 class StashRead(StashBase):
@@ -163,7 +245,7 @@ class BlocCategoryBase(SQLModel):
 
 class BlocCategory(BlocCategoryBase, table=True):
     id: int | None = Field(default=None, primary_key=True)
-    user: str = Field(foreign_key="user.username", ondelete="CASCADE")
+    user: str = Field(foreign_key="user.username", ondelete="CASCADE", index=True)
     blocs: list["Bloc"] = Relationship(back_populates="category")
     programblocs: list["ProgramStepBloc"] = Relationship(back_populates="category")
 
@@ -219,13 +301,15 @@ class BlocBase(SQLModel):
 
 
 class Bloc(BlocBase, table=True):
+    __table_args__ = (Index("ix_bloc_user_cdate_id", "user", "cdate", "id"),)
+
     id: int | None = Field(default=None, primary_key=True)
     cdate: date = Field(default_factory=lambda: datetime.now(UTC).date())
     user: str = Field(foreign_key="user.username", ondelete="CASCADE")
     result_id: int | None = Field(default=None, foreign_key="blocresult.id")
     result: BlocResult | None = Relationship(back_populates="bloc")
 
-    category_id: int = Field(foreign_key="bloccategory.id", ondelete="CASCADE")
+    category_id: int = Field(foreign_key="bloccategory.id", ondelete="CASCADE", index=True)
     category: BlocCategory | None = Relationship(back_populates="blocs")
 
 
@@ -243,6 +327,14 @@ class BlocUpdate(BlocBase):
     cdate: str | date = Field(default_factory=lambda: datetime.now(UTC).date())
 
 
+class BlocBatchOperation(BaseModel):
+    op: Literal["update", "delete", "shift", "copy"]
+    ids: list[int]
+    data: BlocUpdate | None = None  # update
+    days: int | None = None  # shift, copy
+    to: str | date | None = None  # shift, copy: earliest bloc lands on `to`, the others keep their spacing
+
+
 class BlocRead(BlocBase):
     id: int | None
     cdate: date
@@ -269,7 +361,7 @@ class PRBase(SQLModel):
 class PR(PRBase, table=True):
     id: int | None = Field(default=None, primary_key=True)
     values: list["PRValue"] = Relationship(back_populates="pr", cascade_delete=True)
-    user: str = Field(foreign_key="user.username", ondelete="CASCADE")
+    user: str = Field(foreign_key="user.username", ondelete="CASCADE", index=True)
 
 
 class PRCreate(PRBase):
@@ -321,6 +413,8 @@ class PRValueCreateOrUpdate(PRValueBase):
 
 
 class PRValue(PRValueBase, table=True):
+    __table_args__ = (Index("ix_prvalue_pr_id_cdate", "pr_id", "cdate", unique=True),)
+
     id: int | None = Field(default=None, primary_key=True)
     cdate: date = Field(default_factory=lambda: datetime.now(UTC).date())
 
@@ -349,7 +443,7 @@ class ProgramBase(SQLModel):
 class Program(ProgramBase, table=True):
     id: int | None = Field(default=None, primary_key=True)
     cdate: date = Field(default_factory=lambda: datetime.now(UTC).date())
-    user: str = Field(foreign_key="user.username", ondelete="CASCADE")
+    user: str = Field(foreign_key="user.username", ondelete="CASCADE", index=True)
     image_id: int | None = Field(default=None, foreign_key="image.id", ondelete="CASCADE")
     image: Image | None = Relationship(back_populates="programs")
     steps: list["ProgramStep"] = Relationship(back_populates="program", cascade_delete=True)
@@ -409,6 +503,8 @@ class ProgramStepBase(SQLModel):
 
 
 class ProgramStep(ProgramStepBase, table=True):
+    __table_args__ = (Index("ix_programstep_user_program_id", "user", "program_id"),)
+
     id: int | None = Field(default=None, primary_key=True)
     cdate: date = Field(default_factory=lambda: datetime.now(UTC).date())
     user: str = Field(foreign_key="user.username", ondelete="CASCADE")
@@ -463,7 +559,7 @@ class ProgramStepBloc(ProgramStepBlocBase, table=True):
     next_in: int
     user: str = Field(foreign_key="user.username", ondelete="CASCADE")
 
-    category_id: int = Field(foreign_key="bloccategory.id", ondelete="CASCADE")
+    category_id: int = Field(foreign_key="bloccategory.id", ondelete="CASCADE", index=True)
     category: BlocCategory | None = Relationship(back_populates="programblocs")
 
     program_step_id: int | None = Field(default=None, foreign_key="programstep.id", ondelete="CASCADE")
@@ -500,6 +596,8 @@ class ProgramStepBlocRead(ProgramStepBlocBase):
 
 
 class HealthWatchData(SQLModel, table=True):
+    __table_args__ = (Index("ix_healthwatchdata_user_cdate", "user", "cdate", unique=True),)
+
     id: int | None = Field(default=None, primary_key=True)
     cdate: date = Field(index=True)
     user: str = Field(foreign_key="user.username", ondelete="CASCADE")
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import time
+
+import httpx
+import jwt
+from fastapi import HTTPException
+
+from .config import settings
+from .utils.logging import app_logger
+
+# The provider's discovery document and signing keys are cached for OIDC_CACHE_TTL, keys are refetched
+# early when a token is signed with an unknown `kid` (key rotation), at most once per OIDC_JWKS_MIN_REFRESH.
+
+_client: httpx.AsyncClient | None = None
+_lock = asyncio.Lock()
+_config: dict | None = None
+_config_exp = 0.0
+_keys: dict = {}  # {kid: public key}
+_keys_exp = 0.0
+_keys_fetched = 0.0
+
+
+def get_http_client() -> httpx.AsyncClient:
+    # One pooled client for the app's lifetime, connections to the provider are reused
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(timeout=settings.OIDC_HTTP_TIMEOUT)
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client:
+        await _client.aclose()
+        _client = None
+
+
+async def get_oidc_config() -> dict:
+    global _config, _config_exp
+    if _config and _config_exp > time.time():
+        return _config
+
+    async with _lock:
+        if _config and _config_exp > time.time():
+            return _config
+
+        discovery_url = (
+            f"http://{settings.OIDC_HOST}/realms/{settings.OIDC_REALM}/.well-known/openid-configuration"
+        )
+        discovery_resp = await get_http_client().get(discovery_url)
+        if discovery_resp.status_code != 200:
+            raise HTTPException(status_code=500, detail="Failed to load OIDC configuration")
+
+        _config = discovery_resp.json()
+        _config_exp = time.time() + settings.OIDC_CACHE_TTL
+        return _config
+
+
+async def _fetch_keys(jwks_uri: str):
+    global _keys, _keys_exp, _keys_fetched
+    jwks_resp = await get_http_client().get(jwks_uri)
+    if jwks_resp.status_code != 200:
+        raise HTTPException(status_code=400, detail="Bad request")
+
+    keys = {}
+    for jwk in jwks_resp.json().get("keys", []):
+        kid = jwk.get("kid")
+        if not kid:
+            continue
+        keys[kid] = jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(jwk))
+
+    _keys = keys
+    _keys_fetched = time.time()
+    _keys_exp = _keys_fetched + settings.OIDC_CACHE_TTL
+
+
+async def get_signing_key(kid: str):
+    if kid in _keys and _keys_exp > time.time():
+        return _keys[kid]
+
+    config = await get_oidc_config()
+    jwks_uri = config.get("jwks_uri")
+    if not jwks_uri:
+        raise HTTPException(status_code=400, detail="Bad request")
+
+    async with _lock:
+        expired = _keys_exp <= time.time()
+        unknown = kid not in _keys and _keys_fetched + settings.OIDC_JWKS_MIN_REFRESH <= time.time()
+        if expired or unknown:
+            app_logger.info(f"[get_signing_key] Refreshing JWKS (expired: {expired}, unknown kid: {unknown})")
+            await _fetch_keys(jwks_uri)
+    return _keys.get(kid)
@@ -0,0 +1,110 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from sqlmodel import delete
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .config import settings
+from .db.core import get_engine
+from .models.models import PendingMFA
+from .utils.logging import app_logger
+
+# Logins waiting for their MFA code, between /login and /login_mfa.
+# "memory" is per process, "database" stores them in the catalog so any worker can complete the login.
+
+
+class PendingMFAStore:
+    async def put(self, username: str, pending_code: str): ...
+
+    async def get(self, username: str) -> str | None: ...
+
+    async def delete(self, username: str): ...
+
+    async def sweep(self): ...
+
+
+class MemoryPendingMFAStore(PendingMFAStore):
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+    async def put(self, username: str, pending_code: str):
+        self._data[username] = (pending_code, time.time() + settings.PENDING_MFA_TTL)
+        self._data.move_to_end(username)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def get(self, username: str) -> str | None:
+        record = self._data.get(username)
+        if not record or record[1] < time.time():
+            return None
+        return record[0]
+
+    async def delete(self, username: str):
+        self._data.pop(username, None)
+
+    async def sweep(self):
+        now = time.time()
+        for username in [u for u, (_, exp) in self._data.items() if exp < now]:
+            del self._data[username]
+
+
+class DatabasePendingMFAStore(PendingMFAStore):
+    async def put(self, username: str, pending_code: str):
+        exp = time.time() + settings.PENDING_MFA_TTL
+        async with AsyncSession(get_engine()) as session:
+            await session.merge(PendingMFA(username=username, pending_code=pending_code, exp=exp))
+            await session.commit()
+
+    async def get(self, username: str) -> str | None:
+        async with AsyncSession(get_engine()) as session:
+            record = await session.get(PendingMFA, username)
+        if not record or record.exp < time.time():
+            return None
+        return record.pending_code
+
+    async def delete(self, username: str):
+        async with AsyncSession(get_engine()) as session:
+            await session.exec(delete(PendingMFA).where(PendingMFA.username == username))
+            await session.commit()
+
+    async def sweep(self):
+        async with AsyncSession(get_engine()) as session:
+            await session.exec(delete(PendingMFA).where(PendingMFA.exp < time.time()))
+            await session.commit()
+
+
+def _build_store() -> PendingMFAStore:
+    if settings.PENDING_MFA_STORE == "database":
+        return DatabasePendingMFAStore()
+    return MemoryPendingMFAStore(settings.PENDING_MFA_MAX)
+
+
+pending_mfa_store = _build_store()
+_sweeper: asyncio.Task | None = None
+
+
+async def _sweep_forever():
+    while True:
+        await asyncio.sleep(settings.PENDING_MFA_SWEEP_INTERVAL)
+        try:
+            await pending_mfa_store.sweep()
+        except Exception as exc:
+            app_logger.error(f"[pending_mfa_sweeper] Exception: {exc}")
+
+
+def start_sweeper():
+    global _sweeper
+    _sweeper = asyncio.create_task(_sweep_forever())
+
+
+async def stop_sweeper():
+    global _sweeper
+    if _sweeper:
+        _sweeper.cancel()
+        try:
+            await _sweeper
+        except asyncio.CancelledError:
+            pass
+        _sweeper = None
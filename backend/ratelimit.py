@@ -0,0 +1,113 @@
+import ipaddress
+import math
+import time
+from collections import OrderedDict, deque
+
+from fastapi import HTTPException, Request
+from sqlmodel import delete, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .config import settings
+from .db.core import get_engine
+from .models.models import RateLimitHit
+from .utils.logging import app_logger
+
+# Sliding window limiter for the Argon2-backed routes, checked before any hashing so a credential stuffing
+# burst cannot pin the CPU. "memory" is per process, "database" is shared by all workers.
+
+
+class RateLimitStore:
+    # Records an attempt, returns 0 if it is allowed, else the seconds to wait
+    async def hit(self, key: str, limit: int, window: int) -> float: ...
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._hits: OrderedDict[str, deque] = OrderedDict()
+
+    async def hit(self, key: str, limit: int, window: int) -> float:
+        now = time.time()
+        hits = self._hits.setdefault(key, deque())
+        self._hits.move_to_end(key)
+        while hits and hits[0] <= now - window:
+            hits.popleft()
+
+        if len(hits) >= limit:
+            return hits[0] + window - now
+
+        hits.append(now)
+        while len(self._hits) > self.maxsize:
+            self._hits.popitem(last=False)
+        return 0
+
+
+class DatabaseRateLimitStore(RateLimitStore):
+    async def hit(self, key: str, limit: int, window: int) -> float:
+        now = time.time()
+        async with AsyncSession(get_engine()) as session:
+            await session.exec(delete(RateLimitHit).where(RateLimitHit.ts <= now - window))
+            hits = select(func.count(RateLimitHit.id), func.min(RateLimitHit.ts))
+            count, oldest = (await session.exec(hits.where(RateLimitHit.key == key))).one()
+            if count >= limit:
+                await session.commit()
+                return oldest + window - now
+
+            session.add(RateLimitHit(key=key, ts=now))
+            await session.commit()
+        return 0
+
+
+def _build_store() -> RateLimitStore:
+    if settings.RATE_LIMIT_STORE == "database":
+        return DatabaseRateLimitStore()
+    return MemoryRateLimitStore(settings.RATE_LIMIT_MAX_KEYS)
+
+
+rate_limit_store = _build_store()
+
+_trusted_proxies = [
+    ipaddress.ip_network(network.strip(), strict=False)
+    for network in settings.TRUSTED_PROXIES.split(",")
+    if network.strip()
+]
+
+
+def _is_trusted_proxy(ip: str) -> bool:
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(address in network for network in _trusted_proxies)
+
+
+def client_ip(request: Request) -> str:
+    # Behind a reverse proxy every request comes from the proxy. X-Forwarded-For is read right to left, each
+    # trusted proxy vouching for the address before it: the client is the first untrusted one. Addresses
+    # further left are whatever the client sent and are ignored.
+    forwarded = request.headers.get("x-forwarded-for", "").split(",")
+    hops = [request.client.host if request.client else "unknown"]
+    hops += [ip.strip() for ip in reversed(forwarded) if ip.strip()]
+    for ip in hops:
+        if not _is_trusted_proxy(ip):
+            return ip
+    return hops[-1]
+
+
+async def check_rate_limit(request: Request, scope: str, username: str):
+    if not settings.RATE_LIMIT_ENABLE:
+        return
+
+    ip = client_ip(request)
+    for key, limit in (
+        (f"{scope}:ip:{ip}", settings.RATE_LIMIT_PER_IP),
+        (f"{scope}:user:{username}", settings.RATE_LIMIT_PER_USERNAME),
+    ):
+        retry_after = await rate_limit_store.hit(key, limit, settings.RATE_LIMIT_WINDOW)
+        if retry_after > 0:
+            app_logger.error(f"[check_rate_limit][{username}] Too many attempts on {scope} from {ip}")
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
@@ -1,12 +1,26 @@
 from datetime import datetime
+from pathlib import Path
 from typing import Annotated
 
 from fastapi import APIRouter, Body, File, Form, UploadFile, Depends, HTTPException
 from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from .. import __version__
-from ..db.core import init_user_data
-from ..deps import SessionDep, get_current_username
+from ..analytics import analytics_cache
+from ..db.core import get_engine, init_user_data
+from ..db.rollups import rebuild_rollups
+from ..db.search import rebuild_search_index
+from ..db.shards import drop_user_data, get_user_engine, user_session
+from ..deps import (
+    CatalogReadSessionDep,
+    CatalogSessionDep,
+    auth_cache,
+    get_current_username,
+    jwt_cache,
+    invalidate_user,
+)
+from ..jobs import JobContext, job_handler, job_runner
 from sqlalchemy.orm import selectinload
 from ..models.models import (
     Bloc,
@@ -16,6 +30,7 @@ from ..models.models import (
     HealthWatchData,
     HealthWatchDataRead,
     Image,
+    JobRead,
     ResultKeyEnum,
     BlocResult,
     Program,
@@ -26,8 +41,8 @@ from ..models.models import (
     UserRead,
 )
 import json
-from ..security import ensure_superuser, hash_password, verify_mfa_code
-from ..utils.file import remove_image
+from ..security import api_token_cache, ensure_superuser, forget_api_token, hash_password, verify_mfa_code
+from ..utils.file import remove_image, upload_f_to_tempfile
 from ..utils.date import parse_str_or_date_to_date
 from ..utils.logging import app_logger
 from .programs import export_program, import_program
@@ -36,24 +51,72 @@ router = APIRouter(prefix="/api/admin", tags=["admin"])
 
 
 @router.get("/users", response_model=list[UserRead])
-async def admin_list_users(session: SessionDep, current_user: Annotated[str, Depends(get_current_username)]):
+async def admin_list_users(
+    session: CatalogReadSessionDep, current_user: Annotated[str, Depends(get_current_username)]
+):
     await ensure_superuser(session, current_user)
 
-    users = session.exec(select(User)).all()
+    users = (await session.exec(select(User))).all()
     return [UserRead.serialize(u) for u in users]
 
 
+@router.get("/stats/cache")
+async def admin_cache_stats(
+    session: CatalogReadSessionDep, current_user: Annotated[str, Depends(get_current_username)]
+) -> dict:
+    await ensure_superuser(session, current_user)
+    return {
+        "auth": auth_cache.stats(),
+        "jwt": jwt_cache.stats(),
+        "api_token": api_token_cache.stats(),
+        "analytics": analytics_cache.stats(),
+    }
+
+
+@router.put("/search/rebuild")
+async def admin_rebuild_search_index(
+    session: CatalogReadSessionDep, current_user: Annotated[str, Depends(get_current_username)]
+) -> dict:
+    await ensure_superuser(session, current_user)
+
+    # Every database holding user data: the main one, or each shard
+    usernames = (await session.exec(select(User.username))).all()
+    engines = {await get_user_engine(username) for username in usernames}
+    for engine in engines:
+        async with engine.begin() as conn:
+            await conn.run_sync(rebuild_search_index)
+    return {}
+
+
+@router.put("/rollups/rebuild")
+async def admin_rebuild_rollups(
+    session: CatalogReadSessionDep, current_user: Annotated[str, Depends(get_current_username)]
+) -> dict:
+    await ensure_superuser(session, current_user)
+
+    usernames = (await session.exec(select(User.username))).all()
+    engines = {await get_user_engine(username) for username in usernames}
+    mismatches = 0
+    for engine in engines:
+        async with engine.begin() as conn:
+            mismatches += await conn.run_sync(rebuild_rollups)
+
+    if mismatches:
+        app_logger.error(f"[admin_rebuild_rollups][{current_user}] {mismatches} rollup rows were out of date")
+    return {"mismatches": mismatches}
+
+
 @router.put("/users/{username}/reset")
 async def admin_reset_user_password(
     username: str,
-    session: SessionDep,
+    session: CatalogSessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
     new: str = Body(..., embed=True),
     code: str = Body(..., embed=True),
 ):
     await ensure_superuser(session, current_user)
 
-    db_user = session.get(User, current_user)
+    db_user = await session.get(User, current_user)
     if not db_user.mfa_enabled:
         raise HTTPException(status_code=400, detail="Enable MFA to perform admin actions")
 
@@ -61,15 +124,16 @@ async def admin_reset_user_password(
     if not success:
         raise HTTPException(status_code=403, detail="Invalid code")
 
-    target_user = session.get(User, username)
+    target_user = await session.get(User, username)
     if not target_user:
         raise HTTPException(status_code=404, detail="The resource does not exist")
     if target_user.is_su:
         raise HTTPException(status_code=403, detail="You cannot tamper an admin account")
 
-    target_user.password = hash_password(new)
+    target_user.password = await hash_password(new)
     session.add(target_user)
-    session.commit()
+    await session.commit()
+    invalidate_user(username)
 
     return {}
 
@@ -77,13 +141,13 @@ async def admin_reset_user_password(
 @router.put("/users/{username}/reset_mfa", response_model=UserRead)
 async def admin_reset_mfa(
     username: str,
-    session: SessionDep,
+    session: CatalogSessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
     code: str = Body(..., embed=True),
 ) -> UserRead:
     await ensure_superuser(session, current_user)
 
-    db_user = session.get(User, current_user)
+    db_user = await session.get(User, current_user)
     if not db_user.mfa_enabled:
         raise HTTPException(status_code=400, detail="Enable MFA to perform admin actions")
 
@@ -91,7 +155,7 @@ async def admin_reset_mfa(
     if not success:
         raise HTTPException(status_code=403, detail="Invalid code")
 
-    target_user = session.get(User, username)
+    target_user = await session.get(User, username)
     if not target_user:
         raise HTTPException(status_code=404, detail="The resource does not exist")
     if target_user.is_su:
@@ -102,119 +166,141 @@ async def admin_reset_mfa(
     target_user.mfa_enabled = False
     target_user.mfa_secret = None
     session.add(target_user)
-    session.commit()
+    await session.commit()
+    invalidate_user(username)
 
     return UserRead.serialize(target_user)
 
 
-@router.put("/import")
-async def admin_import_data(
-    session: SessionDep,
-    current_user: Annotated[str, Depends(get_current_username)],
-    file: UploadFile = File(...),
-    code: str = Form(...),
-):
-    await ensure_superuser(session, current_user)
+@job_handler("admin_import")
+async def admin_import_job(job: JobContext) -> dict:
+    data = json.loads(Path(job.input).read_bytes())
+    async with AsyncSession(get_engine()) as session:
+        known_users = set((await session.exec(select(User.username).where(User.username.in_(data)))).all())
 
-    db_user = session.get(User, current_user)
-    if not db_user.mfa_enabled:
-        raise HTTPException(status_code=400, detail="Enable MFA to perform admin actions")
-
-    success = verify_mfa_code(db_user.mfa_secret, code)
-    if not success:
-        raise HTTPException(status_code=403, detail="Invalid code")
-
-    if file.content_type != "application/json":
-        raise HTTPException(status_code=415, detail="Resource format not supported")
-
-    content = await file.read()
-    data = json.loads(content)
-    for user in data:
-        if not session.get(User, current_user):
+    for done, user in enumerate(data):
+        await job.progress(done / len(data), {"users": done})
+        if user not in known_users:
             app_logger.error(f"[admin_import_data] Trying to import data for unknown user {user}")
             continue
 
-        d = data.get(user)
-        for category in d.get("categories", []):
-            category_exists = session.exec(
-                select(BlocCategory).filter(
-                    BlocCategory.user == user, BlocCategory.name == category.get("name")
-                )
-            ).first()
-            if category_exists:
-                continue
-
-            new_category = BlocCategory(
-                name=category.get("name"),
-                color=category.get("color"),
-                weight=category.get("weight"),
-                user=user,
-            )
-            session.add(new_category)
-        session.flush()
-
-        for bloc in d.get("blocs", []):
-            bloc_category_name = bloc.get("category", {}).get("name")
-            category = session.exec(
-                select(BlocCategory).filter(
-                    BlocCategory.user == user, BlocCategory.name == bloc_category_name
+        async with user_session(user) as data_session:
+            d = data.get(user)
+            for category in d.get("categories", []):
+                category_exists = (
+                    await data_session.exec(
+                        select(BlocCategory).filter(
+                            BlocCategory.user == user, BlocCategory.name == category.get("name")
+                        )
+                    )
+                ).first()
+                if category_exists:
+                    continue
+
+                new_category = BlocCategory(
+                    name=category.get("name"),
+                    color=category.get("color"),
+                    weight=category.get("weight"),
+                    user=user,
                 )
-            ).first()
-            if not category:
-                app_logger.error(
-                    f"[admin_import_data] Trying to import bloc for unknown category {bloc_category_name}"
+                data_session.add(new_category)
+            await data_session.flush()
+
+            for bloc in d.get("blocs", []):
+                bloc_category_name = bloc.get("category", {}).get("name")
+                category = (
+                    await data_session.exec(
+                        select(BlocCategory).filter(
+                            BlocCategory.user == user, BlocCategory.name == bloc_category_name
+                        )
+                    )
+                ).first()
+                if not category:
+                    app_logger.error(
+                        f"[admin_import_data] Trying to import bloc for unknown category "
+                        f"{bloc_category_name}"
+                    )
+                    continue
+
+                new_bloc = Bloc(
+                    content=bloc.get("content"),
+                    duration=bloc.get("duration"),
+                    cdate=parse_str_or_date_to_date(bloc.get("cdate")),
+                    user=user,
                 )
-                continue
+                new_bloc.category_id = category.id
 
-            new_bloc = Bloc(
-                content=bloc.get("content"),
-                duration=bloc.get("duration"),
-                cdate=parse_str_or_date_to_date(bloc.get("cdate")),
-                user=user,
-            )
-            new_bloc.category_id = category.id
+                if bloc.get("result"):
+                    b = bloc.get("result")
+                    new_result = BlocResult(
+                        key=b.get("key"), value=b.get("value"), comment=b.get("comment")
+                    )
+                    data_session.add(new_result)
+                    new_bloc.result = new_result
 
-            if bloc.get("result"):
-                b = bloc.get("result")
-                new_result = BlocResult(key=b.get("key"), value=b.get("value"), comment=b.get("comment"))
-                session.add(new_result)
-                new_bloc.result = new_result
+                data_session.add(new_bloc)
 
-            session.add(new_bloc)
+            for program in d.get("programs", []):
+                await import_program(data_session, user, program)
 
-        for program in d.get("programs", []):
-            await import_program(session, user, program)
+            for pr in d.get("pr", []):
+                if pr.get("key") not in {item.value for item in ResultKeyEnum}:
+                    app_logger.error(f"[admin_import_data][{job.username}] Invalid PR key for {user}")
+                    job.fail("Bad request")
 
-        for pr in d.get("pr", []):
-            if pr.get("key") not in {item.value for item in ResultKeyEnum}:
-                app_logger.error(f"[post_pr][{current_user}] Invalid key provided")
-                raise HTTPException(status_code=400, detail="Bad request")
+                new_pr = PR(name=pr.get("name"), key=pr.get("key"), user=user)
 
-            new_pr = PR(name=pr.get("name"), key=pr.get("key"), user=user)
+                if pr.get("values"):
+                    pr_values = []
+                    for value in pr.get("values"):
+                        parsed_date = parse_str_or_date_to_date(value.get("cdate"))
+                        pr_values.append(
+                            PRValue(value=value.get("value"), cdate=parsed_date, pr=new_pr)
+                        )
 
-            if pr.get("values"):
-                pr_values = []
-                for value in pr.get("values"):
-                    parsed_date = parse_str_or_date_to_date(value.get("cdate"))
-                    pr_values.append(PRValue(value=value.get("value"), cdate=parsed_date, pr=new_pr))
+                    new_pr.values = pr_values
 
-                new_pr.values = pr_values
+                data_session.add(new_pr)
 
-            session.add(new_pr)
+            await data_session.commit()
 
-    session.commit()
-    return {}
+    return {"users": len(known_users)}
+
+
+@router.put("/import", status_code=202, response_model=JobRead)
+async def admin_import_data(
+    session: CatalogSessionDep,
+    current_user: Annotated[str, Depends(get_current_username)],
+    file: UploadFile = File(...),
+    code: str = Form(...),
+) -> JobRead:
+    await ensure_superuser(session, current_user)
+
+    db_user = await session.get(User, current_user)
+    if not db_user.mfa_enabled:
+        raise HTTPException(status_code=400, detail="Enable MFA to perform admin actions")
+
+    success = verify_mfa_code(db_user.mfa_secret, code)
+    if not success:
+        raise HTTPException(status_code=403, detail="Invalid code")
+
+    if file.content_type != "application/json":
+        raise HTTPException(status_code=415, detail="Resource format not supported")
+
+    # Users are imported one after the other in the background, GET /api/jobs/{id} reports it
+    job = await job_runner.submit(current_user, "admin_import", await upload_f_to_tempfile(file))
+    return JobRead.serialize(job)
 
 
 @router.put("/export")
 async def admin_export_data(
-    session: SessionDep,
+    session: CatalogReadSessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
     code: str = Body(..., embed=True),
 ):
     await ensure_superuser(session, current_user)
 
-    db_user = session.get(User, current_user)
+    db_user = await session.get(User, current_user)
     if not db_user.mfa_enabled:
         raise HTTPException(status_code=400, detail="Enable MFA to perform admin actions")
 
@@ -224,36 +310,46 @@ async def admin_export_data(
 
     data = {}
 
-    users = session.exec(select(User)).all()
+    users = (await session.exec(select(User))).all()
     for user in users:
         username = user.username
-        data[username] = {
-            "_": {"at": datetime.timestamp(datetime.now()), "version": __version__},
-            "categories": [
-                BlocCategoryRead.serialize(c)
-                for c in session.exec(select(BlocCategory).filter(BlocCategory.user == username))
-            ],
-            "pr": [
-                PRRead.serialize(pr)
-                for pr in session.exec(
-                    select(PR).where(PR.user == username).options(selectinload(PR.values))
-                )
-            ],
-            "blocs": [
-                BlocRead.serialize(bloc) for bloc in session.exec(select(Bloc).filter(Bloc.user == username))
-            ],
-            "programs": [
-                await export_program(program.id, session, username)
-                for program in session.exec(select(Program).filter(Program.user == username))
-            ],
-        }
-
-        hw_data = session.exec(
-            select(HealthWatchData)
-            .where(HealthWatchData.user == username)
-            .order_by(HealthWatchData.cdate.desc())
-        )
-        data[username]["hw_data"] = [HealthWatchDataRead.serialize(r) for r in hw_data]
+        async with user_session(username, read_only=True) as data_session:
+            data[username] = {
+                "_": {"at": datetime.timestamp(datetime.now()), "version": __version__},
+                "categories": [
+                    BlocCategoryRead.serialize(c)
+                    for c in await data_session.exec(
+                        select(BlocCategory).filter(BlocCategory.user == username)
+                    )
+                ],
+                "pr": [
+                    PRRead.serialize(pr)
+                    for pr in await data_session.exec(
+                        select(PR).where(PR.user == username).options(selectinload(PR.values))
+                    )
+                ],
+                "blocs": [
+                    BlocRead.serialize(bloc)
+                    for bloc in await data_session.exec(
+                        select(Bloc)
+                        .filter(Bloc.user == username)
+                        .options(selectinload(Bloc.category), selectinload(Bloc.result))
+                    )
+                ],
+                "programs": [
+                    await export_program(program.id, data_session, username)
+                    for program in await data_session.exec(
+                        select(Program).filter(Program.user == username)
+                    )
+                ],
+            }
+
+            hw_data = await data_session.exec(
+                select(HealthWatchData)
+                .where(HealthWatchData.user == username)
+                .order_by(HealthWatchData.cdate.desc())
+            )
+            data[username]["hw_data"] = [HealthWatchDataRead.serialize(r) for r in hw_data]
 
     return data
 
@@ -261,13 +357,13 @@ async def admin_export_data(
 @router.put("/users/{username}/toggle_active", response_model=UserRead)
 async def admin_toggle_user_active(
     username: str,
-    session: SessionDep,
+    session: CatalogSessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
     code: str = Body(..., embed=True),
 ) -> UserRead:
     await ensure_superuser(session, current_user)
 
-    db_user = session.get(User, current_user)
+    db_user = await session.get(User, current_user)
     if not db_user.mfa_enabled:
         raise HTTPException(status_code=400, detail="Enable MFA to perform admin actions")
 
@@ -275,7 +371,7 @@ async def admin_toggle_user_active(
     if not success:
         raise HTTPException(status_code=403, detail="Invalid code")
 
-    target_user = session.get(User, username)
+    target_user = await session.get(User, username)
     if not target_user:
         raise HTTPException(status_code=404, detail="The resource does not exist")
     if target_user.is_su:
@@ -283,8 +379,10 @@ async def admin_toggle_user_active(
 
     target_user.is_active = not target_user.is_active
     session.add(target_user)
-    session.commit()
-    session.refresh(target_user)
+    await session.commit()
+    invalidate_user(username)
+    forget_api_token(target_user.api_token)
+    await session.refresh(target_user)
 
     return UserRead.serialize(target_user)
 
@@ -292,13 +390,13 @@ async def admin_toggle_user_active(
 @router.put("/users/{username}/delete")
 async def admin_delete_user(
     username: str,
-    session: SessionDep,
+    session: CatalogSessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
     code: str = Body(..., embed=True),
 ):
     await ensure_superuser(session, current_user)
 
-    db_user = session.get(User, current_user)
+    db_user = await session.get(User, current_user)
     if not db_user.mfa_enabled:
         raise HTTPException(status_code=400, detail="Enable MFA to perform admin actions")
 
@@ -306,18 +404,22 @@ async def admin_delete_user(
     if not success:
         raise HTTPException(status_code=403, detail="Invalid code")
 
-    target_user = session.get(User, username)
+    target_user = await session.get(User, username)
     if not target_user:
         raise HTTPException(status_code=404, detail="The resource does not exist")
     if target_user.is_su:
         raise HTTPException(status_code=403, detail="You cannot tamper an admin account")
 
     # Retrieve fs images
-    images = session.exec(select(Image).where(Image.user == username))
-    images = [im.filename for im in images]
+    async with user_session(username, read_only=True) as data_session:
+        images = await data_session.exec(select(Image).where(Image.user == username))
+        images = [im.filename for im in images]
 
-    session.delete(target_user)
-    session.commit()
+    forget_api_token(target_user.api_token)
+    await session.delete(target_user)
+    await session.commit()
+    invalidate_user(username)
+    await drop_user_data(username)
 
     # Delete the image files on fs
     for im in images:
@@ -328,7 +430,7 @@ async def admin_delete_user(
 
 @router.post("/users", response_model=UserRead)
 async def admin_add_user(
-    session: SessionDep,
+    session: CatalogSessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
     code: str = Body(..., embed=True),
     username: str = Body(..., embed=True),
@@ -336,7 +438,7 @@ async def admin_add_user(
 ):
     await ensure_superuser(session, current_user)
 
-    db_user = session.get(User, current_user)
+    db_user = await session.get(User, current_user)
     if not db_user.mfa_enabled:
         raise HTTPException(status_code=400, detail="Enable MFA to perform admin actions")
 
@@ -344,14 +446,15 @@ async def admin_add_user(
     if not success:
         raise HTTPException(status_code=403, detail="Invalid code")
 
-    user = session.get(User, username)
+    user = await session.get(User, username)
     if user:
         raise HTTPException(status_code=409, detail="The resource already exists")
 
-    new_user = User(username=username, password=hash_password(password))
+    new_user = User(username=username, password=await hash_password(password))
     session.add(new_user)
-    session.commit()
+    await session.commit()
 
-    init_user_data(session, new_user.username)
+    async with user_session(new_user.username) as data_session:
+        await init_user_data(data_session, new_user.username)
 
     return UserRead.serialize(new_user)
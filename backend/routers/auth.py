@@ -1,13 +1,15 @@
 from typing import Annotated
 
 import jwt
-from fastapi import APIRouter, Body, Depends, HTTPException
+from fastapi import APIRouter, Body, Depends, HTTPException, Request
 from sqlmodel import select
-import json
-import httpx
 from ..config import settings
 from ..db.core import init_user_data
-from ..deps import SessionDep, get_current_username
+from ..db.shards import user_session
+from ..deps import CatalogSessionDep, get_current_username, invalidate_user
+from ..oidc import get_http_client, get_oidc_config, get_signing_key
+from ..pending_mfa import pending_mfa_store
+from ..ratelimit import check_rate_limit
 from ..models.models import (
     LoginRegisterModel,
     AuthParams,
@@ -19,16 +21,15 @@ from ..security import (
     create_access_token,
     create_tokens,
     hash_password,
+    password_needs_rehash,
     verify_password,
     generate_mfa_secret,
     verify_mfa_code,
 )
 from ..utils.logging import app_logger
-from ..utils.date import dt_utc, dt_utc_offset
 from ..utils.misc import generate_api_token
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
-pending_mfa_usernames = {}
 
 
 @router.get("/params", response_model=AuthParams)
@@ -47,21 +48,29 @@ async def auth_params() -> AuthParams:
 
 
 @router.post("/login")
-async def login(req: LoginRegisterModel, session: SessionDep):
+async def login(req: LoginRegisterModel, request: Request, session: CatalogSessionDep):
     if settings.AUTH_METHOD == "oidc":
         app_logger.error("[login] Local Authentication is disabled")
         raise HTTPException(status_code=400, detail="Bad request")
 
-    db_user = session.get(User, req.username)
-    if not db_user or not verify_password(req.password, db_user.password):
+    await check_rate_limit(request, "login", req.username)
+
+    db_user = await session.get(User, req.username)
+    if not db_user or not await verify_password(req.password, db_user.password):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
     if not db_user.is_active:
         raise HTTPException(status_code=401, detail="User is disabled")
 
+    # Hashes made with older cost parameters are upgraded while the password is at hand
+    if password_needs_rehash(db_user.password):
+        db_user.password = await hash_password(req.password)
+        session.add(db_user)
+        await session.commit()
+
     if db_user.mfa_enabled:
         pending_mfa_code = generate_mfa_secret()
-        pending_mfa_usernames[db_user.username] = {"pending_code": pending_mfa_code, "exp": dt_utc_offset(5)}
+        await pending_mfa_store.put(db_user.username, pending_mfa_code)
 
         return {"pending_code": pending_mfa_code, "username": db_user.username}
 
@@ -70,28 +79,28 @@ async def login(req: LoginRegisterModel, session: SessionDep):
 
 @router.post("/login_mfa", response_model=Token)
 async def verify_mfa(
-    session: SessionDep,
+    session: CatalogSessionDep,
     username: str = Body(..., embed=True),
     pending_code: str = Body(..., embed=True),
     code: str = Body(..., embed=True),
 ) -> Token:
-    user = session.get(User, username)
+    user = await session.get(User, username)
     if not user or not user.mfa_enabled:
         raise HTTPException(status_code=401, detail="Invalid MFA flow")
 
-    record = pending_mfa_usernames.get(username)
-    if not record or record["exp"] < dt_utc() or record["pending_code"] != pending_code:
-        pending_mfa_usernames.pop(username, None)
+    if await pending_mfa_store.get(username) != pending_code:
+        await pending_mfa_store.delete(username)
         raise HTTPException(status_code=401, detail="Unauthorized")
 
     if not verify_mfa_code(user.mfa_secret, code):
         raise HTTPException(status_code=403, detail="Invalid MFA code")
 
+    await pending_mfa_store.delete(username)
     return create_tokens({"sub": user.username})
 
 
 @router.post("/register", response_model=Token)
-async def register(req: LoginRegisterModel, session: SessionDep) -> Token:
+async def register(req: LoginRegisterModel, request: Request, session: CatalogSessionDep) -> Token:
     if not settings.REGISTER_ENABLE:
         raise HTTPException(status_code=400, detail="Registration disabled")
 
@@ -99,17 +108,20 @@ async def register(req: LoginRegisterModel, session: SessionDep) -> Token:
         app_logger.error("[login] Local Authentication is disabled")
         raise HTTPException(status_code=400, detail="Bad request")
 
-    user = session.get(User, req.username)
+    await check_rate_limit(request, "register", req.username)
+
+    user = await session.get(User, req.username)
     if user:
         raise HTTPException(status_code=409, detail="The resource already exists")
 
-    is_first = not session.execute(select(User).limit(1)).first()
+    is_first = not (await session.exec(select(User).limit(1))).first()
 
-    new_user = User(username=req.username, password=hash_password(req.password), is_su=is_first)
+    new_user = User(username=req.username, password=await hash_password(req.password), is_su=is_first)
     session.add(new_user)
-    session.commit()
+    await session.commit()
 
-    init_user_data(session, new_user.username)
+    async with user_session(new_user.username) as data_session:
+        await init_user_data(data_session, new_user.username)
 
     return create_tokens(data={"sub": new_user.username})
 
@@ -117,20 +129,24 @@ async def register(req: LoginRegisterModel, session: SessionDep) -> Token:
 @router.post("/update_password")
 async def auth_update_password(
     data: UpdateUserPassword,
-    session: SessionDep,
+    request: Request,
+    session: CatalogSessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
 ):
     if settings.AUTH_METHOD == "oidc":
         raise HTTPException(status_code=400, detail="Bad request")
 
-    db_user = session.get(User, current_user)
+    await check_rate_limit(request, "update_password", current_user)
 
-    if not verify_password(data.current, db_user.password):
+    db_user = await session.get(User, current_user)
+
+    if not await verify_password(data.current, db_user.password):
         raise HTTPException(status_code=403, detail="Invalid credentials")
 
-    db_user.password = hash_password(data.new)
+    db_user.password = await hash_password(data.new)
     session.add(db_user)
-    session.commit()
+    await session.commit()
+    invalidate_user(current_user)
 
     return {}
 
@@ -161,19 +177,11 @@ async def refresh_token(refresh_token: str = Body(..., embed=True)):
 
 
 @router.post("/oidc/login", response_model=Token)
-async def oidc_login(session: SessionDep, code: str = Body(..., embed=True)) -> Token:
+async def oidc_login(session: CatalogSessionDep, code: str = Body(..., embed=True)) -> Token:
     if settings.AUTH_METHOD != "oidc":
         raise HTTPException(status_code=400, detail="Bad request")
 
-    discovery_url = (
-        f"http://{settings.OIDC_HOST}/realms/{settings.OIDC_REALM}/.well-known/openid-configuration"
-    )
-    async with httpx.AsyncClient() as client:
-        discovery_resp = await client.get(discovery_url)
-        if discovery_resp.status_code != 200:
-            raise HTTPException(status_code=500, detail="Failed to load OIDC configuration")
-        config = discovery_resp.json()
-
+    config = await get_oidc_config()
     token_url = config["token_endpoint"]
     data = {
         "grant_type": "authorization_code",
@@ -184,59 +192,52 @@ async def oidc_login(session: SessionDep, code: str = Body(..., embed=True)) ->
     }
     headers = {"Content-Type": "application/x-www-form-urlencoded"}
 
-    async with httpx.AsyncClient() as client:
-        token_resp = await client.post(token_url, data=data, headers=headers)
-        if token_resp.status_code != 200:
-            raise HTTPException(status_code=401, detail="Failed to exchange code for tokens")
-        token_data = token_resp.json()
+    token_resp = await get_http_client().post(token_url, data=data, headers=headers)
+    if token_resp.status_code != 200:
+        raise HTTPException(status_code=401, detail="Failed to exchange code for tokens")
+    token_data = token_resp.json()
 
     id_token = token_data.get("id_token")
-    alg = jwt.get_unverified_header(id_token).get("alg")
-
-    if alg == "HS256":
-        decoded = jwt.decode(
-            id_token,
-            settings.OIDC_CLIENT_SECRET,
-            algorithms=alg,
-            audience=settings.OIDC_CLIENT_ID,
-        )
-    elif alg == "RS256":
-        jwks_uri = config.get("jwks_uri")
-        if not jwks_uri:
-            raise HTTPException(status_code=400, detail="Bad request")
-
-        async with httpx.AsyncClient() as client:
-            jwk = await client.get(jwks_uri)
-            if token_resp.status_code != 200:
-                raise HTTPException(status_code=400, detail="Bad request")
-            jwks = jwk.json().get("keys")
-
-        public_keys = {}
-        for jwk in jwks:
-            kid = jwk.get("kid")
-            if not kid:
-                continue
-            public_keys[kid] = jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(jwk))
-        kid = jwt.get_unverified_header(id_token).get("kid")
-        pk = public_keys.get(kid)
-
-        decoded = jwt.decode(
-            id_token,
-            key=pk,
-            algorithms=alg,
-            audience=settings.OIDC_CLIENT_ID,
-        )
+    try:
+        alg = jwt.get_unverified_header(id_token).get("alg")
+
+        if alg == "HS256":
+            decoded = jwt.decode(
+                id_token,
+                settings.OIDC_CLIENT_SECRET,
+                algorithms=alg,
+                audience=settings.OIDC_CLIENT_ID,
+            )
+        elif alg == "RS256":
+            kid = jwt.get_unverified_header(id_token).get("kid")
+            pk = await get_signing_key(kid)
+            if not pk:
+                app_logger.error(f"[oidc_login] Unknown signing key {kid}")
+                raise HTTPException(status_code=401, detail="Invalid Token")
+
+            decoded = jwt.decode(
+                id_token,
+                key=pk,
+                algorithms=alg,
+                audience=settings.OIDC_CLIENT_ID,
+            )
+        else:
+            raise HTTPException(status_code=401, detail="Invalid Token")
+    except jwt.PyJWTError as exc:
+        app_logger.error(f"[oidc_login] PyJWT Error: {exc}")
+        raise HTTPException(status_code=401, detail="Invalid Token")
 
     username = decoded.get("preferred_username")
     if not username:
         raise HTTPException(status_code=400, detail="Username not found in user info")
 
-    user = session.get(User, username)
+    user = await session.get(User, username)
     if not user:
         # TODO: password is non-null, we must init the pw with something, the model is not made for OIDC
-        user = User(username=username, password=hash_password(generate_api_token()))
+        user = User(username=username, password=await hash_password(generate_api_token()))
         session.add(user)
-        session.commit()
-        init_user_data(session, username)
+        await session.commit()
+        async with user_session(username) as data_session:
+            await init_user_data(data_session, username)
 
     return create_tokens(data={"sub": username})
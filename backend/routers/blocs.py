@@ -1,12 +1,20 @@
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import selectinload
-from sqlmodel import select
-
-from ..deps import SessionDep, get_current_username
+from sqlmodel import and_, delete, func, insert, or_, select, update
+
+from ..config import settings
+from ..db.changes import record_bulk_changes
+from ..db.dialect import dialect_of
+from ..db.rollups import refresh_rollups
+from ..db.writer import submit_write
+from ..deps import ReadSessionDep, SessionDep, check_etag, get_current_username
 from ..models.models import (
     Bloc,
+    BlocBatchOperation,
+    BlocCategory,
+    BlocCategoryRead,
     BlocCreate,
     BlocRead,
     BlocResult,
@@ -17,18 +25,32 @@ from ..models.models import (
 from ..security import verify_exists_and_owns
 from ..utils.date import parse_str_or_date_to_date
 from ..utils.logging import app_logger
+from ..utils.misc import decode_cursor, encode_cursor
 
 router = APIRouter(prefix="/api/blocs", tags=["blocs"])
 
 
-@router.get("", response_model=list[BlocRead])
+def bloc_update_values(bloc: BlocUpdate) -> dict:
+    bloc_data = bloc.model_dump(exclude_unset=True)
+    if bloc_data.get("category"):
+        bloc_data["category_id"] = bloc_data.get("category").get("id")
+        bloc_data.pop("category")
+
+    if bloc_data.get("cdate"):
+        bloc_data["cdate"] = parse_str_or_date_to_date(bloc_data.get("cdate"))
+    return bloc_data
+
+
+@router.get("", response_model=list[BlocRead], dependencies=[Depends(check_etag)])
 async def get_blocs(
-    session: SessionDep,
+    session: ReadSessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
+    response: Response,
     startdate: str | None = None,
     enddate: str | None = None,
     limit: int = 0,
     offset: int = 0,
+    cursor: str | None = None,
 ) -> list[BlocRead]:
     startdate = parse_str_or_date_to_date(startdate) if startdate else None
     enddate = parse_str_or_date_to_date(enddate) if enddate else None
@@ -36,60 +58,196 @@ async def get_blocs(
         app_logger.error(f"[get_blocs][{current_user}] Specified dates are incoherent")
         raise HTTPException(status_code=400, detail="Bad request")
 
-    query = select(Bloc).where(Bloc.user == current_user).options(selectinload(Bloc.category))
+    query = (
+        select(Bloc)
+        .where(Bloc.user == current_user)
+        .options(selectinload(Bloc.category), selectinload(Bloc.result))
+    )
     if startdate:
         query = query.where(Bloc.cdate >= startdate)
 
     if enddate:
         query = query.where(Bloc.cdate <= enddate)
 
-    if offset:
+    # Keyset pagination on (cdate, id), served by ix_bloc_user_cdate_id whatever the depth.
+    # X-Next-Cursor / X-Prev-Cursor headers hold opaque cursors to the following / previous page.
+    backward = False
+    if cursor:
+        cdate, bloc_id, backward = decode_cursor(cursor)
+        if backward:
+            query = query.where(or_(Bloc.cdate < cdate, and_(Bloc.cdate == cdate, Bloc.id < bloc_id)))
+        else:
+            query = query.where(or_(Bloc.cdate > cdate, and_(Bloc.cdate == cdate, Bloc.id > bloc_id)))
+        limit = limit or settings.BLOCS_PAGE_SIZE
+    elif offset:
         query = query.offset(offset)
 
+    if backward:
+        query = query.order_by(Bloc.cdate.desc(), Bloc.id.desc())
+    else:
+        query = query.order_by(Bloc.cdate, Bloc.id)
+
     if limit:
-        query = query.limit(limit)
+        query = query.limit(limit + 1)  # One more row tells if there is a next page
+
+    blocs = (await session.exec(query)).all()
+    has_more = bool(limit) and len(blocs) > limit
+    if has_more:
+        blocs = blocs[:limit]
+    if backward:
+        blocs.reverse()
+
+    if limit and blocs:
+        has_next, has_prev = (True, has_more) if backward else (has_more, bool(cursor))
+        if has_next:
+            response.headers["X-Next-Cursor"] = encode_cursor(blocs[-1].cdate, blocs[-1].id)
+        if has_prev:
+            response.headers["X-Prev-Cursor"] = encode_cursor(blocs[0].cdate, blocs[0].id, backward=True)
 
-    blocs = session.exec(query)
     return [BlocRead.serialize(bloc) for bloc in blocs]
 
 
 @router.post("", response_model=BlocRead | list[BlocRead])
 async def post_bloc(
     bloc_data: BlocCreate | list[BlocCreate],
-    session: SessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
 ) -> BlocRead | list[BlocRead]:
     if not isinstance(bloc_data, list):
         bloc_data = [bloc_data]
+    if not bloc_data:
+        return []
 
-    blocs = []
+    rows = []
     for bloc in bloc_data:
         if not bloc.category and not bloc.category_id:
             app_logger.error(f"[post_bloc][{current_user}] No Category/Category_id provided")
             raise HTTPException(status_code=400, detail="Bad request")
 
-        new_bloc = Bloc(
-            content=bloc.content,
-            duration=bloc.duration,
-            cdate=parse_str_or_date_to_date(bloc.cdate),
-            user=current_user,
+        rows.append(
+            {
+                "content": bloc.content,
+                "duration": bloc.duration,
+                "cdate": parse_str_or_date_to_date(bloc.cdate),
+                "user": current_user,
+                # category_id prioritized, else we retrieve category.id for bloc.category_id
+                "category_id": bloc.category_id or bloc.category.id,
+            }
         )
 
-        # category_id prioritized
-        if bloc.category_id:
-            new_bloc.category_id = bloc.category_id
+    async def write(session):
+        # Set based: one query checks every referenced category, one executemany inserts the blocs
+        category_ids = {row["category_id"] for row in rows}
+        categories = await session.exec(
+            select(BlocCategory).where(BlocCategory.id.in_(category_ids), BlocCategory.user == current_user)
+        )
+        categories = {c.id: BlocCategoryRead.serialize(c) for c in categories}
+        if len(categories) != len(category_ids):
+            app_logger.error(f"[post_bloc][{current_user}] Unknown Category provided")
+            raise HTTPException(status_code=400, detail="Bad request")
 
-        # Else we retrieve category.id for bloc.category_id
-        else:
-            new_bloc.category_id = bloc.category.id
+        # sort_by_parameter_order would insert row by row on SQLite. Ids grow in the rows' order instead:
+        # the statement's batches run in order and each one numbers its rows in order
+        ids = sorted((await session.exec(insert(Bloc).returning(Bloc.id), params=rows)).scalars().all())
+        await record_bulk_changes(session, current_user, "blocs", ids, "insert")
+        await refresh_rollups(session, current_user, {row["cdate"] for row in rows})
+        return ids, categories
+
+    ids, categories = await submit_write(current_user, write)
+    blocs = [
+        BlocRead(
+            id=bloc_id,
+            content=row["content"],
+            duration=row["duration"],
+            cdate=row["cdate"],
+            category=categories[row["category_id"]],
+            result=None,
+        )
+        for bloc_id, row in zip(ids, rows)
+    ]
+    if len(blocs) == 1:
+        return blocs[0]
+    return blocs
 
-        session.add(new_bloc)
-        blocs.append(new_bloc)
 
-    session.commit()
-    if len(blocs) == 1:
-        return BlocRead.serialize(blocs[0])
-    return [BlocRead.serialize(bloc) for bloc in blocs]
+@router.post("/batch")
+async def batch_blocs(
+    operations: list[BlocBatchOperation],
+    session: SessionDep,
+    current_user: Annotated[str, Depends(get_current_username)],
+) -> dict:
+    # Operations are applied in order, each one as a set based statement, all in a single transaction
+    ids = {bloc_id for operation in operations for bloc_id in operation.ids}
+    owned_ids = (await session.exec(select(Bloc.id).where(Bloc.id.in_(ids), Bloc.user == current_user))).all()
+    if len(owned_ids) != len(ids):
+        raise HTTPException(status_code=404, detail="The resource does not exist")
+
+    # Days holding the blocs before and after the operations, for the duration rollups
+    touched_days = set((await session.exec(select(Bloc.cdate).where(Bloc.id.in_(ids)).distinct())).all())
+    dialect = dialect_of(await session.connection())
+    changes = {"insert": set(), "update": set(), "delete": set()}
+    for operation in operations:
+        owned = and_(Bloc.id.in_(operation.ids), Bloc.user == current_user)
+
+        if operation.op == "delete":
+            result_ids = (await session.exec(select(Bloc.result_id).where(owned))).all()
+            await session.exec(delete(Bloc).where(owned))
+            await session.exec(delete(BlocResult).where(BlocResult.id.in_([i for i in result_ids if i])))
+            changes["delete"].update(operation.ids)
+            continue
+
+        if operation.op == "update":
+            if not operation.data:
+                raise HTTPException(status_code=400, detail="Bad request")
+
+            values = bloc_update_values(operation.data)
+            values.pop("result_id", None)  # A result belongs to a single bloc
+            if values.get("category_id"):
+                category = await session.get(BlocCategory, values["category_id"])
+                if not category or category.user != current_user:
+                    app_logger.error(f"[batch_blocs][{current_user}] Unknown Category provided")
+                    raise HTTPException(status_code=400, detail="Bad request")
+
+            if values:
+                await session.exec(update(Bloc).where(owned).values(**values))
+            changes["update"].update(operation.ids)
+            continue
+
+        # shift and copy move the blocs by `days`, or so that the earliest one lands on `to`
+        days = operation.days
+        if operation.to:
+            earliest = (await session.exec(select(func.min(Bloc.cdate)).where(owned))).one()
+            days = (parse_str_or_date_to_date(operation.to) - earliest).days
+        if days is None:
+            raise HTTPException(status_code=400, detail="Bad request")
+
+        if operation.op == "shift":
+            await session.exec(update(Bloc).where(owned).values(cdate=dialect.add_days(Bloc.cdate, days)))
+            changes["update"].update(operation.ids)
+            continue
+
+        # Copies are plans: results are not copied along
+        columns = ["content", "duration", "cdate", "user", "category_id"]
+        copies = select(
+            Bloc.content, Bloc.duration, dialect.add_days(Bloc.cdate, days), Bloc.user, Bloc.category_id
+        ).where(owned)
+        copied = await session.exec(insert(Bloc).from_select(columns, copies).returning(Bloc.id))
+        changes["insert"].update(copied.scalars().all())
+
+    changes["update"] -= changes["delete"]
+    touched_days.update(
+        (await session.exec(select(Bloc.cdate).where(Bloc.id.in_(ids | changes["insert"])).distinct())).all()
+    )
+    await refresh_rollups(session, current_user, touched_days)
+    for op, changed_ids in changes.items():
+        if changed_ids:
+            await record_bulk_changes(session, current_user, "blocs", sorted(changed_ids), op)
+    await session.commit()
+
+    return {
+        "created": sorted(changes["insert"]),
+        "updated": sorted(changes["update"]),
+        "deleted": sorted(changes["delete"]),
+    }
 
 
 @router.put("/{bloc_id}", response_model=BlocRead)
@@ -99,23 +257,16 @@ async def put_bloc(
     bloc: BlocUpdate,
     current_user: Annotated[str, Depends(get_current_username)],
 ) -> BlocRead:
-    db_bloc = session.get(Bloc, bloc_id)
+    db_bloc = await session.get(Bloc, bloc_id)
     verify_exists_and_owns(current_user, db_bloc)
 
-    bloc_data = bloc.model_dump(exclude_unset=True)
-    if bloc_data.get("category"):
-        bloc_data["category_id"] = bloc_data.get("category").get("id")
-        bloc_data.pop("category")
-
-    if bloc_data.get("cdate"):
-        bloc_data["cdate"] = parse_str_or_date_to_date(bloc_data.get("cdate"))
-
+    bloc_data = bloc_update_values(bloc)
     for key, value in bloc_data.items():
         setattr(db_bloc, key, value)
 
     session.add(db_bloc)
-    session.commit()
-    session.refresh(db_bloc)
+    await session.commit()
+    await session.refresh(db_bloc, ["category", "result"])
     return BlocRead.serialize(db_bloc)
 
 
@@ -125,11 +276,11 @@ async def delete_bloc(
     bloc_id: int,
     current_user: Annotated[str, Depends(get_current_username)],
 ) -> dict:
-    db_bloc = session.get(Bloc, bloc_id)
+    db_bloc = await session.get(Bloc, bloc_id)
     verify_exists_and_owns(current_user, db_bloc)
 
-    session.delete(db_bloc)
-    session.commit()
+    await session.delete(db_bloc)
+    await session.commit()
     return {}
 
 
@@ -137,20 +288,20 @@ async def delete_bloc(
 async def put_bloc_result(
     bloc_id: int,
     result: BlocResultBase,
-    session: SessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
 ) -> BlocResultRead:
     # Used for POST and PUT, as I ensure the frontend always sends the full object
 
-    db_bloc = session.get(Bloc, bloc_id)
-    verify_exists_and_owns(current_user, db_bloc)
+    async def write(session):
+        db_bloc = await session.get(Bloc, bloc_id, options=[selectinload(Bloc.result)])
+        verify_exists_and_owns(current_user, db_bloc)
 
-    new_result = BlocResult(key=result.key, value=result.value, comment=result.comment)
-    session.add(new_result)
-    db_bloc.result = new_result
+        new_result = BlocResult(key=result.key, value=result.value, comment=result.comment)
+        session.add(new_result)
+        db_bloc.result = new_result
+        return new_result
 
-    session.commit()
-    session.refresh(db_bloc)
+    new_result = await submit_write(current_user, write)
     return BlocResultRead.serialize(new_result)
 
 
@@ -160,13 +311,13 @@ async def delete_bloc_result(
     session: SessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
 ) -> dict:
-    db_bloc = session.get(Bloc, bloc_id)
+    db_bloc = await session.get(Bloc, bloc_id, options=[selectinload(Bloc.result)])
     verify_exists_and_owns(current_user, db_bloc)
 
     if not db_bloc.result:
         raise HTTPException(status_code=404, detail="The resource does not exist")
 
-    session.delete(db_bloc.result)
+    await session.delete(db_bloc.result)
     db_bloc.result = None
-    session.commit()
+    await session.commit()
     return {}
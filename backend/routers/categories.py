@@ -3,36 +3,38 @@ from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import func, select
 
-from ..deps import SessionDep, get_current_username
+from ..deps import ReadSessionDep, SessionDep, check_etag, get_current_username
 from ..models.models import (
+    Bloc,
     BlocCategory,
     BlocCategoryCreate,
     BlocCategoryUpdate,
     BlocCategoryRead,
+    ProgramStepBloc,
 )
 from ..security import verify_exists_and_owns
 
 router = APIRouter(prefix="/api/categories", tags=["categories"])
 
 
-@router.get("", response_model=list[BlocCategoryRead])
-def get_categories(
-    session: SessionDep, current_user: Annotated[str, Depends(get_current_username)]
+@router.get("", response_model=list[BlocCategoryRead], dependencies=[Depends(check_etag)])
+async def get_categories(
+    session: ReadSessionDep, current_user: Annotated[str, Depends(get_current_username)]
 ) -> list[BlocCategoryRead]:
-    categories = session.exec(select(BlocCategory).filter(BlocCategory.user == current_user))
+    categories = await session.exec(select(BlocCategory).filter(BlocCategory.user == current_user))
     return [BlocCategoryRead.serialize(category) for category in categories]
 
 
 @router.post("", response_model=BlocCategoryRead)
-def post_category(
+async def post_category(
     category: BlocCategoryCreate,
     session: SessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
 ) -> BlocCategoryRead:
     weight = category.weight
     if weight is None:
-        max_weight = session.exec(
-            select(func.max(BlocCategory.weight)).where(BlocCategory.user == current_user)
+        max_weight = (
+            await session.exec(select(func.max(BlocCategory.weight)).where(BlocCategory.user == current_user))
         ).one()
         weight = (max_weight or 0) + 1
 
@@ -43,19 +45,19 @@ def post_category(
         user=current_user,
     )
     session.add(new_category)
-    session.commit()
-    session.refresh(new_category)
+    await session.commit()
+    await session.refresh(new_category)
     return BlocCategoryRead.serialize(new_category)
 
 
 @router.put("/{category_id}", response_model=BlocCategoryRead)
-def put_category(
+async def put_category(
     session: SessionDep,
     category_id: int,
     category: BlocCategoryUpdate,
     current_user: Annotated[str, Depends(get_current_username)],
 ) -> BlocCategoryRead:
-    db_category = session.get(BlocCategory, category_id)
+    db_category = await session.get(BlocCategory, category_id)
     verify_exists_and_owns(current_user, db_category)
 
     category_data = category.model_dump(exclude_unset=True)
@@ -63,34 +65,41 @@ def put_category(
         setattr(db_category, key, value)
 
     session.add(db_category)
-    session.commit()
-    session.refresh(db_category)
+    await session.commit()
+    await session.refresh(db_category)
     return BlocCategoryRead.serialize(db_category)
 
 
 @router.delete("/{category_id}")
-def delete_category(
+async def delete_category(
     session: SessionDep,
     category_id: int,
     current_user: Annotated[str, Depends(get_current_username)],
 ) -> dict:
-    db_category = session.get(BlocCategory, category_id)
+    db_category = await session.get(BlocCategory, category_id)
     verify_exists_and_owns(current_user, db_category)
 
-    if get_category_blocs_cnt(session, category_id, current_user) > 0:
+    if await get_category_blocs_cnt(session, category_id, current_user) > 0:
         raise HTTPException(status_code=409, detail="The resource already exists")
 
-    session.delete(db_category)
-    session.commit()
+    await session.delete(db_category)
+    await session.commit()
     return {}
 
 
-@router.get("/{category_id}/count")
-def get_category_blocs_cnt(
-    session: SessionDep,
+@router.get("/{category_id}/count", dependencies=[Depends(check_etag)])
+async def get_category_blocs_cnt(
+    session: ReadSessionDep,
     category_id: int,
     current_user: Annotated[str, Depends(get_current_username)],
 ) -> int:
-    db_category = session.get(BlocCategory, category_id)
+    db_category = await session.get(BlocCategory, category_id)
     verify_exists_and_owns(current_user, db_category)
-    return len(db_category.blocs) + len(db_category.programblocs)
+
+    blocs = select(func.count(Bloc.id)).where(Bloc.category_id == category_id).scalar_subquery()
+    programblocs = (
+        select(func.count(ProgramStepBloc.id))
+        .where(ProgramStepBloc.category_id == category_id)
+        .scalar_subquery()
+    )
+    return (await session.exec(select(blocs + programblocs))).one()
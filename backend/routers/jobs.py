@@ -0,0 +1,42 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends
+from sqlmodel import select
+
+from ..deps import CatalogReadSessionDep, get_current_username
+from ..jobs import job_runner
+from ..models.models import Job, JobRead
+from ..security import verify_exists_and_owns
+
+router = APIRouter(prefix="/api/jobs", tags=["jobs"])
+
+
+@router.get("", response_model=list[JobRead])
+async def get_jobs(
+    session: CatalogReadSessionDep,
+    current_user: Annotated[str, Depends(get_current_username)],
+    limit: int = 20,
+) -> list[JobRead]:
+    jobs = await session.exec(
+        select(Job).where(Job.user == current_user).order_by(Job.id.desc()).limit(min(limit, 100))
+    )
+    return [JobRead.serialize(job) for job in jobs]
+
+
+@router.get("/{job_id}", response_model=JobRead)
+async def get_job(
+    session: CatalogReadSessionDep, job_id: int, current_user: Annotated[str, Depends(get_current_username)]
+) -> JobRead:
+    job = await session.get(Job, job_id)
+    verify_exists_and_owns(current_user, job)
+    return JobRead.serialize(job)
+
+
+@router.delete("/{job_id}", response_model=JobRead)
+async def cancel_job(
+    session: CatalogReadSessionDep, job_id: int, current_user: Annotated[str, Depends(get_current_username)]
+) -> JobRead:
+    job = await session.get(Job, job_id)
+    verify_exists_and_owns(current_user, job)
+
+    return JobRead.serialize(await job_runner.cancel(job))
@@ -5,7 +5,8 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import selectinload
 from sqlmodel import select
 
-from ..deps import SessionDep, get_current_username
+from ..db.writer import submit_write
+from ..deps import ReadSessionDep, SessionDep, check_etag, get_current_username
 from ..models.models import (
     PR,
     PRCreate,
@@ -23,16 +24,16 @@ from ..utils.logging import app_logger
 router = APIRouter(prefix="/api/pr", tags=["pr"])
 
 
-@router.get("", response_model=list[PRRead])
-def get_prs(
-    session: SessionDep, current_user: Annotated[str, Depends(get_current_username)]
+@router.get("", response_model=list[PRRead], dependencies=[Depends(check_etag)])
+async def get_prs(
+    session: ReadSessionDep, current_user: Annotated[str, Depends(get_current_username)]
 ) -> list[PRRead]:
-    prs = session.exec(select(PR).where(PR.user == current_user).options(selectinload(PR.values)))
+    prs = await session.exec(select(PR).where(PR.user == current_user).options(selectinload(PR.values)))
     return [PRRead.serialize(pr) for pr in prs]
 
 
 @router.post("", response_model=PRRead)
-def post_pr(
+async def post_pr(
     pr_data: PRCreate,
     session: SessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
@@ -63,19 +64,19 @@ def post_pr(
         new_pr.values = pr_values
 
     session.add(new_pr)
-    session.commit()
-    session.refresh(new_pr)
+    await session.commit()
+    await session.refresh(new_pr, ["values"])
     return PRRead.serialize(new_pr)
 
 
 @router.put("/{pr_id}", response_model=PRRead)
-def put_pr(
+async def put_pr(
     pr_id: int,
     pr_data: PRUpdate,
     session: SessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
 ) -> PRRead:
-    db_pr = session.get(PR, pr_id)
+    db_pr = await session.get(PR, pr_id)
     verify_exists_and_owns(current_user, db_pr)
 
     pr_data = pr_data.model_dump(exclude_unset=True)
@@ -87,82 +88,85 @@ def put_pr(
         setattr(db_pr, key, value)
 
     session.add(db_pr)
-    session.commit()
-    session.refresh(db_pr)
+    await session.commit()
+    await session.refresh(db_pr, ["values"])
     return PRRead.serialize(db_pr)
 
 
 @router.delete("/{pr_id}")
-def delete_pr(
+async def delete_pr(
     pr_id: int,
     session: SessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
 ) -> dict:
-    db_pr = session.get(PR, pr_id)
+    db_pr = await session.get(PR, pr_id)
     verify_exists_and_owns(current_user, db_pr)
-    session.delete(db_pr)
-    session.commit()
+    await session.delete(db_pr)
+    await session.commit()
     return {}
 
 
 @router.post("/{pr_id}/values", response_model=list[PRValueRead])
-def post_pr_value(
+async def post_pr_value(
     pr_id: int,
     value_data: PRValueCreateOrUpdate | list[PRValueCreateOrUpdate],
-    session: SessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
 ) -> list[PRValueRead]:
-    db_pr = session.get(PR, pr_id)
-    verify_exists_and_owns(current_user, db_pr)
-
     if not isinstance(value_data, list):
         value_data = [value_data]
 
-    values = []
-    for value in value_data:
-        try:
-            parsed_date = parse_str_or_date_to_date(value.cdate)
-            if parsed_date > date.today():
-                app_logger.error(f"[post_pr_value][{current_user}] PR Value cannot be in the future")
-                raise HTTPException(status_code=400, detail="Bad request")
-
-            if not PRValueCreateOrUpdate.value_matches_record_key(db_pr.key, value.value):
-                app_logger.error(f"[post_pr_value][{current_user}] Invalid value for PR")
-                raise HTTPException(status_code=400, detail="Bad request")
+    async def write(session):
+        db_pr = await session.get(PR, pr_id)
+        verify_exists_and_owns(current_user, db_pr)
 
-            existing_value = session.exec(
-                select(PRValue).where(PRValue.pr_id == pr_id, PRValue.cdate == parsed_date)
-            ).first()
-            if existing_value:
-                raise HTTPException(status_code=409, detail="The resource already exists")
-
-            new_pr_value = PRValue(value=value.value, cdate=parsed_date, pr=db_pr)
-        except Exception as exc:
-            app_logger.error(f"[post_pr_value][{current_user}] Exception during parsing: {exc}")
-            raise HTTPException(
-                status_code=500,
-                detail="Roses are red, violets are blue, if you're reading this, I'm sorry for you",
-            )
+        values = []
+        for value in value_data:
+            try:
+                parsed_date = parse_str_or_date_to_date(value.cdate)
+                if parsed_date > date.today():
+                    app_logger.error(f"[post_pr_value][{current_user}] PR Value cannot be in the future")
+                    raise HTTPException(status_code=400, detail="Bad request")
 
-        session.add(new_pr_value)
-        values.append(new_pr_value)
+                if not PRValueCreateOrUpdate.value_matches_record_key(db_pr.key, value.value):
+                    app_logger.error(f"[post_pr_value][{current_user}] Invalid value for PR")
+                    raise HTTPException(status_code=400, detail="Bad request")
 
-    session.commit()
+                existing_value = (
+                    await session.exec(
+                        select(PRValue).where(PRValue.pr_id == pr_id, PRValue.cdate == parsed_date)
+                    )
+                ).first()
+                if existing_value:
+                    raise HTTPException(status_code=409, detail="The resource already exists")
+
+                new_pr_value = PRValue(value=value.value, cdate=parsed_date, pr_id=db_pr.id)
+            except Exception as exc:
+                app_logger.error(f"[post_pr_value][{current_user}] Exception during parsing: {exc}")
+                raise HTTPException(
+                    status_code=500,
+                    detail="Roses are red, violets are blue, if you're reading this, I'm sorry for you",
+                )
+
+            session.add(new_pr_value)
+            values.append(new_pr_value)
+        return values
+
+    values = await submit_write(current_user, write)
     return [PRValueRead.serialize(v) for v in values]
 
 
 @router.put("/{pr_id}/value/{value_id}", response_model=PRValueRead)
-def put_pr_value(
+async def put_pr_value(
     pr_id: int,
     value_id: int,
     value_data: PRValueCreateOrUpdate,
     session: SessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
 ) -> PRValueRead:
-    db_pr = session.get(PR, pr_id)
+    db_pr = await session.get(PR, pr_id)
     verify_exists_and_owns(current_user, db_pr)
 
-    db_pr_value = session.get(PRValue, value_id)
+    db_pr_value = await session.get(PRValue, value_id)
     if not db_pr_value:
         raise HTTPException(status_code=404, detail="The resource does not exist")
 
@@ -179,11 +183,13 @@ def put_pr_value(
     # Ensure that cdate string is converted to date obj
     if "cdate" in value_data:
         parsed_date = parse_str_or_date_to_date(value_data["cdate"])
-        existing_value = session.exec(
-            select(PRValue).where(
-                PRValue.pr_id == pr_id,
-                PRValue.cdate == parsed_date,
-                PRValue.id != value_id,
+        existing_value = (
+            await session.exec(
+                select(PRValue).where(
+                    PRValue.pr_id == pr_id,
+                    PRValue.cdate == parsed_date,
+                    PRValue.id != value_id,
+                )
             )
         ).first()
         if existing_value:
@@ -194,28 +200,28 @@ def put_pr_value(
         setattr(db_pr_value, key, value)
 
     session.add(db_pr_value)
-    session.commit()
-    session.refresh(db_pr_value)
+    await session.commit()
+    await session.refresh(db_pr_value)
     return PRValueRead.serialize(db_pr_value)
 
 
 @router.delete("/{pr_id}/value/{value_id}")
-def delete_pr_value(
+async def delete_pr_value(
     pr_id: int,
     value_id: int,
     session: SessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
 ) -> dict:
-    db_pr = session.get(PR, pr_id)
+    db_pr = await session.get(PR, pr_id)
     verify_exists_and_owns(current_user, db_pr)
 
-    db_pr_value = session.get(PRValue, value_id)
+    db_pr_value = await session.get(PRValue, value_id)
     if not db_pr_value:
         raise HTTPException(status_code=404, detail="The resource does not exist")
 
     if db_pr_value.pr_id != pr_id:
         raise HTTPException(status_code=400, detail="Bad request")
 
-    session.delete(db_pr_value)
-    session.commit()
+    await session.delete(db_pr_value)
+    await session.commit()
     return {}
@@ -1,4 +1,5 @@
 import json
+from pathlib import Path
 from typing import Annotated
 
 from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
@@ -6,10 +7,13 @@ from pydantic import ValidationError
 from sqlalchemy.orm import selectinload
 from sqlmodel import select
 
-from ..deps import SessionDep, get_current_username
+from ..db.shards import user_session
+from ..deps import ReadSessionDep, SessionDep, check_etag, get_current_username
+from ..jobs import JobContext, job_handler, job_runner
 from ..models.models import (
     BlocCategory,
     Image,
+    JobRead,
     Program,
     ProgramCreate,
     ProgramRead,
@@ -26,32 +30,39 @@ from ..models.models import (
     ProgramUpdate,
 )
 from ..security import verify_exists_and_owns
-from ..utils.file import remove_image, save_image, read_image
+from ..utils.file import read_image, remove_image, save_image, upload_f_to_tempfile
 from ..utils.logging import app_logger
 from ..utils.misc import b64img_decode, b64e
 
 router = APIRouter(prefix="/api/programs", tags=["programs"])
 
 
-@router.post("/upload")
+@job_handler("program_upload")
+async def upload_program_job(job: JobContext) -> dict:
+    async with user_session(job.username) as session:
+        try:
+            data = json.loads(Path(job.input).read_bytes())
+            new_program = await import_program(session, job.username, data)
+        except Exception as exc:
+            app_logger.error(f"[upload_program][{job.username}] An error occured: {exc}")
+            job.fail("400")
+
+        await session.commit()
+        await session.refresh(new_program, ["image", "steps"])
+        return ProgramRead.serialize(new_program).model_dump(mode="json")
+
+
+@router.post("/upload", status_code=202, response_model=JobRead)
 async def upload_program(
-    session: SessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
     file: UploadFile = File(...),
-) -> ProgramRead:
+) -> JobRead:
     if file.content_type != "application/json":
         raise HTTPException(status_code=415, detail="Resource format not supported")
 
-    try:
-        content = await file.read()
-        data = json.loads(content)
-        new_program = await import_program(session, current_user, data)
-    except Exception as exc:
-        app_logger.error(f"[upload_program][{current_user}] An error occured: {exc}")
-        raise HTTPException(status_code=400, detail="400")
-
-    session.commit()
-    return ProgramRead.serialize(new_program)
+    # The program, once imported, is the job's result
+    job = await job_runner.submit(current_user, "program_upload", await upload_f_to_tempfile(file))
+    return JobRead.serialize(job)
 
 
 async def import_program(session, current_user, data) -> Program:
@@ -75,12 +86,12 @@ async def import_program(session, current_user, data) -> Program:
 
         image = Image(filename=filename, user=current_user)
         session.add(image)
-        session.commit()
-        session.refresh(image)
+        await session.commit()
+        await session.refresh(image)
         new_program.image_id = image.id
 
     session.add(new_program)
-    session.flush()
+    await session.flush()
 
     for step in data.get("steps", []):
         new_step = ProgramStep(
@@ -90,13 +101,15 @@ async def import_program(session, current_user, data) -> Program:
             user=current_user,
         )
         session.add(new_step)
-        session.flush()
+        await session.flush()
 
         for bloc in step.get("blocs", []):
             bloc_category_name = bloc.get("category", {}).get("name")
-            category = session.exec(
-                select(BlocCategory).filter(
-                    BlocCategory.user == current_user, BlocCategory.name == bloc_category_name
+            category = (
+                await session.exec(
+                    select(BlocCategory).filter(
+                        BlocCategory.user == current_user, BlocCategory.name == bloc_category_name
+                    )
                 )
             ).first()
             if not category:
@@ -118,29 +131,41 @@ async def import_program(session, current_user, data) -> Program:
 @router.get("/{program_id}/export")
 async def export_program(
     program_id: int,
-    session: SessionDep,
+    session: ReadSessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
 ):
-    db_program = session.exec(
-        select(Program)
-        .where(Program.id == program_id, Program.user == current_user)
-        .options(selectinload(Program.steps))
+    db_program = (
+        await session.exec(
+            select(Program)
+            .where(Program.id == program_id, Program.user == current_user)
+            .options(
+                selectinload(Program.steps)
+                .selectinload(ProgramStep.blocs)
+                .selectinload(ProgramStepBloc.category)
+            )
+        )
     ).first()
     if not db_program:
         raise HTTPException(status_code=404, detail="The resource does not exist")
 
     data = db_program.dict()  # Use dict() instead of serialize to get a dict
     data["steps"] = [ProgramStepWithBlocsRead.serialize(step) for step in db_program.steps]
-    im = session.exec(select(Image).where(Image.user == current_user, Image.id == data["image_id"])).first()
+    im = (
+        await session.exec(select(Image).where(Image.user == current_user, Image.id == data["image_id"]))
+    ).first()
     data["image"] = b64e(await read_image(im.filename))
     return data
 
 
-@router.get("", response_model=list[ProgramRead])
+@router.get("", response_model=list[ProgramRead], dependencies=[Depends(check_etag)])
 async def get_programs(
-    session: SessionDep, current_user: Annotated[str, Depends(get_current_username)]
+    session: ReadSessionDep, current_user: Annotated[str, Depends(get_current_username)]
 ) -> list[ProgramRead]:
-    programs = session.exec(select(Program).filter(Program.user == current_user))
+    programs = await session.exec(
+        select(Program)
+        .filter(Program.user == current_user)
+        .options(selectinload(Program.image), selectinload(Program.steps))
+    )
     return [ProgramRead.serialize(program) for program in programs]
 
 
@@ -153,7 +178,7 @@ async def post_program(
     new_program = Program(name=program_data.name, user=current_user)
 
     if program_data.image_id:
-        db_img = session.get(Image, program_data.image_id)
+        db_img = await session.get(Image, program_data.image_id)
         verify_exists_and_owns(current_user, db_img)
         new_program.image_id = db_img.id
 
@@ -166,13 +191,13 @@ async def post_program(
 
         image = Image(filename=filename, user=current_user)
         session.add(image)
-        session.commit()
-        session.refresh(image)
+        await session.commit()
+        await session.refresh(image)
         new_program.image_id = image.id
 
     session.add(new_program)
-    session.commit()
-    session.refresh(new_program)
+    await session.commit()
+    await session.refresh(new_program, ["image", "steps"])
     return ProgramRead.serialize(new_program)
 
 
@@ -183,7 +208,7 @@ async def put_program(
     session: SessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
 ) -> ProgramRead:
-    db_program = session.get(Program, program_id)
+    db_program = await session.get(Program, program_id)
     verify_exists_and_owns(current_user, db_program)
 
     program_data = program.model_dump(exclude_unset=True)
@@ -192,7 +217,7 @@ async def put_program(
     if (
         program_data.get("image_id") and program.image_id != db_program.image_id
     ):  # If image_id and image_id is different as the one in DB
-        db_img = session.get(Image, program.image_id)
+        db_img = await session.get(Image, program.image_id)
         verify_exists_and_owns(current_user, db_img)
         program_data.pop("image", None)  # Ensure consistency
         remove_previous_image = True
@@ -206,49 +231,51 @@ async def put_program(
 
         image = Image(filename=filename, user=current_user)
         session.add(image)
-        session.commit()
-        session.refresh(image)
+        await session.commit()
+        await session.refresh(image)
 
         remove_previous_image = True
         program_data.pop("image")
         program_data["image_id"] = image.id
 
     if remove_previous_image and db_program.image_id:
-        old_image = session.get(Image, db_program.image_id)
+        old_image = await session.get(Image, db_program.image_id, options=[selectinload(Image.programs)])
 
         if old_image and len(old_image.programs) == 1:
             try:
                 remove_image(old_image.filename)
-                session.delete(old_image)
+                await session.delete(old_image)
             except Exception as exc:
                 app_logger.error(
                     f"[put_program][{current_user}] Exception during previous image deletion: {exc}"
                 )
 
-    session.refresh(db_program)
+    await session.refresh(db_program)
 
     for key, value in program_data.items():
         setattr(db_program, key, value)
 
     session.add(db_program)
-    session.commit()
-    session.refresh(db_program)
+    await session.commit()
+    await session.refresh(db_program, ["image", "steps"])
     return ProgramRead.serialize(db_program)
 
 
 @router.delete("/{program_id}")
-def delete_program(
+async def delete_program(
     program_id: int,
     session: SessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
 ) -> dict:
-    db_program = session.get(Program, program_id)
+    db_program = await session.get(
+        Program, program_id, options=[selectinload(Program.image).selectinload(Image.programs)]
+    )
     verify_exists_and_owns(current_user, db_program)
 
     if db_program.image and len(db_program.image.programs) == 1:
         try:
             remove_image(db_program.image.filename)
-            session.delete(db_program.image)
+            await session.delete(db_program.image)
         except Exception as exc:
             app_logger.error(f"[delete_program][{current_user}] Exception during image deletion: {exc}")
             raise HTTPException(
@@ -256,42 +283,57 @@ def delete_program(
                 detail="Roses are red, violets are blue, if you're reading this, I'm sorry for you",
             )
 
-    session.delete(db_program)
-    session.commit()
+    await session.delete(db_program)
+    await session.commit()
     return {}
 
 
-@router.get("/{program_id}", response_model=ProgramReadComplete)
-def get_program(
+@router.get("/{program_id}", response_model=ProgramReadComplete, dependencies=[Depends(check_etag)])
+async def get_program(
     program_id: int,
-    session: SessionDep,
+    session: ReadSessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
 ) -> ProgramReadComplete:
-    db_program = session.get(Program, program_id)
+    db_program = await session.get(
+        Program,
+        program_id,
+        options=[
+            selectinload(Program.image),
+            selectinload(Program.steps)
+            .selectinload(ProgramStep.blocs)
+            .selectinload(ProgramStepBloc.category),
+        ],
+    )
     verify_exists_and_owns(current_user, db_program)
     return ProgramReadComplete.serialize(db_program)
 
 
-@router.get("/{program_id}/steps", response_model=list[ProgramStepWithBlocsRead])
-def get_program_steps(
+@router.get(
+    "/{program_id}/steps",
+    response_model=list[ProgramStepWithBlocsRead],
+    dependencies=[Depends(check_etag)],
+)
+async def get_program_steps(
     program_id: int,
-    session: SessionDep,
+    session: ReadSessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
 ) -> list[ProgramStepWithBlocsRead]:
-    steps = session.exec(
-        select(ProgramStep).filter(ProgramStep.user == current_user, ProgramStep.program_id == program_id)
+    steps = await session.exec(
+        select(ProgramStep)
+        .filter(ProgramStep.user == current_user, ProgramStep.program_id == program_id)
+        .options(selectinload(ProgramStep.blocs).selectinload(ProgramStepBloc.category))
     )
     return [ProgramStepWithBlocsRead.serialize(step) for step in steps]
 
 
 @router.post("/{program_id}/steps", response_model=ProgramStepRead)
-def post_program_step(
+async def post_program_step(
     program_id: int,
     step_data: ProgramStepCreate,
     session: SessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
 ) -> ProgramStepRead:
-    db_program = session.get(Program, program_id)
+    db_program = await session.get(Program, program_id)
     verify_exists_and_owns(current_user, db_program)
 
     new_step = ProgramStep(
@@ -301,23 +343,23 @@ def post_program_step(
         user=current_user,
     )
     session.add(new_step)
-    session.commit()
-    session.refresh(new_step)
+    await session.commit()
+    await session.refresh(new_step)
     return ProgramStepRead.serialize(new_step)
 
 
 @router.put("/{program_id}/steps/{step_id}", response_model=ProgramStepRead)
-def put_program_step(
+async def put_program_step(
     program_id: int,
     step_id: int,
     step_data: ProgramStepUpdate,
     session: SessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
 ) -> ProgramStepRead:
-    db_program = session.get(Program, program_id)
+    db_program = await session.get(Program, program_id)
     verify_exists_and_owns(current_user, db_program)
 
-    db_program_step = session.get(ProgramStep, step_id)
+    db_program_step = await session.get(ProgramStep, step_id)
     verify_exists_and_owns(current_user, db_program_step)
 
     if db_program_step.program_id != program_id:
@@ -328,44 +370,44 @@ def put_program_step(
         setattr(db_program_step, key, value)
 
     session.add(db_program_step)
-    session.commit()
-    session.refresh(db_program_step)
+    await session.commit()
+    await session.refresh(db_program_step)
     return ProgramStepRead.serialize(db_program_step)
 
 
 @router.delete("/{program_id}/steps/{step_id}")
-def delete_program_step(
+async def delete_program_step(
     program_id: int,
     step_id: int,
     session: SessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
 ) -> dict:
-    db_program = session.get(Program, program_id)
+    db_program = await session.get(Program, program_id)
     verify_exists_and_owns(current_user, db_program)
 
-    db_program_step = session.get(ProgramStep, step_id)
+    db_program_step = await session.get(ProgramStep, step_id)
     verify_exists_and_owns(current_user, db_program_step)
 
     if db_program_step.program_id != program_id:
         raise HTTPException(status_code=400, detail="Bad request")
 
-    session.delete(db_program_step)
-    session.commit()
+    await session.delete(db_program_step)
+    await session.commit()
     return {}
 
 
 @router.post("/{program_id}/steps/{step_id}/blocs", response_model=ProgramStepBlocRead)
-def post_program_step_bloc(
+async def post_program_step_bloc(
     program_id: int,
     step_id: int,
     bloc_data: ProgramStepBlocCreate,
     session: SessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
 ) -> ProgramStepBlocRead:
-    db_program = session.get(Program, program_id)
+    db_program = await session.get(Program, program_id)
     verify_exists_and_owns(current_user, db_program)
 
-    db_program_step = session.get(ProgramStep, step_id)
+    db_program_step = await session.get(ProgramStep, step_id)
     verify_exists_and_owns(current_user, db_program_step)
 
     if db_program_step.program_id != program_id:
@@ -392,7 +434,8 @@ def post_program_step_bloc(
         new_bloc.category_id = bloc_data.category.id
 
     session.add(new_bloc)
-    session.commit()
+    await session.commit()
+    await session.refresh(new_bloc, ["category"])
     return ProgramStepBlocRead.serialize(new_bloc)
 
 
@@ -400,7 +443,7 @@ def post_program_step_bloc(
     "/{program_id}/steps/{step_id}/blocs/{bloc_id}",
     response_model=ProgramStepBlocRead,
 )
-def put_program_step_bloc(
+async def put_program_step_bloc(
     program_id: int,
     step_id: int,
     bloc_id: int,
@@ -408,16 +451,16 @@ def put_program_step_bloc(
     session: SessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
 ) -> ProgramStepBlocRead:
-    db_program = session.get(Program, program_id)
+    db_program = await session.get(Program, program_id)
     verify_exists_and_owns(current_user, db_program)
 
-    db_program_step = session.get(ProgramStep, step_id)
+    db_program_step = await session.get(ProgramStep, step_id)
     verify_exists_and_owns(current_user, db_program_step)
 
     if db_program_step.program_id != program_id:
         raise HTTPException(status_code=400, detail="Bad request")
 
-    db_program_step_bloc = session.get(ProgramStepBloc, bloc_id)
+    db_program_step_bloc = await session.get(ProgramStepBloc, bloc_id)
     verify_exists_and_owns(current_user, db_program_step_bloc)
 
     if db_program_step_bloc.program_step_id != step_id:
@@ -432,34 +475,34 @@ def put_program_step_bloc(
         setattr(db_program_step_bloc, key, value)
 
     session.add(db_program_step_bloc)
-    session.commit()
-    session.refresh(db_program_step_bloc)
+    await session.commit()
+    await session.refresh(db_program_step_bloc, ["category"])
     return ProgramStepBlocRead.serialize(db_program_step_bloc)
 
 
 @router.delete("/{program_id}/steps/{step_id}/blocs/{bloc_id}")
-def delete_program_step_bloc(
+async def delete_program_step_bloc(
     program_id: int,
     step_id: int,
     bloc_id: int,
     session: SessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
 ) -> dict:
-    db_program = session.get(Program, program_id)
+    db_program = await session.get(Program, program_id)
     verify_exists_and_owns(current_user, db_program)
 
-    db_program_step = session.get(ProgramStep, step_id)
+    db_program_step = await session.get(ProgramStep, step_id)
     verify_exists_and_owns(current_user, db_program_step)
 
     if db_program_step.program_id != program_id:
         raise HTTPException(status_code=400, detail="Bad request")
 
-    db_program_step_bloc = session.get(ProgramStepBloc, bloc_id)
+    db_program_step_bloc = await session.get(ProgramStepBloc, bloc_id)
     verify_exists_and_owns(current_user, db_program_step_bloc)
 
     if db_program_step_bloc.program_step_id != step_id:
         raise HTTPException(status_code=400, detail="Bad request")
 
-    session.delete(db_program_step_bloc)
-    session.commit()
+    await session.delete(db_program_step_bloc)
+    await session.commit()
     return {}
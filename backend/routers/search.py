@@ -0,0 +1,84 @@
+import html
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import text
+from sqlmodel import select
+
+from ..db.search import owner_token
+from ..deps import ReadSessionDep, check_etag, get_current_username
+from ..models.models import ProgramStep, ProgramStepBloc
+from ..utils.logging import app_logger
+
+router = APIRouter(prefix="/api/search", tags=["search"])
+
+
+# Snippet highlights, control characters that cannot be mistaken for markup once the snippet is escaped
+MARK_START, MARK_END = "\x02", "\x03"
+
+
+def fts_query(q: str, username: str) -> str:
+    # User input is never FTS5 syntax: every word becomes a quoted prefix term of the body, all of them must
+    # match. The owner term restricts the search to the user's documents within the index
+    terms = " ".join('body : "{}"*'.format(word.replace('"', '""')) for word in q.split())
+    return f"owner : {owner_token(username)} {terms}"
+
+
+def highlight(snippet: str) -> str:
+    # Indexed content is user input: escape it, only the highlights are markup
+    return html.escape(snippet).replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
+
+
+@router.get("", dependencies=[Depends(check_etag)])
+async def search(
+    session: ReadSessionDep,
+    current_user: Annotated[str, Depends(get_current_username)],
+    q: str,
+    limit: int = 20,
+    offset: int = 0,
+) -> list[dict]:
+    connection = await session.connection()
+    if connection.dialect.name != "sqlite":
+        app_logger.error(f"[search][{current_user}] Search requires SQLite")
+        raise HTTPException(status_code=501, detail="Search is not available")
+
+    if not q.strip():
+        return []
+
+    # The owner column does not weigh in the ranking
+    hits = await session.exec(
+        text(
+            "SELECT entity, entity_id, bm25(search_index, 1.0, 0.0) AS rank, "
+            "snippet(search_index, 0, :mark_start, :mark_end, '…', 16) AS snippet FROM search_index "
+            "WHERE search_index MATCH :query AND user = :user ORDER BY rank LIMIT :limit OFFSET :offset"
+        ),
+        params={
+            "query": fts_query(q, current_user),
+            "user": current_user,
+            "mark_start": MARK_START,
+            "mark_end": MARK_END,
+            "limit": min(limit, 100),
+            "offset": offset,
+        },
+    )
+    hits = [
+        {"entity": h.entity, "id": h.entity_id, "snippet": highlight(h.snippet), "rank": h.rank} for h in hits
+    ]
+
+    # Program blocs are shown within their program
+    program_bloc_ids = [h["id"] for h in hits if h["entity"] == "program_bloc"]
+    if program_bloc_ids:
+        programs = dict(
+            (
+                await session.exec(
+                    select(ProgramStepBloc.id, ProgramStep.program_id)
+                    .join(ProgramStep, ProgramStepBloc.program_step_id == ProgramStep.id)
+                    .where(ProgramStepBloc.id.in_(program_bloc_ids))
+                )
+            ).all()
+        )
+        for hit in hits:
+            if hit["entity"] == "program_bloc":
+                hit["program_id"] = programs.get(hit["id"])
+
+    return hits
@@ -6,8 +6,14 @@ from fastapi import APIRouter, Body, Depends, HTTPException
 from sqlmodel import select
 
 from .. import __version__
-from ..security import generate_mfa_secret, verify_mfa_code
-from ..deps import SessionDep, get_current_username
+from ..security import forget_api_token, generate_mfa_secret, hash_api_token, verify_mfa_code
+from ..deps import (
+    CatalogReadSessionDep,
+    CatalogSessionDep,
+    ReadSessionDep,
+    get_current_username,
+    invalidate_user,
+)
 from sqlalchemy.orm import selectinload
 from ..models.models import (
     Bloc,
@@ -30,19 +36,20 @@ router = APIRouter(prefix="/api/settings", tags=["settings"])
 
 @router.get("", response_model=UserRead)
 async def get_user_settings(
-    session: SessionDep, current_user: Annotated[str, Depends(get_current_username)]
+    session: CatalogReadSessionDep, current_user: Annotated[str, Depends(get_current_username)]
 ) -> UserRead:
-    db_user = session.get(User, current_user)
+    db_user = await session.get(User, current_user)
     return UserRead.serialize(db_user)
 
 
 @router.put("/export")
 async def export_user_data(
-    session: SessionDep,
+    session: ReadSessionDep,
+    catalog_session: CatalogReadSessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
     code: str = Body(..., embed=True),
 ):
-    db_user = session.get(User, current_user)
+    db_user = await catalog_session.get(User, current_user)
     if not db_user.mfa_enabled:
         raise HTTPException(status_code=400, detail="Enable MFA to export data")
 
@@ -54,24 +61,29 @@ async def export_user_data(
         "_": {"at": datetime.timestamp(datetime.now()), "version": __version__},
         "categories": [
             BlocCategoryRead.serialize(c)
-            for c in session.exec(select(BlocCategory).filter(BlocCategory.user == current_user))
+            for c in await session.exec(select(BlocCategory).filter(BlocCategory.user == current_user))
         ],
         "pr": [
             PRRead.serialize(pr)
-            for pr in session.exec(
+            for pr in await session.exec(
                 select(PR).where(PR.user == current_user).options(selectinload(PR.values))
             )
         ],
         "blocs": [
-            BlocRead.serialize(bloc) for bloc in session.exec(select(Bloc).filter(Bloc.user == current_user))
+            BlocRead.serialize(bloc)
+            for bloc in await session.exec(
+                select(Bloc)
+                .filter(Bloc.user == current_user)
+                .options(selectinload(Bloc.category), selectinload(Bloc.result))
+            )
         ],
         "programs": [
             await export_program(program.id, session, current_user)
-            for program in session.exec(select(Program).filter(Program.user == current_user))
+            for program in await session.exec(select(Program).filter(Program.user == current_user))
         ],
     }
 
-    hw_data = session.exec(
+    hw_data = await session.exec(
         select(HealthWatchData)
         .where(HealthWatchData.user == current_user)
         .order_by(HealthWatchData.cdate.desc())
@@ -82,42 +94,46 @@ async def export_user_data(
 
 
 @router.get("/checkversion")
-def check_version(session: SessionDep, current_user: Annotated[str, Depends(get_current_username)]):
+def check_version(current_user: Annotated[str, Depends(get_current_username)]):
     return check_update()
 
 
 @router.put("/api_token")
-def generate_user_api_token(
-    session: SessionDep, current_user: Annotated[str, Depends(get_current_username)]
+async def generate_user_api_token(
+    session: CatalogSessionDep, current_user: Annotated[str, Depends(get_current_username)]
 ) -> str:
-    db_user = session.get(User, current_user)
+    db_user = await session.get(User, current_user)
     if db_user.api_token:
         raise HTTPException(status_code=400, detail="Bad request")
 
+    # Only the digest is stored, the token is shown once
     token = generate_api_token()
-    setattr(db_user, "api_token", token)
+    setattr(db_user, "api_token", hash_api_token(token))
     session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
+    await session.commit()
+    await session.refresh(db_user)
     return token
 
 
 @router.delete("/api_token")
-def delete_user_api_token(session: SessionDep, current_user: Annotated[str, Depends(get_current_username)]):
-    db_user = session.get(User, current_user)
+async def delete_user_api_token(
+    session: CatalogSessionDep, current_user: Annotated[str, Depends(get_current_username)]
+):
+    db_user = await session.get(User, current_user)
     if not db_user.api_token:
         raise HTTPException(status_code=400, detail="Bad request")
 
+    forget_api_token(db_user.api_token)
     setattr(db_user, "api_token", None)
     session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
+    await session.commit()
+    await session.refresh(db_user)
     return {}
 
 
 @router.post("/mfa/enable")
-async def enable_mfa(session: SessionDep, current_user: Annotated[str, Depends(get_current_username)]):
-    db_user = session.get(User, current_user)
+async def enable_mfa(session: CatalogSessionDep, current_user: Annotated[str, Depends(get_current_username)]):
+    db_user = await session.get(User, current_user)
     if not db_user:
         raise HTTPException(status_code=404, detail="The resource does not exist")
 
@@ -127,7 +143,8 @@ async def enable_mfa(session: SessionDep, current_user: Annotated[str, Depends(g
     mfa_secret = generate_mfa_secret()
     db_user.mfa_secret = mfa_secret
     session.add(db_user)
-    session.commit()
+    await session.commit()
+    invalidate_user(current_user)
 
     totp = pyotp.TOTP(mfa_secret)
     uri = totp.provisioning_uri(name=db_user.username, issuer_name="Wingfit")
@@ -137,11 +154,11 @@ async def enable_mfa(session: SessionDep, current_user: Annotated[str, Depends(g
 
 @router.post("/mfa/verify")
 async def verify_mfa(
-    session: SessionDep,
+    session: CatalogSessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
     code: str = Body(..., embed=True),
 ):
-    db_user = session.get(User, current_user)
+    db_user = await session.get(User, current_user)
     if not db_user:
         raise HTTPException(status_code=404, detail="The resource does not exist")
 
@@ -152,23 +169,25 @@ async def verify_mfa(
     if not success:
         db_user.mfa_secret = None
         session.add(db_user)
-        session.commit()
+        await session.commit()
+        invalidate_user(current_user)
         raise HTTPException(status_code=403, detail="Invalid code")
 
     db_user.mfa_enabled = True
     session.add(db_user)
-    session.commit()
+    await session.commit()
+    invalidate_user(current_user)
 
     return {}
 
 
 @router.post("/mfa/disable")
 async def disable_mfa(
-    session: SessionDep,
+    session: CatalogSessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
     code: str = Body(..., embed=True),
 ):
-    db_user = session.get(User, current_user)
+    db_user = await session.get(User, current_user)
     if not db_user or not db_user.mfa_enabled or not db_user.mfa_secret:
         raise HTTPException(status_code=400, detail="Bad request")
 
@@ -180,6 +199,7 @@ async def disable_mfa(
     db_user.mfa_enabled = False
 
     session.add(db_user)
-    session.commit()
+    await session.commit()
+    invalidate_user(current_user)
 
     return {}
@@ -3,54 +3,60 @@ from typing import Annotated
 from fastapi import APIRouter, Depends, Header, HTTPException
 from sqlmodel import delete, select
 
-from ..deps import SessionDep, get_current_username
+from ..db.changes import record_bulk_changes
+from ..db.writer import submit_write
+from ..deps import CatalogReadSessionDep, ReadSessionDep, SessionDep, get_current_username
 from ..models.models import Stash, StashBase, StashRead
-from ..security import api_token_to_user, verify_exists_and_owns
+from ..security import api_token_to_username, verify_exists_and_owns
 
 router = APIRouter(prefix="/api/stash", tags=["stash"])
 
 
 @router.get("", response_model=list[StashRead])
-def get_stash(
-    session: SessionDep, current_user: Annotated[str, Depends(get_current_username)]
+async def get_stash(
+    session: ReadSessionDep, current_user: Annotated[str, Depends(get_current_username)]
 ) -> list[StashRead]:
-    stash = session.exec(select(Stash).filter(Stash.user == current_user))
+    stash = await session.exec(select(Stash).filter(Stash.user == current_user))
     return [StashRead.serialize(elem) for elem in stash]
 
 
 @router.post("")
-def post_stash(
+async def post_stash(
     stash_data: StashBase,
-    session: SessionDep,
+    catalog_session: CatalogReadSessionDep,
     X_Api_Token: Annotated[str | None, Header()] = None,
 ) -> dict:
-    user = api_token_to_user(session, X_Api_Token)
-    if not user:
+    username = await api_token_to_username(catalog_session, X_Api_Token)
+    if not username:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    new_stash = Stash(content=stash_data.content, user=user.username)
-    session.add(new_stash)
-    session.commit()
-    session.refresh(new_stash)
+    async def write(session):
+        session.add(Stash(content=stash_data.content, user=username))
+
+    await submit_write(username, write)
     return {}
 
 
 @router.delete("/{stash_id}")
-def delete_stash(
+async def delete_stash(
     session: SessionDep,
     stash_id: int,
     current_user: Annotated[str, Depends(get_current_username)],
 ) -> dict:
-    db_stash = session.get(Stash, stash_id)
+    db_stash = await session.get(Stash, stash_id)
     verify_exists_and_owns(current_user, db_stash)
 
-    session.delete(db_stash)
-    session.commit()
+    await session.delete(db_stash)
+    await session.commit()
     return {}
 
 
 @router.delete("")
-def empty_stash(session: SessionDep, current_user: Annotated[str, Depends(get_current_username)]) -> dict:
-    session.exec(delete(Stash).where(Stash.user == current_user))
-    session.commit()
+async def empty_stash(
+    session: SessionDep, current_user: Annotated[str, Depends(get_current_username)]
+) -> dict:
+    ids = (await session.exec(select(Stash.id).where(Stash.user == current_user))).all()
+    await session.exec(delete(Stash).where(Stash.user == current_user))
+    await record_bulk_changes(session, current_user, "stash", ids, "delete")
+    await session.commit()
     return {}
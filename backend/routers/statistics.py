@@ -1,36 +1,50 @@
-import csv
-import zipfile
 from datetime import datetime
 from pathlib import Path
-from typing import Annotated
+from typing import Annotated, Literal
 
 from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
 from sqlalchemy.orm import selectinload
 from sqlalchemy.sql import extract
-from sqlmodel import func, select
-
-from ..deps import SessionDep, get_current_username
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from ..analytics import get_health_analytics
+from ..config import settings
+from ..db.buckets import bucket_count, bucket_starts, bucket_totals, duration_buckets, iso_year_range
+from ..db.shards import user_session
+from ..deps import ReadSessionDep, check_etag, get_current_username
+from ..jobs import JobContext, job_handler, job_runner
 from ..models.models import (
     Bloc,
     BlocCategory,
     BlocRead,
     HealthWatchData,
     HealthWatchDataRead,
+    JobRead,
 )
 from ..utils.date import parse_str_or_date_to_date
 from ..utils.file import download_file, upload_f_to_tempfile
 from ..utils.logging import app_logger
+from ..whoop import check_whoop_archive, import_whoop_archive
 
 router = APIRouter(prefix="/api/stats", tags=["statistics"])
 
 
 @router.get("/notes", response_model=list[BlocRead])
-def get_blocs_note(session: SessionDep, current_user: Annotated[str, Depends(get_current_username)]) -> list:
-    category = session.exec(
-        select(BlocCategory)
-        .where(BlocCategory.user == current_user)
-        .where(BlocCategory.name == "note")
-        .options(selectinload(BlocCategory.blocs))
+async def get_blocs_note(
+    session: ReadSessionDep, current_user: Annotated[str, Depends(get_current_username)]
+) -> list:
+    category = (
+        await session.exec(
+            select(BlocCategory)
+            .where(BlocCategory.user == current_user)
+            .where(BlocCategory.name == "note")
+            .options(
+                selectinload(BlocCategory.blocs).options(
+                    selectinload(Bloc.result), selectinload(Bloc.category)
+                )
+            )
+        )
     ).one_or_none()
 
     if not category:
@@ -39,82 +53,82 @@ def get_blocs_note(session: SessionDep, current_user: Annotated[str, Depends(get
     return [BlocRead.serialize(c) for c in category.blocs]
 
 
-@router.get("/week_duration_total")
-def get_total_duration_per_week(
-    session: SessionDep,
-    current_user: Annotated[str, Depends(get_current_username)],
-    year: str | int | None = None,
-) -> list:
-    year = int(year) if year else datetime.now().year
-
-    query = (
-        select(
-            extract("week", Bloc.cdate).label("week"),
-            extract("year", Bloc.cdate).label("year"),
-            func.sum(Bloc.duration).label("duration"),
-        )
-        .where(Bloc.user == current_user)
-        .where(Bloc.duration.isnot(None))
-        .where(extract("year", Bloc.cdate) == year)
-        .group_by("year", "week")
+async def category_datasets(
+    session: AsyncSession, current_user: str, series: dict[int, list[int]]
+) -> list[dict]:
+    categories = await session.exec(
+        select(BlocCategory)
+        .where(BlocCategory.user == current_user, BlocCategory.id.in_(series))
+        .order_by(BlocCategory.weight)
     )
-
-    results = session.exec(query).all()
-    return [{"week": r.week, "duration": r.duration} for r in results]
+    return [
+        {
+            "label": category.name.upper(),
+            "order": category.weight,
+            "backgroundColor": category.color,
+            "data": series[category.id],
+        }
+        for category in categories
+    ]
 
 
-@router.get("/week_duration")
-def get_category_duration_per_week(
-    session: SessionDep,
+@router.get("/duration")
+async def get_duration_buckets(
+    session: ReadSessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
-    year: str | int | None = None,
-) -> list:
-    year = int(year) if year else datetime.now().year
+    start: str,
+    end: str,
+    unit: Literal["day", "week", "month", "quarter"] = "week",
+) -> dict:
+    start = parse_str_or_date_to_date(start)
+    end = parse_str_or_date_to_date(end)
+    if start > end:
+        app_logger.error(f"[get_duration_buckets][{current_user}] Specified dates are incoherent")
+        raise HTTPException(status_code=400, detail="Bad request")
 
-    query = (
-        select(
-            extract("week", Bloc.cdate).label("week"),
-            extract("year", Bloc.cdate).label("year"),
-            BlocCategory.name.label("category"),
-            func.sum(Bloc.duration).label("duration"),
-            BlocCategory.color.label("color"),
-            BlocCategory.weight.label("weight"),
-        )
-        .join(BlocCategory, Bloc.category_id == BlocCategory.id)
-        .where(Bloc.user == current_user)
-        .where(Bloc.duration.isnot(None))
-        .where(extract("year", Bloc.cdate) == year)
-        .group_by("year", "week", "category")
-    )
+    if bucket_count(start, end, unit) > settings.STATS_MAX_BUCKETS:
+        app_logger.error(f"[get_duration_buckets][{current_user}] Too many buckets requested")
+        raise HTTPException(status_code=400, detail="Bad request")
 
-    results = session.exec(query).all()
+    buckets = bucket_starts(start, end, unit)
+    series = await duration_buckets(session, current_user, unit, buckets)
+    return {
+        "buckets": buckets,
+        "total": bucket_totals(series, len(buckets)),
+        "datasets": await category_datasets(session, current_user, series),
+    }
 
-    category_data = {}
 
-    for r in results:
-        category_data.setdefault(
-            r.category,
-            {"color": r.color, "order": r.weight, "data": {w: 0 for w in range(0, 52)}},
-        )
+@router.get("/week_duration_total")
+async def get_total_duration_per_week(
+    session: ReadSessionDep,
+    current_user: Annotated[str, Depends(get_current_username)],
+    year: str | int | None = None,
+) -> list:
+    # ISO weeks of the ISO year, 52 or 53 of them
+    year = int(year) if year else datetime.now().isocalendar().year
+    buckets = bucket_starts(*iso_year_range(year), "week")
+    series = await duration_buckets(session, current_user, "week", buckets)
 
-        category_data[r.category]["data"][r.week] = r.duration
+    totals = bucket_totals(series, len(buckets))
+    return [{"week": week, "duration": duration} for week, duration in enumerate(totals, start=1)]
 
-    datasets = [
-        {
-            "label": category.upper(),
-            "order": category_data[category]["order"],
-            "backgroundColor": category_data[category]["color"],
-            "data": [category_data[category]["data"][week] for week in range(0, 52)],
-        }
-        for category in category_data
-    ]
 
-    return datasets
+@router.get("/week_duration")
+async def get_category_duration_per_week(
+    session: ReadSessionDep,
+    current_user: Annotated[str, Depends(get_current_username)],
+    year: str | int | None = None,
+) -> list:
+    year = int(year) if year else datetime.now().isocalendar().year
+    buckets = bucket_starts(*iso_year_range(year), "week")
+    series = await duration_buckets(session, current_user, "week", buckets)
+    return await category_datasets(session, current_user, series)
 
 
 @router.get("/healthwatch", response_model=list[HealthWatchDataRead])
-def get_hw_data(
-    session: SessionDep,
+async def get_hw_data(
+    session: ReadSessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
     year: str | int | None = None,
 ) -> list[HealthWatchDataRead]:
@@ -127,17 +141,51 @@ def get_hw_data(
         .order_by(HealthWatchData.cdate.desc())
     )
 
-    results = session.exec(query).all()
+    results = (await session.exec(query)).all()
     return [HealthWatchDataRead.serialize(r) for r in results]
 
 
-@router.post("/whoop_archive")
+@router.get("/health", dependencies=[Depends(check_etag)])
+async def get_health_analytics_summary(
+    session: ReadSessionDep,
+    current_user: Annotated[str, Depends(get_current_username)],
+    year: str | int | None = None,
+    latest_only: bool | None = None,
+) -> dict:
+    # Averages, quartiles, trailing 7-day means, z-scores and trends of the year's HealthWatch data.
+    # By default, the current year is limited to its latest days
+    current_year = datetime.now().year
+    year = int(year) if year else current_year
+    if latest_only is None:
+        latest_only = year == current_year
+
+    return await get_health_analytics(session, current_user, year, latest_only)
+
+
+@job_handler("whoop_archive")
+async def whoop_archive_job(job: JobContext) -> dict:
+    archive_path = job.input
+    if not archive_path:
+        # Whoop export link, downloaded by the job rather than by the request
+        archive_path = await download_file(job.params["link"])
+
+    try:
+        if not job.input:
+            check_whoop_archive(job.username, archive_path)
+        async with user_session(job.username) as session:
+            counts = await import_whoop_archive(session, job.username, archive_path, progress=job.progress)
+    finally:
+        if not job.input:
+            Path(archive_path).unlink(missing_ok=True)
+    return {"count": counts["inserted"], **counts}
+
+
+@router.post("/whoop_archive", status_code=202, response_model=JobRead)
 async def post_whoop_archive(
-    session: SessionDep,
     current_user: Annotated[str, Depends(get_current_username)],
     file: UploadFile | None = File(None),
     link: str | None = Form(None),
-):
+) -> JobRead:
     if not file and not link:
         app_logger.error(f"[post_whoop_archive][{current_user}] No link / file provided")
         raise HTTPException(status_code=400, detail="Bad request")
@@ -146,103 +194,17 @@ async def post_whoop_archive(
         app_logger.error(f"[post_whoop_archive][{current_user}] Whoop export URL looks incorrect")
         raise HTTPException(status_code=400, detail="Bad request")
 
-    temporary_fp = ""
-    if file:
-        temporary_fp = await upload_f_to_tempfile(file)
-    else:
-        temporary_fp = await download_file(link)
-
-    inserted = 0
-    with zipfile.ZipFile(temporary_fp, "r") as whoop_archive:
-        if "physiological_cycles.csv" not in whoop_archive.namelist():
-            app_logger.error(
-                f"[post_whoop_archive][{current_user}] physiological_cycles.csv is missing in archive"
-            )
-            raise HTTPException(status_code=400, detail="Bad request")
-
-        with whoop_archive.open("physiological_cycles.csv") as file:
-            reader = csv.reader((line.decode("utf-8") for line in file), delimiter=",")
-            next(reader)
-
-            existing_records = {
-                record.cdate: record
-                for record in session.exec(
-                    select(HealthWatchData).where(HealthWatchData.user == current_user)
-                ).all()
-            }  # {date: HealthWatchData}
-
-            for row in reader:
-                if (
-                    not row or not row[3] or not row[8]
-                ):  # Recovery or strain missing indicates the row is incomplete
-                    continue
-
-                # Use 'awake' datetime because 'cycle' datetimes are gapped if you sleep late or miss a night, not the best solution but a quickwin
-                date_value = parse_str_or_date_to_date(row[13].split(" ")[0])
-                if date_value in existing_records:
-                    existing_record = existing_records[date_value]
-
-                    if existing_record.recovery != row[3]:
-                        existing_record.recovery = row[3]
-                        updated = True
-                    if existing_record.strain != row[8]:
-                        existing_record.strain = row[8]
-                        updated = True
-                    if existing_record.resting_hr != row[4]:
-                        existing_record.resting_hr = row[4]
-                        updated = True
-                    if existing_record.hrv != row[5]:
-                        existing_record.hrv = row[5]
-                        updated = True
-                    if existing_record.temperature != row[6]:
-                        existing_record.temperature = row[6]
-                        updated = True
-                    if existing_record.oxy_level != row[7]:
-                        existing_record.oxy_level = row[7]
-                        updated = True
-                    if existing_record.sleep_score != row[14]:
-                        existing_record.sleep_score = row[14]
-                        updated = True
-                    if existing_record.sleep_duration_light != row[18]:
-                        existing_record.sleep_duration_light = row[18]
-                        updated = True
-                    if existing_record.sleep_duration_deep != row[19]:
-                        existing_record.sleep_duration_deep = row[19]
-                        updated = True
-                    if existing_record.sleep_duration_rem != row[20]:
-                        existing_record.sleep_duration_rem = row[20]
-                        updated = True
-                    if existing_record.sleep_duration_awake != row[21]:
-                        existing_record.sleep_duration_awake = row[21]
-                        updated = True
-                    if existing_record.sleep_efficiency != row[24]:
-                        existing_record.sleep_efficiency = row[24]
-                        updated = True
-
-                    if updated:
-                        session.add(existing_record)
-                    continue
-
-                new_whoop_data = HealthWatchData(
-                    cdate=date_value,
-                    user=current_user,
-                    recovery=row[3],
-                    strain=row[8],
-                    resting_hr=row[4],
-                    hrv=row[5],
-                    temperature=row[6],
-                    oxy_level=row[7],
-                    sleep_score=row[14],
-                    sleep_duration_light=row[18],
-                    sleep_duration_deep=row[19],
-                    sleep_duration_rem=row[20],
-                    sleep_duration_awake=row[21],
-                    sleep_efficiency=row[24],
-                )
-                session.add(new_whoop_data)
+    # The import runs in the background, GET /api/jobs/{id} reports it
+    if not file:
+        job = await job_runner.submit(current_user, "whoop_archive", params={"link": link})
+        return JobRead.serialize(job)
 
-        inserted = len(session.new)
-        session.commit()
-    Path(temporary_fp).unlink()
+    temporary_fp = await upload_f_to_tempfile(file)
+    try:
+        check_whoop_archive(current_user, temporary_fp)
+    except HTTPException:
+        Path(temporary_fp).unlink()
+        raise
 
-    return {"count": inserted}
+    job = await job_runner.submit(current_user, "whoop_archive", temporary_fp)
+    return JobRead.serialize(job)
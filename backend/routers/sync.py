@@ -0,0 +1,68 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import selectinload
+from sqlmodel import func, select
+
+from ..db.changes import ENTITIES, get_sync_floor
+from ..db.dialect import dialect_of
+from ..deps import ReadSessionDep, get_current_username
+from ..models.models import (
+    PR,
+    Bloc,
+    BlocRead,
+    ChangeLog,
+    PRRead,
+    Program,
+    ProgramRead,
+    StashRead,
+)
+
+router = APIRouter(prefix="/api/sync", tags=["sync"])
+
+LOADERS = {
+    "blocs": (BlocRead, [selectinload(Bloc.category), selectinload(Bloc.result)]),
+    "pr": (PRRead, [selectinload(PR.values)]),
+    "programs": (ProgramRead, [selectinload(Program.image), selectinload(Program.steps)]),
+    "stash": (StashRead, []),
+}
+
+
+@router.get("")
+async def get_changes(
+    session: ReadSessionDep, current_user: Annotated[str, Depends(get_current_username)], since: int = 0
+) -> dict:
+    # Rows changed after sequence `since` and the ids of deleted ones, since=0 returns everything.
+    # The returned `seq` is the `since` of the next call. `full` means the response holds everything: the
+    # cursor was older than the change log's retention, the client must replace its data.
+    # All reads share one snapshot, a concurrent write cannot land between them.
+    connection = await session.connection()
+    await connection.execute(dialect_of(connection).begin_snapshot())
+
+    if since and since < await get_sync_floor(session, current_user):
+        since = 0
+    seq = (await session.exec(select(func.max(ChangeLog.id)).where(ChangeLog.user == current_user))).one()
+    data = {"seq": seq or 0, "full": not since, "deleted": {}}
+
+    changed = {}
+    if since:
+        changes = await session.exec(
+            select(ChangeLog.entity, ChangeLog.entity_id)
+            .where(ChangeLog.user == current_user, ChangeLog.id > since, ChangeLog.id <= data["seq"])
+            .distinct()
+        )
+        for entity, entity_id in changes:
+            changed.setdefault(entity, set()).add(entity_id)
+
+    for entity, model in ENTITIES.items():
+        serializer, options = LOADERS[entity]
+        query = select(model).where(model.user == current_user).options(*options)
+        if since:
+            query = query.where(model.id.in_(changed.get(entity, ())))
+
+        rows = (await session.exec(query)).all()
+        data[entity] = [serializer.serialize(row) for row in rows]
+        # Whatever changed and no longer exists was deleted
+        data["deleted"][entity] = sorted(changed.get(entity, set()) - {row.id for row in rows})
+
+    return data
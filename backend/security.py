@@ -1,3 +1,7 @@
+import asyncio
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import UTC, datetime, timedelta
 
 import pyotp
@@ -5,13 +9,23 @@ import jwt
 from argon2 import PasswordHasher
 from argon2 import exceptions as argon_exceptions
 from fastapi import HTTPException
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from .config import settings
 from .models.models import Token, User
+from .utils.cache import TTLCache
 from .utils.logging import app_logger
 
-ph = PasswordHasher()
+ph = PasswordHasher(
+    time_cost=settings.ARGON2_TIME_COST,
+    memory_cost=settings.ARGON2_MEMORY_COST,
+    parallelism=settings.ARGON2_PARALLELISM,
+)
+# {token digest: username}, a burst on the stash ingestion path hits the catalog once.
+# forget_api_token only clears this worker's cache, other workers accept a revoked token for
+# API_TOKEN_CACHE_TTL at most, which stays short for that reason.
+api_token_cache = TTLCache(settings.API_TOKEN_CACHE_SIZE, settings.API_TOKEN_CACHE_TTL)
 
 
 def generate_mfa_secret() -> str:
@@ -23,13 +37,53 @@ def verify_mfa_code(secret: str, code: str) -> bool:
     return totp.verify(code)
 
 
-def hash_password(password: str) -> str:
-    return ph.hash(password)
+# Argon2 is CPU bound by design, it runs in a worker pool so a burst of logins queues instead of blocking
+# the event loop. Past HASH_MAX_PENDING queued operations, requests are rejected instead of piling up.
+_hash_pool: ProcessPoolExecutor | None = None
+_hash_pending = 0
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+def _get_hash_pool() -> ProcessPoolExecutor | None:
+    global _hash_pool
+    if _hash_pool is None and settings.HASH_WORKERS > 0:
+        # Forking would copy the event loop and aiosqlite's threads in whatever state they are
+        _hash_pool = ProcessPoolExecutor(
+            max_workers=settings.HASH_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _hash_pool
+
+
+def shutdown_hash_pool():
+    global _hash_pool
+    if _hash_pool:
+        _hash_pool.shutdown(cancel_futures=True)
+        _hash_pool = None
+
+
+async def _run_hasher(fn, *args):
+    global _hash_pending
+    if _hash_pending >= settings.HASH_MAX_PENDING:
+        app_logger.error("[hasher] Too many pending password operations")
+        raise HTTPException(status_code=503, detail="Server busy", headers={"Retry-After": "1"})
+
+    _hash_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_hash_pool(), fn, *args)
+    finally:
+        _hash_pending -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await _run_hasher(ph.hash, password)
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    return ph.check_needs_rehash(hashed_password)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
     try:
-        return ph.verify(hashed_password, plain_password)
+        return await _run_hasher(ph.verify, hashed_password, plain_password)
     except (
         argon_exceptions.VerifyMismatchError,
         argon_exceptions.VerificationError,
@@ -57,8 +111,8 @@ def create_tokens(data: dict) -> Token:
     return Token(access_token=create_access_token(data), refresh_token=create_refresh_token(data))
 
 
-async def ensure_superuser(session: Session, username: str) -> None:
-    user = session.get(User, username)
+async def ensure_superuser(session: AsyncSession, username: str) -> None:
+    user = await session.get(User, username)
     if not user.is_su:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
@@ -73,11 +127,30 @@ def verify_exists_and_owns(username: str, obj) -> None:
     return None
 
 
-def api_token_to_user(session: Session, api_token: str) -> User | None:
+def hash_api_token(api_token: str) -> str:
+    # API tokens are random UUIDs, a fast unsalted digest is enough and keeps the lookup indexable
+    return hashlib.sha256(api_token.encode()).hexdigest()
+
+
+def forget_api_token(digest: str | None):
+    if digest:
+        api_token_cache.pop(digest)
+
+
+async def api_token_to_username(session: AsyncSession, api_token: str) -> str | None:
     if not api_token:
         return None
 
-    user = session.exec(select(User).where(User.api_token == api_token)).first()
+    digest = hash_api_token(api_token)
+    username = api_token_cache.get(digest)
+    if username:
+        return username
+
+    user = (await session.exec(select(User).where(User.api_token == digest))).first()
     if not user:
         raise HTTPException(status_code=401, detail="Invalid Token")
-    return user
+    if not user.is_active:
+        raise HTTPException(status_code=401, detail="User is disabled")
+
+    api_token_cache.set(digest, user.username)
+    return user.username
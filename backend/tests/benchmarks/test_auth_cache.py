@@ -0,0 +1,31 @@
+import time
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from ... import deps
+from ...db.core import get_read_engine
+
+# get_current_username on every authenticated request: with warm caches (decoded token and user status
+# cached) against cold ones (JWT decoded and user read from the catalog every time).
+
+ITERATIONS = 2000
+
+
+def test_auth_warm_vs_cold_cache(client, user):
+    token = user["headers"]["Authorization"].removeprefix("Bearer ")
+
+    async def measure(cold: bool) -> float:
+        async with AsyncSession(get_read_engine()) as session:
+            await deps.get_current_username(token, session)
+            start = time.perf_counter()
+            for _ in range(ITERATIONS):
+                if cold:
+                    deps.jwt_cache.clear()
+                    deps.auth_cache.clear()
+                assert await deps.get_current_username(token, session) == user["username"]
+            return (time.perf_counter() - start) / ITERATIONS * 1e6
+
+    cold = client.portal.call(measure, True)
+    warm = client.portal.call(measure, False)
+    print(f"get_current_username: cold {cold:.1f} µs, warm {warm:.1f} µs, {cold / warm:.1f}x")
+    assert warm < cold / 2
@@ -0,0 +1,41 @@
+import time
+
+# POST /api/blocs with a 1k-bloc payload (one category check, one executemany) against the same blocs
+# posted one by one. Reports the time per bloc and the statements of the bulk request.
+
+BLOCS = 1000
+SINGLE = 100  # Blocs posted one by one, scaled to BLOCS
+
+
+def test_bulk_blocs_1k(client, user, count_queries):
+    headers = user["headers"]
+    category = client.get("/api/categories", headers=headers).json()[0]
+    blocs = [
+        {
+            "content": f"bloc {i}",
+            "duration": 10,
+            "cdate": f"2024-{i % 12 + 1:02d}-01",
+            "category_id": category["id"],
+        }
+        for i in range(BLOCS)
+    ]
+    client.post("/api/blocs", headers=headers, json=blocs[:1])  # Warms the auth caches
+
+    with count_queries() as queries:
+        start = time.perf_counter()
+        response = client.post("/api/blocs", headers=headers, json=blocs)
+        bulk = time.perf_counter() - start
+    assert response.status_code == 200, response.text
+    assert [bloc["content"] for bloc in response.json()] == [bloc["content"] for bloc in blocs]
+
+    start = time.perf_counter()
+    for bloc in blocs[:SINGLE]:
+        assert client.post("/api/blocs", headers=headers, json=bloc).status_code == 200
+    single = (time.perf_counter() - start) * BLOCS / SINGLE
+
+    print(
+        f"{BLOCS} blocs: bulk {bulk * 1e3:.0f} ms ({bulk / BLOCS * 1e6:.0f} µs/bloc,"
+        f" {queries.count} statements), one by one {single * 1e3:.0f} ms, {single / bulk:.1f}x"
+    )
+    assert queries.count < 20, "\n".join(queries.statements)
+    assert bulk < single / 5
@@ -0,0 +1,82 @@
+import asyncio
+import statistics
+import time
+
+from argon2 import PasswordHasher
+
+from ... import security
+from ...config import Settings, settings
+
+# Argon2 with the production costs: a burst of hashes inline on the event loop, then through the worker
+# pool with a growing number of processes (0 is the default thread pool).
+# Reports throughput, latency and the longest event loop stall during the burst.
+
+BURST = 16
+
+
+def production_hasher() -> PasswordHasher:
+    return PasswordHasher(
+        **{
+            cost: Settings.model_fields[f"ARGON2_{cost.upper()}"].default
+            for cost in ("time_cost", "memory_cost", "parallelism")
+        }
+    )
+
+
+async def burst(hash_one) -> dict:
+    stall = 0
+    running = True
+
+    async def ticker():
+        nonlocal stall
+        while running:
+            before = time.perf_counter()
+            await asyncio.sleep(0.001)
+            stall = max(stall, time.perf_counter() - before - 0.001)
+
+    async def timed():
+        start = time.perf_counter()
+        await hash_one()
+        return time.perf_counter() - start
+
+    ticking = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*[timed() for _ in range(BURST)])
+    elapsed = time.perf_counter() - start
+    running = False
+    await ticking
+
+    latencies.sort()
+    return {
+        "hashes/s": round(BURST / elapsed, 1),
+        "p50 ms": round(statistics.median(latencies) * 1000),
+        "p95 ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000),
+        "stall ms": round(stall * 1000),
+    }
+
+
+def test_hashing_throughput(monkeypatch):
+    monkeypatch.setattr(security, "ph", production_hasher())
+    monkeypatch.setattr(settings, "HASH_MAX_PENDING", BURST)
+
+    async def inline():
+        security.ph.hash("password")
+
+    results = {"inline": asyncio.run(burst(inline))}
+    for workers in (0, 1, 2, 4):
+        monkeypatch.setattr(settings, "HASH_WORKERS", workers)
+        security.shutdown_hash_pool()
+
+        async def pooled():
+            await asyncio.gather(*[security.hash_password("warmup") for _ in range(max(workers, 1))])
+            return await burst(lambda: security.hash_password("password"))
+
+        results[f"{workers} workers"] = asyncio.run(pooled())
+    security.shutdown_hash_pool()
+
+    for name, result in results.items():
+        print(f"{name:>10}: {result}")
+
+    # Inline hashing stalls the loop for the whole burst, the pool only for scheduling. Throughput grows with
+    # the workers up to the number of cores.
+    assert results["2 workers"]["stall ms"] < results["inline"]["stall ms"] / 10
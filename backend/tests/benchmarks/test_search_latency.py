@@ -0,0 +1,23 @@
+import statistics
+import time
+
+from ..conftest import requires_sqlite
+from ..test_search import WORDS, seed_blocs
+
+# GET /api/search over 1k blocs: median latency of one search per word
+
+LATENCY_BUDGET = 0.05  # s
+
+
+@requires_sqlite
+def test_search_latency_1k_blocs(client, user):
+    seed_blocs(client, user)
+    latencies = []
+    for word in WORDS:
+        start = time.perf_counter()
+        assert client.get(f"/api/search?q={word}", headers=user["headers"]).status_code == 200
+        latencies.append(time.perf_counter() - start)
+
+    median = statistics.median(latencies)
+    print(f"search over 1k blocs: median {median * 1e3:.1f} ms, max {max(latencies) * 1e3:.1f} ms")
+    assert median < LATENCY_BUDGET, latencies
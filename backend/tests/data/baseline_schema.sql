@@ -0,0 +1,141 @@
+-- Schema created by the release before versioned migrations (no schema_version table), see test_migrations.py
+
+CREATE TABLE user (
+	username VARCHAR NOT NULL,
+	password VARCHAR NOT NULL,
+	is_active BOOLEAN NOT NULL,
+	is_su BOOLEAN NOT NULL,
+	last_connect DATETIME,
+	api_token VARCHAR,
+	mfa_enabled BOOLEAN NOT NULL,
+	mfa_secret VARCHAR,
+	CONSTRAINT pk_user PRIMARY KEY (username)
+);
+
+CREATE TABLE blocresult (
+	value VARCHAR NOT NULL,
+	comment VARCHAR,
+	"key" VARCHAR(4) NOT NULL,
+	id INTEGER NOT NULL,
+	CONSTRAINT pk_blocresult PRIMARY KEY (id)
+);
+
+CREATE TABLE image (
+	filename VARCHAR NOT NULL,
+	id INTEGER NOT NULL,
+	user VARCHAR NOT NULL,
+	CONSTRAINT pk_image PRIMARY KEY (id),
+	CONSTRAINT fk_image_user_user FOREIGN KEY(user) REFERENCES user (username) ON DELETE CASCADE
+);
+
+CREATE TABLE stash (
+	content VARCHAR NOT NULL,
+	id INTEGER NOT NULL,
+	cdate DATE NOT NULL,
+	user VARCHAR NOT NULL,
+	CONSTRAINT pk_stash PRIMARY KEY (id),
+	CONSTRAINT fk_stash_user_user FOREIGN KEY(user) REFERENCES user (username) ON DELETE CASCADE
+);
+
+CREATE TABLE bloccategory (
+	name VARCHAR NOT NULL,
+	color VARCHAR NOT NULL,
+	weight INTEGER NOT NULL,
+	id INTEGER NOT NULL,
+	user VARCHAR NOT NULL,
+	CONSTRAINT pk_bloccategory PRIMARY KEY (id),
+	CONSTRAINT fk_bloccategory_user_user FOREIGN KEY(user) REFERENCES user (username) ON DELETE CASCADE
+);
+
+CREATE TABLE pr (
+	name VARCHAR NOT NULL,
+	"key" VARCHAR(4) NOT NULL,
+	id INTEGER NOT NULL,
+	user VARCHAR NOT NULL,
+	CONSTRAINT pk_pr PRIMARY KEY (id),
+	CONSTRAINT fk_pr_user_user FOREIGN KEY(user) REFERENCES user (username) ON DELETE CASCADE
+);
+
+CREATE TABLE healthwatchdata (
+	id INTEGER NOT NULL,
+	cdate DATE NOT NULL,
+	user VARCHAR NOT NULL,
+	recovery INTEGER NOT NULL,
+	resting_hr INTEGER NOT NULL,
+	hrv INTEGER NOT NULL,
+	temperature FLOAT NOT NULL,
+	oxy_level FLOAT NOT NULL,
+	strain FLOAT NOT NULL,
+	sleep_score INTEGER NOT NULL,
+	sleep_duration_light INTEGER NOT NULL,
+	sleep_duration_deep INTEGER NOT NULL,
+	sleep_duration_rem INTEGER NOT NULL,
+	sleep_duration_awake INTEGER NOT NULL,
+	sleep_efficiency INTEGER NOT NULL,
+	CONSTRAINT pk_healthwatchdata PRIMARY KEY (id),
+	CONSTRAINT fk_healthwatchdata_user_user FOREIGN KEY(user) REFERENCES user (username) ON DELETE CASCADE
+);
+
+CREATE INDEX ix_healthwatchdata_cdate ON healthwatchdata (cdate);
+
+CREATE TABLE bloc (
+	content VARCHAR NOT NULL,
+	duration INTEGER,
+	id INTEGER NOT NULL,
+	cdate DATE NOT NULL,
+	user VARCHAR NOT NULL,
+	result_id INTEGER,
+	category_id INTEGER NOT NULL,
+	CONSTRAINT pk_bloc PRIMARY KEY (id),
+	CONSTRAINT fk_bloc_user_user FOREIGN KEY(user) REFERENCES user (username) ON DELETE CASCADE,
+	CONSTRAINT fk_bloc_result_id_blocresult FOREIGN KEY(result_id) REFERENCES blocresult (id),
+	CONSTRAINT fk_bloc_category_id_bloccategory FOREIGN KEY(category_id) REFERENCES bloccategory (id) ON DELETE CASCADE
+);
+
+CREATE TABLE prvalue (
+	value VARCHAR NOT NULL,
+	id INTEGER NOT NULL,
+	cdate DATE NOT NULL,
+	pr_id INTEGER NOT NULL,
+	CONSTRAINT pk_prvalue PRIMARY KEY (id),
+	CONSTRAINT fk_prvalue_pr_id_pr FOREIGN KEY(pr_id) REFERENCES pr (id) ON DELETE CASCADE
+);
+
+CREATE TABLE program (
+	name VARCHAR NOT NULL,
+	description VARCHAR,
+	id INTEGER NOT NULL,
+	cdate DATE NOT NULL,
+	user VARCHAR NOT NULL,
+	image_id INTEGER,
+	CONSTRAINT pk_program PRIMARY KEY (id),
+	CONSTRAINT fk_program_user_user FOREIGN KEY(user) REFERENCES user (username) ON DELETE CASCADE,
+	CONSTRAINT fk_program_image_id_image FOREIGN KEY(image_id) REFERENCES image (id) ON DELETE CASCADE
+);
+
+CREATE TABLE programstep (
+	name VARCHAR NOT NULL,
+	repeat INTEGER NOT NULL,
+	next_in INTEGER NOT NULL,
+	id INTEGER NOT NULL,
+	cdate DATE NOT NULL,
+	user VARCHAR NOT NULL,
+	program_id INTEGER NOT NULL,
+	CONSTRAINT pk_programstep PRIMARY KEY (id),
+	CONSTRAINT fk_programstep_user_user FOREIGN KEY(user) REFERENCES user (username) ON DELETE CASCADE,
+	CONSTRAINT fk_programstep_program_id_program FOREIGN KEY(program_id) REFERENCES program (id) ON DELETE CASCADE
+);
+
+CREATE TABLE programstepbloc (
+	content VARCHAR NOT NULL,
+	duration INTEGER,
+	id INTEGER NOT NULL,
+	next_in INTEGER NOT NULL,
+	user VARCHAR NOT NULL,
+	category_id INTEGER NOT NULL,
+	program_step_id INTEGER,
+	CONSTRAINT pk_programstepbloc PRIMARY KEY (id),
+	CONSTRAINT fk_programstepbloc_user_user FOREIGN KEY(user) REFERENCES user (username) ON DELETE CASCADE,
+	CONSTRAINT fk_programstepbloc_category_id_bloccategory FOREIGN KEY(category_id) REFERENCES bloccategory (id) ON DELETE CASCADE,
+	CONSTRAINT fk_programstepbloc_program_step_id_programstep FOREIGN KEY(program_step_id) REFERENCES programstep (id) ON DELETE CASCADE
+);
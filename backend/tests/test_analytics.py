@@ -0,0 +1,41 @@
+import numpy as np
+
+from ..analytics import LATEST_COUNT, METRICS, TRAILING_WINDOW, compute_health_analytics
+
+
+def days(count: int) -> np.ndarray:
+    # Day i has the value i for every metric
+    return np.repeat(np.arange(count, dtype=float)[:, None], len(METRICS), axis=1)
+
+
+def test_latest_window_and_trend():
+    analytics = compute_health_analytics(days(3 * LATEST_COUNT), latest_only=True)
+    assert analytics["count"] == LATEST_COUNT
+
+    hrv = analytics["metrics"]["hrv"]
+    assert hrv["min"] == 2 * LATEST_COUNT and hrv["max"] == 3 * LATEST_COUNT - 1
+    assert hrv["average"] == 2 * LATEST_COUNT + (LATEST_COUNT - 1) / 2
+    previous = LATEST_COUNT + (LATEST_COUNT - 1) / 2
+    assert hrv["trend"] == {"previous": previous, "change": 30.0, "direction": "up"}
+    # The mean of the last TRAILING_WINDOW days
+    assert hrv["trailing_7d_mean"] == 3 * LATEST_COUNT - (TRAILING_WINDOW + 1) / 2
+    # The chart series is the window only
+    assert analytics["series"]["strain"] == list(range(2 * LATEST_COUNT, 3 * LATEST_COUNT))
+
+
+def test_whole_year_has_no_trend():
+    analytics = compute_health_analytics(days(10), latest_only=False)
+    assert analytics["count"] == 10
+    assert all(metric["trend"] is None for metric in analytics["metrics"].values())
+    assert len(analytics["series"]["recovery"]) == 10
+
+
+def test_empty_year(client, user):
+    response = client.get("/api/stats/health?year=2001", headers=user["headers"])
+    assert response.status_code == 200, response.text
+    assert response.json() == {
+        "count": 0,
+        "latest": None,
+        "metrics": {},
+        "series": {"dates": [], "hrv": [], "strain": [], "recovery": []},
+    }
@@ -0,0 +1,35 @@
+from sqlmodel import update
+
+from ..config import settings
+from ..db.core import get_engine
+from ..models.models import User
+from ..utils import cache
+
+
+def stash(client, token: str) -> int:
+    return client.post("/api/stash", headers={"X-Api-Token": token}, json={"content": "stashed"}).status_code
+
+
+def test_revoked_token_is_rejected(client, user):
+    token = client.put("/api/settings/api_token", headers=user["headers"]).json()
+    assert stash(client, token) == 200
+    assert client.delete("/api/settings/api_token", headers=user["headers"]).status_code == 200
+    assert stash(client, token) == 401
+
+
+def test_revocation_from_another_worker_expires(client, user, monkeypatch):
+    token = client.put("/api/settings/api_token", headers=user["headers"]).json()
+    assert stash(client, token) == 200  # Cached
+
+    # Revoked by another worker: only the database changes, this worker's cache still holds the token
+    async def revoke():
+        async with get_engine().begin() as connection:
+            revoked = update(User).where(User.username == user["username"]).values(api_token=None)
+            await connection.execute(revoked)
+
+    client.portal.call(revoke)
+    assert stash(client, token) == 200
+
+    now = cache.time.time()
+    monkeypatch.setattr(cache.time, "time", lambda: now + settings.API_TOKEN_CACHE_TTL + 1)
+    assert stash(client, token) == 401
@@ -0,0 +1,40 @@
+from .conftest import register
+
+
+def stash(client, token: str):
+    return client.post("/api/stash", headers={"X-Api-Token": token}, json={"content": "stashed"})
+
+
+def admin_action(client, admin: dict, username: str, action: str):
+    url = f"/api/admin/users/{username}/{action}"
+    response = client.put(url, headers=admin["headers"], json={"code": admin["code"]()})
+    assert response.status_code == 200, response.text
+
+
+def test_disabled_user_is_rejected_at_once(client, admin):
+    user = register(client)  # After the admin: the first user of a database is a superuser
+    token = client.put("/api/settings/api_token", headers=user["headers"]).json()
+    # Both the decoded JWT and the API token are cached now
+    assert client.get("/api/blocs", headers=user["headers"]).status_code == 200
+    assert stash(client, token).status_code == 200
+
+    admin_action(client, admin, user["username"], "toggle_active")
+    response = client.get("/api/blocs", headers=user["headers"])
+    assert (response.status_code, response.json()["detail"]) == (401, "User is disabled")
+    response = stash(client, token)
+    assert (response.status_code, response.json()["detail"]) == (401, "User is disabled")
+
+    admin_action(client, admin, user["username"], "toggle_active")
+    assert client.get("/api/blocs", headers=user["headers"]).status_code == 200
+    assert stash(client, token).status_code == 200
+
+
+def test_deleted_user_is_rejected_at_once(client, admin):
+    user = register(client)
+    token = client.put("/api/settings/api_token", headers=user["headers"]).json()
+    assert client.get("/api/blocs", headers=user["headers"]).status_code == 200
+    assert stash(client, token).status_code == 200
+
+    admin_action(client, admin, user["username"], "delete")
+    assert client.get("/api/blocs", headers=user["headers"]).status_code == 401
+    assert stash(client, token).status_code == 401
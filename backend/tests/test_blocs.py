@@ -0,0 +1,133 @@
+import base64
+import json
+
+import pytest
+
+from .conftest import register
+
+
+def test_post_no_blocs(client, user):
+    response = client.post("/api/blocs", headers=user["headers"], json=[])
+    assert response.status_code == 200, response.text
+    assert response.json() == []
+
+
+def test_post_blocs_returns_their_ids(client, user):
+    headers = user["headers"]
+    category = client.get("/api/categories", headers=headers).json()[0]
+    blocs = [{"content": f"bloc {i}", "category_id": category["id"]} for i in range(5)]
+    created = client.post("/api/blocs", headers=headers, json=blocs).json()
+    assert [bloc["content"] for bloc in created] == [bloc["content"] for bloc in blocs]
+
+    stored = {bloc["id"]: bloc["content"] for bloc in client.get("/api/blocs", headers=headers).json()}
+    assert {bloc["id"]: bloc["content"] for bloc in created} == stored
+
+
+def add_blocs(client, user: dict, *cdates: str) -> list[int]:
+    category = client.get("/api/categories", headers=user["headers"]).json()[0]
+    blocs = [{"content": f"bloc {cdate}", "cdate": cdate, "category_id": category["id"]} for cdate in cdates]
+    created = client.post("/api/blocs", headers=user["headers"], json=blocs).json()
+    return [bloc["id"] for bloc in (created if isinstance(created, list) else [created])]  # One bloc, no list
+
+
+def stored_blocs(client, user: dict) -> dict:
+    return {bloc["id"]: bloc for bloc in client.get("/api/blocs", headers=user["headers"]).json()}
+
+
+def batch(client, user: dict, *operations: dict):
+    return client.post("/api/blocs/batch", headers=user["headers"], json=list(operations))
+
+
+def test_batch_ops(client, user):
+    first, second, third = add_blocs(client, user, "2024-01-01", "2024-01-03", "2024-01-10")
+    other_category = client.get("/api/categories", headers=user["headers"]).json()[1]
+
+    response = batch(
+        client,
+        user,
+        {"op": "copy", "ids": [first, second], "to": "2024-02-01"},
+        {"op": "shift", "ids": [second], "days": 2},
+        {"op": "update", "ids": [first], "data": {"content": "updated", "category_id": other_category["id"]}},
+        {"op": "delete", "ids": [third]},
+    )
+    assert response.status_code == 200, response.text
+    changes = response.json()
+    assert changes["updated"] == [first, second] and changes["deleted"] == [third]
+
+    blocs = stored_blocs(client, user)
+    assert third not in blocs
+    assert (blocs[first]["content"], blocs[first]["category"]["id"]) == ("updated", other_category["id"])
+    assert blocs[second]["cdate"] == "2024-01-05"
+    # Copies keep their spacing, the earliest one lands on `to`
+    copies = sorted(blocs[bloc_id]["cdate"] for bloc_id in changes["created"])
+    assert copies == ["2024-02-01", "2024-02-03"]
+
+
+def test_batch_rejects_other_users_categories(client, user):
+    [bloc] = add_blocs(client, user, "2024-01-01")
+    other = register(client)
+    foreign = client.get("/api/categories", headers=other["headers"]).json()[0]["id"]
+
+    for category_id in (foreign, 10**9):
+        operation = {"op": "update", "ids": [bloc], "data": {"category_id": category_id}}
+        assert batch(client, user, operation).status_code == 400
+    assert stored_blocs(client, user)[bloc]["category"]["id"] != foreign
+
+
+def test_batch_rejects_other_users_blocs(client, user):
+    [bloc] = add_blocs(client, user, "2024-01-01")
+    other = register(client)
+    [foreign] = add_blocs(client, other, "2024-01-01")
+
+    response = batch(client, user, {"op": "delete", "ids": [bloc, foreign]})
+    assert response.status_code == 404
+    # Nothing was applied
+    assert bloc in stored_blocs(client, user) and foreign in stored_blocs(client, other)
+
+
+def get_page(client, user: dict, cursor: str | None = None):
+    url = "/api/blocs?limit=4" + (f"&cursor={cursor}" if cursor else "")
+    response = client.get(url, headers=user["headers"])
+    assert response.status_code == 200, response.text
+    return [bloc["id"] for bloc in response.json()], response.headers
+
+
+def test_paging_both_ways(client, user):
+    # Several blocs a day: pages split days, the id breaks the ties
+    add_blocs(client, user, *[f"2024-01-{day:02d}" for day in range(1, 6) for _ in range(3)])
+
+    page, headers = get_page(client, user)
+    assert "X-Prev-Cursor" not in headers
+    forward = [page]
+    while "X-Next-Cursor" in headers:
+        page, headers = get_page(client, user, headers["X-Next-Cursor"])
+        forward.append(page)
+    assert [len(page) for page in forward] == [4, 4, 4, 3]
+    ids = [bloc_id for page in forward for bloc_id in page]
+    assert ids == list(stored_blocs(client, user))  # Same order as the unpaged list, nothing twice
+
+    backward = [page]
+    while "X-Prev-Cursor" in headers:
+        page, headers = get_page(client, user, headers["X-Prev-Cursor"])
+        backward.append(page)
+    assert backward == forward[::-1]
+    # Back on the first page, the next cursor resumes the walk
+    assert get_page(client, user, headers["X-Next-Cursor"])[0] == forward[1]
+
+
+def encode(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+MALFORMED_CURSORS = [
+    "not-a-cursor",
+    encode([1, 2]),
+    encode(["yesterday", 1, False]),
+    encode({"cdate": "2024-01-01"}),
+]
+
+
+@pytest.mark.parametrize("cursor", MALFORMED_CURSORS)
+def test_malformed_cursor(client, user, cursor):
+    response = client.get(f"/api/blocs?cursor={cursor}", headers=user["headers"])
+    assert (response.status_code, response.json()["detail"]) == (400, "Invalid cursor")
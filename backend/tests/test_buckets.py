@@ -0,0 +1,61 @@
+import time
+from datetime import date
+
+import pytest
+
+from ..db.buckets import UNITS, bucket_count, bucket_starts
+
+RANGES = [
+    (date(2024, 1, 1), date(2024, 1, 1)),
+    (date(2023, 12, 31), date(2024, 1, 1)),
+    (date(2024, 2, 29), date(2025, 3, 1)),
+    (date(2020, 11, 15), date(2026, 2, 2)),
+]
+
+
+@pytest.mark.parametrize("start, end", RANGES)
+@pytest.mark.parametrize("unit", UNITS)
+def test_bucket_count(unit, start, end):
+    assert bucket_count(start, end, unit) == len(bucket_starts(start, end, unit))
+
+
+def test_duration_buckets(client, user):
+    category = client.get("/api/categories", headers=user["headers"]).json()[0]
+    blocs = [
+        {"content": "a", "duration": 10, "cdate": "2024-01-31", "category_id": category["id"]},
+        {"content": "b", "duration": 20, "cdate": "2024-02-01", "category_id": category["id"]},
+    ]
+    client.post("/api/blocs", headers=user["headers"], json=blocs)
+
+    params = {"start": "2024-01-15", "end": "2024-03-01", "unit": "month"}
+    response = client.get("/api/stats/duration", headers=user["headers"], params=params)
+    assert response.status_code == 200, response.text
+    assert response.json()["buckets"] == ["2024-01-01", "2024-02-01", "2024-03-01"]
+    assert response.json()["total"] == [10, 20, 0]
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"start": "0001-01-01", "end": "9999-12-31", "unit": "day"},  # Millions of buckets
+        {"start": "9999-12-30", "end": "9999-12-31", "unit": "day"},  # No bucket after date.max
+        {"start": "9999-12-01", "end": "9999-12-31", "unit": "quarter"},
+    ],
+)
+def test_duration_buckets_rejected(client, user, params):
+    start = time.perf_counter()
+    response = client.get("/api/stats/duration", headers=user["headers"], params=params)
+    assert response.status_code == 400, response.text
+    assert time.perf_counter() - start < 0.5  # Rejected before any bucket is built
+
+
+@pytest.mark.parametrize("year", [0, 9999])
+def test_week_duration_out_of_range_year(client, user, year):
+    response = client.get("/api/stats/week_duration", headers=user["headers"], params={"year": year})
+    assert response.status_code == 400, response.text
+
+
+def test_week_duration_iso_weeks(client, user):
+    # 2026 has 53 ISO weeks
+    response = client.get("/api/stats/week_duration_total", headers=user["headers"], params={"year": 2026})
+    assert [week["week"] for week in response.json()] == list(range(1, 54))
@@ -0,0 +1,50 @@
+import asyncio
+
+import httpx
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+from ..main import app
+
+REQUESTS = 20
+
+
+class CheckoutGauge:
+    # Connections checked out at once, over every pool
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+
+    def checkout(self, *args):
+        self.current += 1
+        self.peak = max(self.peak, self.current)
+
+    def checkin(self, *args):
+        self.current -= 1
+
+
+def test_concurrent_requests_overlap(client, user):
+    # Handlers await their queries: while one request waits on the database, the event loop serves the
+    # others. Blocking queries would run the requests one after another, a single connection in use at once.
+    category = client.get("/api/categories", headers=user["headers"]).json()[0]
+    blocs = [{"content": f"bloc {i}", "category_id": category["id"]} for i in range(50)]
+    assert client.post("/api/blocs", headers=user["headers"], json=blocs).status_code == 200
+    gauge = CheckoutGauge()
+
+    async def burst():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            requests = [http.get("/api/blocs", headers=user["headers"]) for _ in range(REQUESTS)]
+            return await asyncio.gather(*requests)
+
+    event.listen(Pool, "checkout", gauge.checkout)
+    event.listen(Pool, "checkin", gauge.checkin)
+    try:
+        responses = client.portal.call(burst)  # In the application's event loop, where the engines live
+    finally:
+        event.remove(Pool, "checkout", gauge.checkout)
+        event.remove(Pool, "checkin", gauge.checkin)
+
+    assert all(response.status_code == 200 for response in responses)
+    assert all(len(response.json()) == 50 for response in responses)
+    assert gauge.peak > 1
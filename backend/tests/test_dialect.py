@@ -0,0 +1,56 @@
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import Date, literal, select
+
+from ..db.buckets import UNITS, bucket_start
+from ..db.changes import bump_data_version, get_data_version
+from ..db.core import get_engine
+from ..db.dialect import DialectAdapter, dialect_of
+from ..db.shards import user_session
+
+# Dialect specific SQL, run on the test database: SQLite by default, PostgreSQL with TEST_DATABASE_URL
+
+DAYS = [date(2024, 1, 1), date(2024, 2, 29), date(2024, 12, 31), date(2026, 1, 1), date(2027, 8, 15)]
+
+
+def run_query(client, query):
+    async def main():
+        async with get_engine().connect() as connection:
+            return (await connection.execute(query(dialect_of(connection)))).scalar_one()
+
+    return client.portal.call(main)
+
+
+@pytest.mark.parametrize("day", DAYS)
+@pytest.mark.parametrize("unit", UNITS)
+def test_date_trunc(client, unit, day):
+    truncated = run_query(client, lambda dialect: select(dialect.date_trunc(unit, literal(day, Date))))
+    assert truncated == bucket_start(day, unit)
+
+
+@pytest.mark.parametrize("days", [-400, -1, 0, 1, 60])
+def test_add_days(client, days):
+    moved = run_query(client, lambda dialect: select(dialect.add_days(literal(DAYS[1], Date), days)))
+    assert str(moved) == str(DAYS[1] + timedelta(days=days))
+
+
+def test_insert_on_conflict(client, user):
+    async def main():
+        async with user_session(user["username"]) as session:
+            before = await get_data_version(session, user["username"])
+            await bump_data_version(session, user["username"])
+            await bump_data_version(session, user["username"])
+            await session.commit()
+            return before, await get_data_version(session, user["username"])
+
+    before, after = client.portal.call(main)
+    assert after == before + 2
+
+
+def test_adapters_must_implement_insert():
+    class Incomplete(DialectAdapter):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
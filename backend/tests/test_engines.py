@@ -0,0 +1,50 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from ..config import settings
+from ..db.core import get_engine, get_read_engine
+from ..db.shards import user_session
+from .conftest import requires_sqlite
+
+SYNCHRONOUS = {"OFF": 0, "NORMAL": 1, "FULL": 2, "EXTRA": 3}
+
+
+def pragmas(client, engine, *names: str) -> dict:
+    async def run():
+        async with engine.connect() as conn:
+            return {name: (await conn.exec_driver_sql(f"PRAGMA {name}")).scalar() for name in names}
+
+    return client.portal.call(run)
+
+
+@requires_sqlite
+def test_writer_pragmas(client):
+    assert pragmas(client, get_engine(), "journal_mode", "synchronous", "busy_timeout", "foreign_keys") == {
+        "journal_mode": settings.SQLITE_JOURNAL_MODE.lower(),
+        "synchronous": SYNCHRONOUS[settings.SQLITE_SYNCHRONOUS.upper()],
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT,
+        "foreign_keys": 1,
+    }
+
+
+@requires_sqlite
+def test_reader_pragmas(client):
+    assert pragmas(client, get_read_engine(), "query_only", "synchronous", "busy_timeout") == {
+        "query_only": 1,
+        "synchronous": SYNCHRONOUS[settings.SQLITE_SYNCHRONOUS.upper()],
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT,
+    }
+
+
+def test_read_session_rejects_writes(client, user):
+    # The session behind ReadSessionDep
+    async def write(read_only: bool):
+        async with user_session(user["username"], read_only=read_only) as session:
+            statement = text('UPDATE bloccategory SET name = name WHERE "user" = :user')
+            await session.exec(statement, params={"user": user["username"]})
+            await session.rollback()
+
+    with pytest.raises(DBAPIError):
+        client.portal.call(write, True)
+    client.portal.call(write, False)
@@ -0,0 +1,82 @@
+import pytest
+
+from .conftest import register
+
+
+def get(client, user: dict, url: str, etag: str | None = None):
+    headers = {**user["headers"], "If-None-Match": etag} if etag else user["headers"]
+    return client.get(url, headers=headers)
+
+
+@pytest.fixture
+def seeded(client, user) -> dict:
+    headers = user["headers"]
+    category = client.get("/api/categories", headers=headers).json()[0]
+    bloc = {"content": "bloc", "cdate": "2024-01-01", "category_id": category["id"]}
+    bloc = client.post("/api/blocs", headers=headers, json=bloc).json()
+    result = {"key": "kg", "value": "1"}
+    assert client.put(f"/api/blocs/{bloc['id']}/result", headers=headers, json=result).status_code == 200
+    pr = client.post("/api/pr", headers=headers, json={"name": "pr", "key": "kg"}).json()
+    return {"category": category["id"], "bloc": bloc["id"], "pr": pr["id"]}
+
+
+# (url watched, mutation), every kind of write must change the ETag
+MUTATIONS = {
+    # Only the BlocResult row changes, it has no owner column
+    "bloc result": (
+        "/api/blocs",
+        lambda client, headers, ids: client.put(
+            f"/api/blocs/{ids['bloc']}/result", headers=headers, json={"key": "kg", "value": "2"}
+        ),
+    ),
+    "batch op": (
+        "/api/blocs",
+        lambda client, headers, ids: client.post(
+            "/api/blocs/batch", headers=headers, json=[{"op": "shift", "ids": [ids["bloc"]], "days": 1}]
+        ),
+    ),
+    "category rename": (
+        "/api/categories",
+        lambda client, headers, ids: client.put(
+            f"/api/categories/{ids['category']}", headers=headers, json={"name": "renamed"}
+        ),
+    ),
+    "pr value": (
+        "/api/pr",
+        lambda client, headers, ids: client.post(
+            f"/api/pr/{ids['pr']}/values", headers=headers, json={"value": "1", "cdate": "2024-02-01"}
+        ),
+    ),
+}
+
+
+def test_unchanged_data_is_not_modified(client, user, seeded):
+    response = get(client, user, "/api/blocs")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = get(client, user, "/api/blocs", etag)
+    assert response.status_code == 304 and not response.content
+    assert response.headers["ETag"] == etag
+    # Tags are per request, not only per data version
+    assert get(client, user, "/api/pr", etag).status_code == 200
+
+
+@pytest.mark.parametrize("mutation", MUTATIONS)
+def test_writes_change_the_etag(client, user, seeded, mutation):
+    url, mutate = MUTATIONS[mutation]
+    etag = get(client, user, url).headers["ETag"]
+
+    assert mutate(client, user["headers"], seeded).status_code == 200
+    response = get(client, user, url, etag)
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_etags_are_per_user(client, user, seeded):
+    # Another user's write leaves the tag alone
+    etag = get(client, user, "/api/blocs").headers["ETag"]
+    other = register(client)
+    response = client.post("/api/pr", headers=other["headers"], json={"name": "pr", "key": "kg"})
+    assert response.status_code == 200
+    assert get(client, user, "/api/blocs", etag).status_code == 304
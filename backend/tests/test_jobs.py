@@ -0,0 +1,120 @@
+import asyncio
+import json
+import time
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from ..config import settings
+from ..db.core import get_engine
+from ..jobs import HANDLERS, JobRunner
+from ..models.models import Job
+from ..routers import statistics
+from .conftest import register
+
+
+def add_job(client, username: str, **values) -> int:
+    async def add():
+        async with AsyncSession(get_engine(), expire_on_commit=False) as session:
+            job = Job(user=username, kind="whoop_archive", status="running", **values)
+            session.add(job)
+            await session.commit()
+            return job.id
+
+    return client.portal.call(add)
+
+
+def get_job(client, job_id: int) -> Job:
+    async def get():
+        async with AsyncSession(get_engine()) as session:
+            return await session.get(Job, job_id)
+
+    return client.portal.call(get)
+
+
+def test_start_leaves_jobs_of_live_workers_alone(client, user):
+    runner = JobRunner()
+    now = time.time()
+    stale = now - settings.JOBS_HEARTBEAT_TIMEOUT - 1
+    live = add_job(client, user["username"], owner="other", heartbeat=now)
+    silent = add_job(client, user["username"], owner="other", heartbeat=stale)
+    restarted = add_job(client, user["username"], owner=runner.owner, heartbeat=now)
+
+    client.portal.call(runner.start)
+    try:
+        assert get_job(client, live).status == "running"
+        for job_id in (silent, restarted):
+            job = get_job(client, job_id)
+            assert (job.status, job.error) == ("failed", "Interrupted by a restart")
+    finally:
+        client.portal.call(runner.stop)
+
+
+def test_running_jobs_keep_beating(client, user, monkeypatch):
+    async def wait(job):
+        await asyncio.sleep(10)
+
+    monkeypatch.setitem(HANDLERS, "wait", wait)
+    monkeypatch.setattr(settings, "JOBS_HEARTBEAT_INTERVAL", 0.05)
+    runner = JobRunner()
+    client.portal.call(runner.start)
+    try:
+        job_id = client.portal.call(runner.submit, user["username"], "wait").id
+        time.sleep(0.2)
+        job = get_job(client, job_id)
+        assert (job.status, job.owner) == ("running", runner.owner)
+        time.sleep(0.2)
+        assert get_job(client, job_id).heartbeat > job.heartbeat
+    finally:
+        client.portal.call(runner.stop)
+    assert get_job(client, job_id).error == "Interrupted by a shutdown"
+
+
+def wait_for_job(client, user: dict, job_id: int) -> dict:
+    for _ in range(100):
+        job = client.get(f"/api/jobs/{job_id}", headers=user["headers"]).json()
+        if job["status"] not in ("pending", "running"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"Job {job_id} is still {job['status']}")
+
+
+def test_whoop_link_is_downloaded_by_the_job(client, user, monkeypatch, tmp_path):
+    links = []
+    archive = tmp_path / "archive.zip"
+
+    async def download_file(link):
+        links.append(link)
+        archive.write_bytes(b"not a zip")
+        return str(archive)
+
+    monkeypatch.setattr(statistics, "download_file", download_file)
+    link = "https://links.prod.whoop.com/export.zip"
+    response = client.post("/api/stats/whoop_archive", headers=user["headers"], data={"link": link})
+    assert response.status_code == 202, response.text
+
+    job = wait_for_job(client, user, response.json()["id"])
+    assert (job["status"], job["error"]) == ("failed", "Bad request")
+    assert links == [link]
+    assert not archive.exists()
+
+
+def test_whoop_link_is_checked_by_the_request(client, user, monkeypatch):
+    async def download_file(link):
+        raise AssertionError("Downloaded an invalid link")
+
+    monkeypatch.setattr(statistics, "download_file", download_file)
+    data = {"link": "https://example.com/export.zip"}
+    response = client.post("/api/stats/whoop_archive", headers=user["headers"], data=data)
+    assert response.status_code == 400
+
+
+def test_admin_import_fails_the_job(client, admin):
+    user = register(client)
+    data = {user["username"]: {"pr": [{"name": "pr", "key": "not a key"}]}}
+    files = {"file": ("import.json", json.dumps(data), "application/json")}
+    form = {"code": admin["code"]()}
+    response = client.put("/api/admin/import", headers=admin["headers"], files=files, data=form)
+    assert response.status_code == 202, response.text
+
+    job = wait_for_job(client, admin, response.json()["id"])
+    assert (job["status"], job["error"]) == ("failed", "Bad request")
@@ -0,0 +1,83 @@
+import hashlib
+import logging
+import sqlite3
+from pathlib import Path
+from uuid import uuid4
+
+from sqlalchemy.engine import make_url
+
+from ..db.core import build_engine, init_schema
+from ..db.migrations import MIGRATIONS
+
+BASELINE_SCHEMA = Path(__file__).parent / "data" / "baseline_schema.sql"
+API_TOKEN = str(uuid4())  # Stored in clear before migration 2
+
+BASELINE_DATA = f"""
+INSERT INTO user (username, password, is_active, is_su, api_token, mfa_enabled)
+    VALUES ('alice', 'x', 1, 0, '{API_TOKEN}', 0);
+INSERT INTO bloccategory (id, name, color, weight, user) VALUES (1, 'gym', '#e75480', 1, 'alice');
+INSERT INTO bloc (id, content, duration, cdate, user, category_id)
+    VALUES (1, 'back squat', 30, '2024-01-02', 'alice', 1);
+INSERT INTO pr (id, name, "key", user) VALUES (1, 'squat', 'kg', 'alice');
+INSERT INTO prvalue (id, value, cdate, pr_id) VALUES (1, '100', '2024-01-02', 1), (2, '110', '2024-01-02', 1),
+    (3, '90', '2024-01-01', 1);
+INSERT INTO healthwatchdata VALUES
+    (1, '2024-01-02', 'alice', 50, 50, 50, 36.5, 98, 10, 80, 100, 100, 100, 10, 90),
+    (2, '2024-01-02', 'alice', 60, 50, 50, 36.5, 98, 10, 80, 100, 100, 100, 10, 90);
+"""
+
+
+def upgrade(client, path: Path):
+    async def run():
+        engine = build_engine(make_url(f"sqlite:///{path}"))
+        try:
+            await init_schema(engine)
+        finally:
+            await engine.dispose()
+
+    client.portal.call(run)
+
+
+def test_upgrade_baseline_database(client, tmp_path, caplog):
+    path = tmp_path / "baseline.sqlite"
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA.read_text() + BASELINE_DATA)
+    conn.close()
+
+    with caplog.at_level(logging.WARNING, logger="wingfit.app"):
+        upgrade(client, path)
+
+    conn = sqlite3.connect(path)
+    try:
+        assert conn.execute("SELECT MAX(version) FROM schema_version").fetchone() == (MIGRATIONS[-1][0],)
+
+        indexes = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert {
+            "ix_bloc_user_cdate_id",
+            "ix_bloc_category_id",
+            "ix_user_api_token",
+            "ix_prvalue_pr_id_cdate",
+            "ix_healthwatchdata_user_cdate",
+            "ix_programstepbloc_category_id",
+        } <= indexes
+
+        digest = hashlib.sha256(API_TOKEN.encode()).hexdigest()
+        assert conn.execute("SELECT api_token FROM user").fetchone() == (digest,)
+
+        # Duplicates are gone, the latest row of each is kept
+        assert conn.execute("SELECT id, value FROM prvalue ORDER BY id").fetchall() == [(2, "110"), (3, "90")]
+        assert conn.execute("SELECT id, recovery FROM healthwatchdata").fetchall() == [(2, 60)]
+        assert "Deleted 1 duplicated prvalue rows" in caplog.text
+        assert "Deleted 1 duplicated healthwatchdata rows" in caplog.text
+
+        # Existing data is searchable
+        hits = conn.execute("SELECT entity_id FROM search_index WHERE search_index MATCH 'squat'").fetchall()
+        assert hits == [(1,)]
+    finally:
+        conn.close()
+
+    # Nothing is applied twice
+    upgrade(client, path)
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT COUNT(*) FROM schema_version").fetchone() == (len(MIGRATIONS),)
+    conn.close()
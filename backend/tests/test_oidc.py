@@ -0,0 +1,107 @@
+import json
+import time
+from collections import Counter
+
+import httpx
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from .. import oidc
+from ..config import settings
+
+ISSUER = "http://idp.test/realms/wingfit"
+
+
+def private_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+class StubIdP:
+    # Discovery, JWKS and token endpoints of a provider whose signing keys can rotate
+    def __init__(self):
+        self.requests = Counter()
+        self.keys = {}  # {kid: private key}, all published in the JWKS
+        self.signing_kid = None
+
+    def add_key(self, kid: str):
+        self.keys[kid] = private_key()
+        self.signing_kid = kid
+
+    def id_token(self) -> str:
+        key = self.keys.get(self.signing_kid) or private_key()
+        claims = {"preferred_username": "oidc_user", "aud": settings.OIDC_CLIENT_ID, "exp": time.time() + 60}
+        return jwt.encode(claims, key, algorithm="RS256", headers={"kid": self.signing_kid})
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        self.requests[path] = self.requests[path] + 1
+        if path.endswith("/.well-known/openid-configuration"):
+            config = {"token_endpoint": f"{ISSUER}/token", "jwks_uri": f"{ISSUER}/certs"}
+            return httpx.Response(200, json=config)
+        if path.endswith("/certs"):
+            keys = []
+            for kid, key in self.keys.items():
+                jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(key.public_key()))
+                keys.append({**jwk, "kid": kid, "alg": "RS256", "use": "sig"})
+            return httpx.Response(200, json={"keys": keys})
+        if path.endswith("/token"):
+            return httpx.Response(200, json={"id_token": self.id_token()})
+        return httpx.Response(404)
+
+    def fetches(self, endpoint: str) -> int:
+        return sum(count for path, count in self.requests.items() if path.endswith(endpoint))
+
+
+@pytest.fixture
+def idp(client, monkeypatch):
+    monkeypatch.setattr(settings, "AUTH_METHOD", "oidc")
+    monkeypatch.setattr(settings, "OIDC_HOST", "idp.test")
+    monkeypatch.setattr(settings, "OIDC_REALM", "wingfit")
+    monkeypatch.setattr(settings, "OIDC_CLIENT_ID", "wingfit")
+    # Caches start empty, the provider is reached through the shared client
+    for name, value in (("_config", None), ("_config_exp", 0.0), ("_keys", {}), ("_keys_exp", 0.0)):
+        monkeypatch.setattr(oidc, name, value)
+    monkeypatch.setattr(oidc, "_keys_fetched", 0.0)
+
+    stub = StubIdP()
+    stub.add_key("k1")
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(stub.handle))
+    monkeypatch.setattr(oidc, "_client", http_client)
+    yield stub
+    client.portal.call(http_client.aclose)
+
+
+def login(client) -> int:
+    return client.post("/api/auth/oidc/login", json={"code": "code"}).status_code
+
+
+def test_discovery_and_jwks_are_cached(client, idp):
+    for _ in range(3):
+        assert login(client) == 200
+    assert idp.fetches("/openid-configuration") == 1
+    assert idp.fetches("/certs") == 1
+    assert idp.fetches("/token") == 3
+
+
+def test_unknown_kid_refetches_jwks_once(client, idp, monkeypatch):
+    assert login(client) == 200
+
+    # Key rotation, past the minimum delay between two refetches
+    idp.add_key("k2")
+    monkeypatch.setattr(oidc, "_keys_fetched", time.time() - settings.OIDC_JWKS_MIN_REFRESH)
+    assert login(client) == 200
+    assert login(client) == 200
+    assert idp.fetches("/certs") == 2
+    assert idp.fetches("/openid-configuration") == 1
+
+
+def test_kid_staying_unknown_is_rejected(client, idp, monkeypatch):
+    assert login(client) == 200
+
+    idp.signing_kid = "forged"  # Signed with a key the provider never publishes
+    monkeypatch.setattr(oidc, "_keys_fetched", time.time() - settings.OIDC_JWKS_MIN_REFRESH)
+    assert login(client) == 401
+    # Refetched once, then rate limited by OIDC_JWKS_MIN_REFRESH
+    assert login(client) == 401
+    assert idp.fetches("/certs") == 2
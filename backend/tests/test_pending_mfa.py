@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from .. import pending_mfa
+from ..config import settings
+from ..routers import auth
+
+
+@pytest.fixture(params=["memory", "database"])
+def store(request, monkeypatch) -> pending_mfa.PendingMFAStore:
+    if request.param == "database":
+        store = pending_mfa.DatabasePendingMFAStore()
+    else:
+        store = pending_mfa.MemoryPendingMFAStore(settings.PENDING_MFA_MAX)
+    monkeypatch.setattr(auth, "pending_mfa_store", store)
+    return store
+
+
+def login(client, admin: dict) -> str:
+    response = client.post("/api/auth/login", json={"username": admin["username"], "password": "password"})
+    assert response.status_code == 200, response.text
+    return response.json()["pending_code"]
+
+
+def login_mfa(client, admin: dict, pending_code: str, code: str | None = None) -> int:
+    body = {"username": admin["username"], "pending_code": pending_code, "code": code or admin["code"]()}
+    return client.post("/api/auth/login_mfa", json=body).status_code
+
+
+def test_pending_code_is_single_use(client, admin, store):
+    pending_code = login(client, admin)
+    assert login_mfa(client, admin, pending_code) == 200
+    assert login_mfa(client, admin, pending_code) == 401
+
+
+def test_wrong_pending_code_ends_the_login(client, admin, store):
+    pending_code = login(client, admin)
+    assert login_mfa(client, admin, "replayed") == 401
+    # The guess burned the pending login, the right code does not complete it anymore
+    assert login_mfa(client, admin, pending_code) == 401
+
+
+def test_wrong_totp_code_keeps_the_login(client, admin, store):
+    pending_code = login(client, admin)
+    wrong_code = f"{(int(admin['code']()) + 1) % 10**6:06d}"
+    assert login_mfa(client, admin, pending_code, wrong_code) == 403
+    assert login_mfa(client, admin, pending_code) == 200
+
+
+def test_pending_code_expires(client, admin, store, monkeypatch):
+    pending_code = login(client, admin)
+    now = time.time()
+    monkeypatch.setattr(pending_mfa.time, "time", lambda: now + settings.PENDING_MFA_TTL + 1)
+    assert login_mfa(client, admin, pending_code) == 401
+
+
+def test_sweep_drops_expired_logins(client, admin, store, monkeypatch):
+    login(client, admin)
+    now = time.time()
+    monkeypatch.setattr(pending_mfa.time, "time", lambda: now + settings.PENDING_MFA_TTL + 1)
+    client.portal.call(store.sweep)
+
+    # Back in time: the login would be valid again, had the sweep kept it
+    monkeypatch.setattr(pending_mfa.time, "time", lambda: now)
+    assert client.portal.call(store.get, admin["username"]) is None
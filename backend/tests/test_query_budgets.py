@@ -0,0 +1,73 @@
+import pytest
+
+from .conftest import requires_sqlite
+
+# Statements per request on the hot endpoints, whatever the amount of data: a relationship loaded row by
+# row (N+1) goes over budget as soon as a user has a few rows.
+BUDGETS = {
+    "/api/blocs": 4,
+    "/api/blocs?limit=10": 4,
+    "/api/blocs?startdate=2024-01-01&enddate=2024-01-31": 4,
+    "/api/stats/notes": 4,
+    "/api/stats/duration?start=2024-01-01&end=2024-12-31&unit=month": 2,
+    "/api/stats/week_duration?year=2024": 2,
+    "/api/stats/week_duration_total?year=2024": 1,
+    "/api/sync": 10,
+    "/api/sync?since=1": 12,
+    "/api/search?q=bloc": 3,
+    "/api/categories": 2,
+}
+URLS = [pytest.param(url, marks=requires_sqlite) if url.startswith("/api/search") else url for url in BUDGETS]
+
+
+def seed(client, user: dict, count: int):
+    headers = user["headers"]
+    categories = client.get("/api/categories", headers=headers).json()
+    blocs = [
+        {
+            "content": f"bloc {i}",
+            "duration": 10,
+            "cdate": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+            "category_id": categories[i % len(categories)]["id"],
+        }
+        for i in range(count)
+    ]
+    blocs = client.post("/api/blocs", headers=headers, json=blocs).json()
+    for bloc in blocs[: count // 2]:
+        result = {"key": "kg", "value": "1"}
+        assert client.put(f"/api/blocs/{bloc['id']}/result", headers=headers, json=result).status_code == 200
+
+    for i in range(count // 4):
+        pr = {"name": f"pr {i}", "key": "kg", "values": [{"value": "1", "cdate": "2024-01-01"}]}
+        assert client.post("/api/pr", headers=headers, json=pr).status_code == 200
+        program = client.post("/api/programs", headers=headers, json={"name": f"program {i}"}).json()
+        steps = f"/api/programs/{program['id']}/steps"
+        step = client.post(steps, headers=headers, json={"name": "step"}).json()
+        bloc = {"content": "program bloc", "category_id": categories[0]["id"]}
+        client.post(f"{steps}/{step['id']}/blocs", headers=headers, json=bloc)
+        client.post("/api/stash", headers=headers, json={"content": f"stash {i}"})
+
+
+@pytest.mark.parametrize("count", [4, 40])
+@pytest.mark.parametrize("url", URLS)
+def test_query_budget(client, user, count_queries, url, count):
+    seed(client, user, count)
+    assert client.get(url, headers=user["headers"]).status_code == 200  # Warms the auth caches
+
+    with count_queries() as queries:
+        response = client.get(url, headers=user["headers"])
+    assert response.status_code == 200, response.text
+    assert queries.count <= BUDGETS[url], "\n".join(queries.statements)
+
+
+def test_query_budget_blocs_paging(client, user, count_queries):
+    seed(client, user, 40)
+    response = client.get("/api/blocs?limit=10", headers=user["headers"])
+    pages = 1
+    while cursor := response.headers.get("X-Next-Cursor"):
+        with count_queries() as queries:
+            response = client.get(f"/api/blocs?limit=10&cursor={cursor}", headers=user["headers"])
+        assert response.status_code == 200, response.text
+        assert queries.count <= BUDGETS["/api/blocs?limit=10"], "\n".join(queries.statements)
+        pages += 1
+    assert pages == 4
@@ -0,0 +1,47 @@
+import anyio
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from .. import ratelimit
+from ..config import settings
+
+
+def request(peer: str, forwarded: str | None = None) -> Request:
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "client": (peer, 12345), "headers": headers})
+
+
+@pytest.mark.parametrize(
+    "peer, forwarded, ip",
+    [
+        ("203.0.113.7", None, "203.0.113.7"),
+        ("203.0.113.7", "198.51.100.1", "203.0.113.7"),  # Not a proxy, the header is the client's own
+        ("127.0.0.1", "198.51.100.1", "198.51.100.1"),
+        ("127.0.0.1", "198.51.100.1, 203.0.113.7", "203.0.113.7"),  # Left-most value is forgeable
+        ("127.0.0.1", "198.51.100.1, 127.0.0.1", "198.51.100.1"),
+        ("127.0.0.1", None, "127.0.0.1"),
+        ("127.0.0.1", "not an ip", "not an ip"),
+    ],
+)
+def test_client_ip(peer, forwarded, ip):
+    assert ratelimit.client_ip(request(peer, forwarded)) == ip
+
+
+def test_clients_behind_the_proxy_have_their_own_bucket(monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLE", True)
+    monkeypatch.setattr(settings, "RATE_LIMIT_PER_IP", 2)
+    monkeypatch.setattr(settings, "RATE_LIMIT_PER_USERNAME", 100)
+    monkeypatch.setattr(ratelimit, "rate_limit_store", ratelimit.MemoryRateLimitStore(100))
+
+    async def attempts():
+        for _ in range(2):
+            await ratelimit.check_rate_limit(request("127.0.0.1", "198.51.100.1"), "login", "alice")
+        with pytest.raises(HTTPException) as exc:
+            await ratelimit.check_rate_limit(request("127.0.0.1", "198.51.100.1"), "login", "alice")
+        assert exc.value.status_code == 429
+
+        # Another client through the same proxy is not locked out
+        await ratelimit.check_rate_limit(request("127.0.0.1", "198.51.100.2"), "login", "bob")
+
+    anyio.run(attempts)
@@ -0,0 +1,59 @@
+from collections import defaultdict
+from datetime import date, timedelta
+
+
+def raw_weekly(client, user: dict) -> dict:
+    # {(category label, week start): duration} from the blocs themselves
+    blocs = client.get("/api/blocs?startdate=2024-01-01&enddate=2024-12-31", headers=user["headers"]).json()
+    durations = defaultdict(int)
+    for bloc in blocs:
+        if bloc["duration"] is not None:
+            day = date.fromisoformat(bloc["cdate"])
+            week = day - timedelta(days=day.weekday())
+            durations[(bloc["category"]["name"].upper(), week.isoformat())] += bloc["duration"]
+    return dict(durations)
+
+
+def rollup_weekly(client, user: dict) -> dict:
+    url = "/api/stats/duration?start=2024-01-01&end=2024-12-31&unit=week"
+    stats = client.get(url, headers=user["headers"]).json()
+    return {
+        (dataset["label"], week): duration
+        for dataset in stats["datasets"]
+        for week, duration in zip(stats["buckets"], dataset["data"])
+        if duration
+    }
+
+
+def test_rollups_follow_every_kind_of_write(client, user, admin):
+    headers = user["headers"]
+    gym, metcon = client.get("/api/categories", headers=headers).json()[:2]
+    blocs = [
+        {"content": f"bloc {i}", "duration": 10 * (i + 1), "cdate": cdate, "category_id": gym["id"]}
+        for i, cdate in enumerate(["2024-01-01", "2024-01-03", "2024-01-08", "2024-01-15", "2024-02-05"])
+    ]
+    ids = [bloc["id"] for bloc in client.post("/api/blocs", headers=headers, json=blocs).json()]
+
+    # Move a bloc to another week and category, change a duration, delete one
+    move = {"cdate": "2024-03-04", "category_id": metcon["id"]}
+    assert client.put(f"/api/blocs/{ids[0]}", headers=headers, json=move).status_code == 200
+    assert client.put(f"/api/blocs/{ids[1]}", headers=headers, json={"duration": 5}).status_code == 200
+    assert client.delete(f"/api/blocs/{ids[2]}", headers=headers).status_code == 200
+
+    operations = [
+        {"op": "copy", "ids": [ids[1], ids[3]], "days": 7},
+        {"op": "shift", "ids": [ids[3]], "days": 1},
+        {"op": "update", "ids": [ids[4]], "data": {"duration": 45, "category_id": metcon["id"]}},
+        {"op": "delete", "ids": [ids[1]]},
+    ]
+    assert client.post("/api/blocs/batch", headers=headers, json=operations).status_code == 200
+
+    raw = raw_weekly(client, user)
+    assert len(raw) == 5 and rollup_weekly(client, user) == raw
+    totals = client.get("/api/stats/week_duration_total?year=2024", headers=headers).json()
+    assert sum(week["duration"] for week in totals) == sum(raw.values())
+
+    # A fresh computation of every user's rollups finds nothing to fix
+    response = client.put("/api/admin/rollups/rebuild", headers=admin["headers"])
+    assert response.status_code == 200, response.text
+    assert response.json() == {"mismatches": 0}
@@ -0,0 +1,64 @@
+from ..db.core import get_read_engine
+from .conftest import requires_sqlite
+
+WORDS = ["squat", "deadlift", "snatch", "clean", "jerk", "row", "burpee", "plank", "lunge", "press"]
+BLOCS = 1000
+
+
+def seed_blocs(client, user: dict):
+    headers = user["headers"]
+    category = client.get("/api/categories", headers=headers).json()[0]
+    # Every pair of words, in both orders, on BLOCS / 100 blocs
+    pairs = [(WORDS[i % len(WORDS)], WORDS[i // len(WORDS) % len(WORDS)]) for i in range(BLOCS)]
+    contents = [f"{first} {second} set {i}" for i, (first, second) in enumerate(pairs)]
+    blocs = [{"content": content, "category_id": category["id"]} for content in contents]
+    assert client.post("/api/blocs", headers=headers, json=blocs).status_code == 200
+
+
+@requires_sqlite
+def test_search_1k_blocs_uses_the_index(client, user, count_queries):
+    headers = user["headers"]
+    seed_blocs(client, user)
+
+    with count_queries() as queries:
+        response = client.get("/api/search?q=squat%20dead&limit=100", headers=headers)
+    assert response.status_code == 200, response.text
+    assert len(response.json()) == 2 * BLOCS // len(WORDS) ** 2
+
+    # The MATCH is answered by the FTS5 index, not by scanning the blocs
+    i = next(i for i, statement in enumerate(queries.statements) if "MATCH" in statement)
+
+    async def query_plan():
+        async with get_read_engine().connect() as connection:
+            plan = await connection.exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {queries.statements[i]}", queries.parameters[i]
+            )
+            return [row.detail for row in plan]
+
+    plan = client.portal.call(query_plan)
+    assert any("VIRTUAL TABLE INDEX" in step for step in plan), plan
+    assert not any(step.startswith("SCAN bloc") for step in plan), plan
+
+
+@requires_sqlite
+def test_search_is_scoped_to_the_user(client, user):
+    category = client.get("/api/categories", headers=user["headers"]).json()[0]
+    bloc = {"content": "thruster ladder", "category_id": category["id"]}
+    assert client.post("/api/blocs", headers=user["headers"], json=bloc).status_code == 200
+
+    # A username the first one is a prefix of
+    credentials = {"username": f"{user['username']}_x", "password": "password"}
+    other = client.post("/api/auth/register", json=credentials)
+    other_headers = {"Authorization": f"Bearer {other.json()['access_token']}"}
+    assert client.get("/api/search?q=thruster", headers=other_headers).json() == []
+    assert len(client.get("/api/search?q=thruster", headers=user["headers"]).json()) == 1
+
+
+@requires_sqlite
+def test_search_snippets_are_escaped(client, user):
+    category = client.get("/api/categories", headers=user["headers"]).json()[0]
+    bloc = {"content": "wallball <img src=x onerror=alert(1)>", "category_id": category["id"]}
+    assert client.post("/api/blocs", headers=user["headers"], json=bloc).status_code == 200
+
+    [hit] = client.get("/api/search?q=wallball", headers=user["headers"]).json()
+    assert hit["snippet"].startswith("<mark>wallball</mark> &lt;img src=x onerror=alert(1)&gt;")
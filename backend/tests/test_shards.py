@@ -0,0 +1,88 @@
+import pytest
+from sqlmodel import func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from ..config import settings
+from ..db import shards
+from ..db.core import get_engine
+from ..models.models import Bloc
+from .conftest import register
+
+
+@pytest.fixture(params=["user", "bucket"])
+def sharded(request, client, monkeypatch, tmp_path) -> str:
+    # Users registered during the test get their data in shards of tmp_path, shards opened by the test are
+    # closed afterwards
+    monkeypatch.setattr(settings, "SHARD_MODE", request.param)
+    monkeypatch.setattr(settings, "SHARD_BUCKETS", 1)  # Bucket mode: every user in the same shard
+    monkeypatch.setattr(settings, "SHARDS_FOLDER", str(tmp_path))
+    monkeypatch.setattr(shards, "_engines", {})
+    monkeypatch.setattr(shards, "_registered", set())
+    yield request.param
+
+    async def dispose():
+        for engine in shards._engines.values():
+            await engine.dispose()
+
+    client.portal.call(dispose)
+
+
+def post_bloc(client, user: dict, content: str):
+    category = client.get("/api/categories", headers=user["headers"]).json()[0]
+    bloc = {"content": content, "category_id": category["id"]}
+    assert client.post("/api/blocs", headers=user["headers"], json=bloc).status_code == 200
+
+
+def count_blocs(client, engine, username: str) -> int:
+    async def count():
+        async with AsyncSession(engine) as session:
+            return (await session.exec(select(func.count()).where(Bloc.user == username))).one()
+
+    return client.portal.call(count)
+
+
+def contents(client, user: dict) -> list[str]:
+    return [bloc["content"] for bloc in client.get("/api/blocs", headers=user["headers"]).json()]
+
+
+def test_user_data_is_routed_to_its_shard(client, sharded):
+    alice = register(client)
+    post_bloc(client, alice, "alice bloc")
+
+    name = shards.shard_name(alice["username"])
+    assert name.startswith(sharded) and shards.shard_path(name).exists()
+    shard = client.portal.call(shards.get_user_engine, alice["username"])
+    assert shard in shards.user_data_engines()
+    assert count_blocs(client, shard, alice["username"]) == 1
+    assert count_blocs(client, get_engine(), alice["username"]) == 0  # Nothing in the catalog
+
+
+def test_shards_are_isolated(client, sharded):
+    alice, bob = register(client), register(client)
+    post_bloc(client, alice, "alice bloc")
+    post_bloc(client, bob, "bob bloc")
+
+    assert contents(client, alice) == ["alice bloc"]
+    assert contents(client, bob) == ["bob bloc"]
+    same_shard = shards.shard_name(alice["username"]) == shards.shard_name(bob["username"])
+    assert same_shard == (sharded == "bucket")
+
+
+def test_deleting_a_user_drops_its_shard_data(client, sharded, admin):
+    alice, bob = register(client), register(client)
+    post_bloc(client, alice, "alice bloc")
+    post_bloc(client, bob, "bob bloc")
+    name = shards.shard_name(alice["username"])
+
+    url = f"/api/admin/users/{alice['username']}/delete"
+    response = client.put(url, headers=admin["headers"], json={"code": admin["code"]()})
+    assert response.status_code == 200, response.text
+
+    if sharded == "user":
+        assert not shards.shard_path(name).exists()
+        assert (name, False) not in shards._engines
+    else:
+        # The shard is shared: only the user's rows go, with its stub user row
+        shard = client.portal.call(shards.get_user_engine, bob["username"])
+        assert count_blocs(client, shard, alice["username"]) == 0
+    assert contents(client, bob) == ["bob bloc"]
@@ -0,0 +1,63 @@
+from sqlmodel import update
+
+from ..db.compaction import compact_change_logs
+from ..db.core import get_engine
+from ..models.models import ChangeLog
+
+
+def sync(client, user: dict, since: int = 0) -> dict:
+    response = client.get(f"/api/sync?since={since}", headers=user["headers"])
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def add_pr(client, user: dict, name: str) -> int:
+    return client.post("/api/pr", headers=user["headers"], json={"name": name, "key": "kg"}).json()["id"]
+
+
+def test_reads_share_one_snapshot(client, user, count_queries):
+    sync(client, user)  # Warms the auth caches
+    with count_queries() as queries:
+        sync(client, user)
+    # An explicit transaction, opened before the first read
+    assert queries.statements[0] in ("BEGIN", "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+
+
+def test_delta_sync(client, user):
+    first = add_pr(client, user, "first")
+    full = sync(client, user)
+    assert full["full"] and [pr["id"] for pr in full["pr"]] == [first]
+
+    second = add_pr(client, user, "second")
+    client.delete(f"/api/pr/{first}", headers=user["headers"])
+    delta = sync(client, user, full["seq"])
+    assert not delta["full"]
+    assert [pr["id"] for pr in delta["pr"]] == [second]
+    assert delta["deleted"]["pr"] == [first]
+
+
+def test_cursor_older_than_retention_gets_full_resync(client, user):
+    first = add_pr(client, user, "first")
+    before = sync(client, user)["seq"]
+    second = add_pr(client, user, "second")
+    third = add_pr(client, user, "third")
+    latest = sync(client, user)["seq"]
+
+    async def compact():
+        # Past the retention window
+        async with get_engine().begin() as connection:
+            await connection.execute(update(ChangeLog).where(ChangeLog.user == user["username"]).values(ts=0))
+        return await compact_change_logs()
+
+    # The last row is kept: sequences keep growing
+    assert client.portal.call(compact) >= 2
+
+    # Changes after `before` were compacted
+    resync = sync(client, user, before)
+    assert resync["full"]
+    assert sorted(pr["id"] for pr in resync["pr"]) == [first, second, third]
+
+    fourth = add_pr(client, user, "fourth")
+    delta = sync(client, user, latest)
+    assert not delta["full"] and delta["seq"] > latest
+    assert [pr["id"] for pr in delta["pr"]] == [fourth]
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+
+from ..config import settings
+from ..db.shards import user_session
+from ..db.writer import WriteQueue
+from ..models.models import Stash
+
+
+class RecordingQueue(WriteQueue):
+    # Keeps the size of every batch, to check writes really were grouped
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    async def _next_batch(self):
+        batch, stopping = await super()._next_batch()
+        if batch:
+            self.batches.append(len(batch))
+        return batch, stopping
+
+
+@pytest.fixture
+def run(client, monkeypatch):
+    # Queues run in the application's event loop, where the engines live
+    monkeypatch.setattr(settings, "WRITE_BATCH_SIZE", 8)
+    monkeypatch.setattr(settings, "WRITE_BATCH_DELAY", 200)
+
+    def run(main):
+        async def with_queue():
+            queue = RecordingQueue()
+            queue.start()
+            try:
+                return await main(queue)
+            finally:
+                await queue.stop()
+
+        return client.portal.call(with_queue)
+
+    return run
+
+
+def add_stash(username: str, content: str, stash_id: int | None = None, flush: bool = True):
+    async def write(session):
+        stash = Stash(id=stash_id, user=username, content=content)
+        session.add(stash)
+        if flush:
+            await session.flush()
+        return stash.id
+
+    return write
+
+
+async def stash_contents(username: str) -> list[str]:
+    async with user_session(username) as session:
+        stashes = await session.exec(select(Stash.content).where(Stash.user == username).order_by(Stash.id))
+        return stashes.all()
+
+
+def test_writes_commit_in_order(run, user):
+    username = user["username"]
+
+    async def main(queue):
+        # Submitted in order by one request, over several batches
+        tasks = [asyncio.create_task(queue.submit(username, add_stash(username, f"w{i}"))) for i in range(20)]
+        ids = await asyncio.gather(*tasks)
+        return ids, await stash_contents(username), queue.batches
+
+    ids, contents, batches = run(main)
+    assert ids == sorted(ids)
+    assert contents == [f"w{i}" for i in range(20)]
+    assert batches == [8, 8, 4]
+
+
+def test_failing_write_does_not_poison_its_batch(run, user):
+    username = user["username"]
+
+    async def failing(session):
+        session.add(Stash(user=username, content="failed"))
+        raise ValueError("faulty write")
+
+    async def main(queue):
+        writes = [add_stash(username, "before"), failing, add_stash(username, "after")]
+        results = await asyncio.gather(*[queue.submit(username, w) for w in writes], return_exceptions=True)
+        return results, await stash_contents(username), queue.batches
+
+    results, contents, batches = run(main)
+    assert batches == [3]
+    assert isinstance(results[0], int) and isinstance(results[2], int)
+    assert isinstance(results[1], ValueError)
+    assert contents == ["before", "after"]
+
+
+def test_caller_gets_its_own_commit_error(run, user):
+    username = user["username"]
+
+    async def main(queue):
+        first = await queue.submit(username, add_stash(username, "first"))
+        # Not flushed, the duplicate primary key only fails when the whole batch is committed
+        writes = [add_stash(username, "ok"), add_stash(username, "duplicate", stash_id=first, flush=False)]
+        results = await asyncio.gather(*[queue.submit(username, w) for w in writes], return_exceptions=True)
+        return results, await stash_contents(username)
+
+    results, contents = run(main)
+    assert isinstance(results[0], int)
+    assert isinstance(results[1], IntegrityError)
+    assert contents == ["first", "ok"]
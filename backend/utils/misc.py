@@ -1,4 +1,6 @@
 import base64
+import json
+from datetime import date
 from uuid import uuid4
 
 import requests
@@ -21,6 +23,18 @@ def b64img_decode(data: str) -> bytes:
     )
 
 
+def encode_cursor(cdate: date, id: int, backward: bool = False) -> str:
+    return base64.urlsafe_b64encode(json.dumps([cdate.isoformat(), id, backward]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[date, int, bool]:
+    try:
+        cdate, id, backward = json.loads(base64.urlsafe_b64decode(cursor))
+        return date.fromisoformat(cdate), int(id), bool(backward)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 def check_update():
     url = "https://api.github.com/repos/itskovacs/wingfit/releases/latest"
     try:
@@ -0,0 +1,140 @@
+import csv
+import io
+import zipfile
+from collections.abc import Awaitable, Callable
+from datetime import date
+from itertools import islice
+
+from fastapi import HTTPException
+from sqlmodel import or_, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .config import settings
+from .db.changes import bump_data_version
+from .db.dialect import dialect_of
+from .models.models import HealthWatchData
+from .utils.logging import app_logger
+
+# Whoop archive import: physiological_cycles.csv is streamed out of the archive, parsed and converted in
+# chunks of WHOOP_IMPORT_CHUNK_SIZE rows, each chunk written with a single upsert on (user, cdate).
+# Memory use depends on the chunk size only, whatever the archive size.
+# Every chunk is committed on its own so the write lock is never held for the whole archive. Upserts are
+# idempotent, an interrupted import is completed by importing the archive again.
+
+CYCLES_CSV = "physiological_cycles.csv"
+# {HealthWatchData field: (CSV column, type)}
+FIELDS = {
+    "recovery": (3, int),
+    "resting_hr": (4, int),
+    "hrv": (5, int),
+    "temperature": (6, float),
+    "oxy_level": (7, float),
+    "strain": (8, float),
+    "sleep_score": (14, int),
+    "sleep_duration_light": (18, int),
+    "sleep_duration_deep": (19, int),
+    "sleep_duration_rem": (20, int),
+    "sleep_duration_awake": (21, int),
+    "sleep_efficiency": (24, int),
+}
+REQUIRED = ("recovery", "strain")  # Missing in incomplete cycles
+AWAKE_COLUMN = 13
+
+
+def parse_cycle(row: list[str]) -> dict | None:
+    # None for incomplete or malformed rows
+    try:
+        if not all(row[FIELDS[field][0]] for field in REQUIRED):
+            return None
+
+        # Use 'awake' datetime because 'cycle' datetimes are gapped if you sleep late or miss a night,
+        # not the best solution but a quickwin
+        values = {"cdate": date.fromisoformat(row[AWAKE_COLUMN].split(" ")[0])}
+        for field, (column, kind) in FIELDS.items():
+            # Sensors a device lacks leave their column empty
+            values[field] = kind(float(row[column])) if row[column] else 0
+    except (IndexError, ValueError):
+        return None
+    return values
+
+
+def _upsert_stmt(connection, username: str, rows: list[dict]):
+    stmt = dialect_of(connection).insert(HealthWatchData).values([{"user": username, **row} for row in rows])
+    # Rows left as they are do not come back from RETURNING
+    columns = HealthWatchData.__table__.c
+    changed = or_(*[columns[field].is_distinct_from(stmt.excluded[field]) for field in FIELDS])
+    return stmt.on_conflict_do_update(
+        index_elements=["user", "cdate"],
+        set_={field: stmt.excluded[field] for field in FIELDS},
+        where=changed,
+    ).returning(HealthWatchData.cdate)
+
+
+async def _write_chunk(session: AsyncSession, username: str, chunk: dict[date, dict], counts: dict):
+    existing = set(
+        (
+            await session.exec(
+                select(HealthWatchData.cdate).where(
+                    HealthWatchData.user == username, HealthWatchData.cdate.in_(chunk)
+                )
+            )
+        ).all()
+    )
+    upsert = _upsert_stmt(await session.connection(), username, list(chunk.values()))
+    written = set((await session.exec(upsert)).scalars())
+    if written:
+        await bump_data_version(session, username)
+    counts["inserted"] += len(written - existing)
+    counts["updated"] += len(written & existing)
+    counts["unchanged"] += len(existing - written)
+
+
+def check_whoop_archive(username: str, archive_path: str):
+    # Quick checks before the import is queued, only the archive's directory is read
+    try:
+        with zipfile.ZipFile(archive_path, "r") as archive:
+            names = archive.namelist()
+    except zipfile.BadZipFile:
+        names = []
+
+    if CYCLES_CSV not in names:
+        app_logger.error(f"[check_whoop_archive][{username}] {CYCLES_CSV} is missing in archive")
+        raise HTTPException(status_code=400, detail="Bad request")
+
+
+async def import_whoop_archive(
+    session: AsyncSession,
+    username: str,
+    archive_path: str,
+    progress: Callable[[float, dict], Awaitable] | None = None,
+) -> dict:
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0, "skipped": 0}
+    with zipfile.ZipFile(archive_path, "r") as archive:
+        if CYCLES_CSV not in archive.namelist():
+            app_logger.error(f"[import_whoop_archive][{username}] {CYCLES_CSV} is missing in archive")
+            raise HTTPException(status_code=400, detail="Bad request")
+
+        size = archive.getinfo(CYCLES_CSV).file_size or 1
+        with archive.open(CYCLES_CSV) as file:
+            reader = csv.reader(io.TextIOWrapper(file, encoding="utf-8", newline=""), delimiter=",")
+            next(reader, None)
+
+            while rows := list(islice(reader, settings.WHOOP_IMPORT_CHUNK_SIZE)):
+                # A single upsert cannot touch a row twice, the last cycle of a day wins
+                chunk = {}
+                for row in rows:
+                    values = parse_cycle(row)
+                    if not values:
+                        counts["skipped"] += 1
+                        continue
+                    if values["cdate"] in chunk:
+                        counts["skipped"] += 1
+                    chunk[values["cdate"]] = values
+
+                if chunk:
+                    await _write_chunk(session, username, chunk, counts)
+                    await session.commit()
+                if progress:
+                    await progress(file.tell() / size, counts)
+
+    return counts
@@ -19,7 +19,7 @@ export function processDurationsData(data: WeeklyDuration[]) {
       ],
     },
     categoryDurationPerWeek: {
-      labels: Array.from({ length: 52 }, (_, i) => i + 1),
+      labels: Array.from({ length: data[0].data.length }, (_, i) => i + 1),
       datasets: data.map((d) => ({
         ...d,
         type: 'bar',
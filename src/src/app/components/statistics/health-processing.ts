@@ -1,12 +1,13 @@
 import { Bloc } from '../../types/bloc';
-import { HealthWatchData, StatGauge, Trend } from '../../types/stats';
-import { calculateTrend, getQuartile } from './stats-utils';
+import {
+  HealthAnalytics,
+  HealthMetric,
+  StatGauge,
+  Trend,
+} from '../../types/stats';
 
-export function processHealthData(
-  data: HealthWatchData[],
-  latestOnly: boolean,
-  notes: Bloc[],
-) {
+// Maps the server-computed health analytics (/api/stats/health) to the view
+export function processHealthData(analytics: HealthAnalytics, notes: Bloc[]) {
   let ret = {
     averages: {
       sleep: 0,
@@ -30,65 +31,33 @@ export function processHealthData(
     },
   };
 
-  if (!data.length) return ret;
-  const LATEST_COUNT = 30;
-
-  const sorted = data.sort(
-    (a, b) => new Date(a.cdate).getTime() - new Date(b.cdate).getTime(),
-  );
-  const slice = latestOnly ? sorted.slice(-LATEST_COUNT) : sorted;
-
-  const sleep = slice.map((d) => d.sleep_duration_total);
-  const hrv = slice.map((d) => d.hrv);
-  const strain = slice.map((d) => d.strain);
-  const recovery = slice.map((d) => d.recovery);
-  const restingHR = slice.map((d) => d.resting_hr);
-
-  const avg = (arr: number[]) => arr.reduce((a, b) => a + b, 0) / arr.length;
+  const metrics = analytics.metrics;
+  if (!analytics.count) return ret;
 
   const averages = {
-    sleep: avg(sleep),
-    hrv: Math.round(avg(hrv)),
-    strain: +avg(strain).toFixed(1),
-    recovery: Math.round(avg(recovery)),
-    restingHR: Math.round(avg(restingHR)),
+    sleep: metrics.sleep!.average,
+    hrv: Math.round(metrics.hrv!.average),
+    strain: +metrics.strain!.average.toFixed(1),
+    recovery: Math.round(metrics.recovery!.average),
+    restingHR: Math.round(metrics.resting_hr!.average),
   };
 
-  let trends: {
-    sleep: Trend | undefined;
-    hrv: Trend | undefined;
-    strain: Trend | undefined;
-    recovery: Trend | undefined;
-    restingHR: Trend | undefined;
-  } = {
-    sleep: undefined,
-    hrv: undefined,
-    strain: undefined,
-    recovery: undefined,
-    restingHR: undefined,
-  };
+  const trend = (metric: HealthMetric): Trend | undefined =>
+    metric.trend ? { current: metric.average, ...metric.trend } : undefined;
 
-  //Trends only for latestOnly option, if 2x LATEST_COUNT(30d) sample size
-  if (latestOnly && sorted.length > 2 * LATEST_COUNT) {
-    const previous_data = sorted.slice(-LATEST_COUNT * 2, -LATEST_COUNT);
-    const previoussleep = previous_data.map((d) => d.sleep_duration_total);
-    const previoushrv = previous_data.map((d) => d.hrv);
-    const previousstrain = previous_data.map((d) => d.strain);
-    const previousrecovery = previous_data.map((d) => d.recovery);
-    const previousrestingHR = previous_data.map((d) => d.resting_hr);
+  const trends = {
+    sleep: trend(metrics.sleep!),
+    hrv: trend(metrics.hrv!),
+    strain: trend(metrics.strain!),
+    recovery: trend(metrics.recovery!),
+    restingHR: trend(metrics.resting_hr!),
+  };
 
-    trends = {
-      sleep: calculateTrend(sleep, previoussleep),
-      hrv: calculateTrend(hrv, previoushrv),
-      strain: calculateTrend(strain, previousstrain),
-      recovery: calculateTrend(recovery, previousrecovery),
-      restingHR: calculateTrend(restingHR, previousrestingHR),
-    };
-  }
+  const { dates, hrv, strain, recovery } = analytics.series;
 
   // Normalize labels
-  const labels = slice.map((d) =>
-    new Date(d.cdate).toLocaleDateString('en-US', {
+  const labels = dates.map((cdate) =>
+    new Date(cdate).toLocaleDateString('en-US', {
       month: 'short',
       day: 'numeric',
       year: '2-digit',
@@ -110,12 +79,12 @@ export function processHealthData(
     datasets: [
       {
         label: 'Notes',
-        data: slice.map((obj, index) => {
-          if (!(obj.cdate in parsedNotes)) return { x: index, y: null };
+        data: dates.map((cdate, index) => {
+          if (!(cdate in parsedNotes)) return { x: index, y: null };
           return {
             x: index,
             y: 0,
-            content: parsedNotes[obj.cdate],
+            content: parsedNotes[cdate],
           };
         }),
         pointBackgroundColor: '#909090',
@@ -172,15 +141,14 @@ export function processHealthData(
     ],
   };
 
-  const gauge = (arr: number[], avgValue: number): StatGauge => {
-    const sorted = new Float64Array(arr).sort();
-    const max = sorted[sorted.length - 1] || 1;
+  const gauge = (metric: HealthMetric, avgValue: number): StatGauge => {
+    const max = metric.max || 1;
     return {
-      first: sorted[0],
+      first: metric.min,
       last: max,
       average_pct: (100 * avgValue) / max,
-      q_start_pct: (100 * getQuartile(0.25, sorted)) / max,
-      q_end_pct: (100 * getQuartile(0.75, sorted)) / max,
+      q_start_pct: (100 * metric.q1) / max,
+      q_end_pct: (100 * metric.q3) / max,
     };
   };
 
@@ -189,9 +157,9 @@ export function processHealthData(
     trends: trends,
     strainRecoveryComboGraph,
     gauges: {
-      strain: gauge(strain, averages.strain),
-      recovery: gauge(recovery, averages.recovery),
-      hrv: gauge(hrv, averages.hrv),
+      strain: gauge(metrics.strain!, averages.strain),
+      recovery: gauge(metrics.recovery!, averages.recovery),
+      hrv: gauge(metrics.hrv!, averages.hrv),
     },
   };
 }
@@ -232,28 +232,30 @@ export class StatisticsComponent {
   }
 
   loadHealthData() {
-    this.apiService.getHealthWatchData(this.year).subscribe((data) => {
-      const result = processHealthData(data, this.latestOnly, this.notes);
-
-      this.averageSleepDuration = result.averages.sleep;
-      this.averageStrain = result.averages.strain;
-      this.averageRecovery = result.averages.recovery;
-      this.averageHRV = result.averages.hrv;
-      this.averageRestingHR = result.averages.restingHR;
-
-      this.strainRecoveryComboGraph = result.strainRecoveryComboGraph;
-
-      this.strainGauge = result.gauges.strain;
-      this.recoveryGauge = result.gauges.recovery;
-      this.hrvGauge = result.gauges.hrv;
-
-      if (result.trends) {
-        this.strainTrend = result.trends.strain;
-        this.recoveryTrend = result.trends.recovery;
-        this.hrvTrend = result.trends.hrv;
-        this.restingHRTrend = result.trends.restingHR;
-      }
-    });
+    this.apiService
+      .getHealthAnalytics(this.year, this.latestOnly)
+      .subscribe((analytics) => {
+        const result = processHealthData(analytics, this.notes);
+
+        this.averageSleepDuration = result.averages.sleep;
+        this.averageStrain = result.averages.strain;
+        this.averageRecovery = result.averages.recovery;
+        this.averageHRV = result.averages.hrv;
+        this.averageRestingHR = result.averages.restingHR;
+
+        this.strainRecoveryComboGraph = result.strainRecoveryComboGraph;
+
+        this.strainGauge = result.gauges.strain;
+        this.recoveryGauge = result.gauges.recovery;
+        this.hrvGauge = result.gauges.hrv;
+
+        if (result.trends) {
+          this.strainTrend = result.trends.strain;
+          this.recoveryTrend = result.trends.recovery;
+          this.hrvTrend = result.trends.hrv;
+          this.restingHRTrend = result.trends.restingHR;
+        }
+      });
   }
 
   customChartTooltip(context: any) {
@@ -328,7 +330,7 @@ export class StatisticsComponent {
   getData() {
     forkJoin({
       total: this.apiService.getWeeklyDurationTotal(this.year),
-      health: this.apiService.getHealthWatchData(this.year),
+      health: this.apiService.getHealthAnalytics(this.year, this.latestOnly),
       durations: this.apiService.getWeeklyDuration(this.year),
       notes: this.apiService.getNoteBlocs(),
     })
@@ -342,11 +344,7 @@ export class StatisticsComponent {
         }),
         map(({ health, durations }) => {
           return {
-            healthResult: processHealthData(
-              health,
-              this.latestOnly,
-              this.notes,
-            ),
+            healthResult: processHealthData(health, this.notes),
             durationsResult: processDurationsData(durations),
           };
         }),
@@ -2,15 +2,27 @@ import { Injectable } from '@angular/core';
 import { UtilsService } from './utils.service';
 import { HttpClient, HttpParams } from '@angular/common/http';
 import { Bloc, BlocCategory, BlocResult, StashBloc } from '../types/bloc';
-import { BehaviorSubject, map, Observable, shareReplay, tap } from 'rxjs';
+import {
+  BehaviorSubject,
+  filter,
+  map,
+  Observable,
+  shareReplay,
+  switchMap,
+  take,
+  tap,
+  throwError,
+  timer,
+} from 'rxjs';
 import { PR, PRvalue } from '../types/personal-record';
 import { Program, ProgramBloc, ProgramStep } from '../types/program';
 import { User } from '../types/user';
 import { Info } from '../types/info';
+import { Job } from '../types/job';
 import {
   BlocsByCategory,
   WeeklyDuration,
-  HealthWatchData,
+  HealthAnalytics,
   WeeklyDurationTotal,
 } from '../types/stats';
 
@@ -315,10 +327,11 @@ export class ApiService {
 
   uploadProgram(data: FormData): Observable<Program> {
     return this.httpClient
-      .post<Program>(this.apiBaseUrl + '/programs/upload', data, {
+      .post<Job<Program>>(this.apiBaseUrl + '/programs/upload', data, {
         headers: { enctype: 'multipart/form-data' },
       })
       .pipe(
+        switchMap((job) => this.waitForJob(job)),
         map((program) => {
           return {
             ...program,
@@ -435,14 +448,12 @@ export class ApiService {
     });
   }
 
-  adminRestoreData(data: FormData): Observable<Program> {
-    return this.httpClient.put<Program>(
-      this.apiBaseUrl + '/admin/import',
-      data,
-      {
+  adminRestoreData(data: FormData): Observable<{ users: number }> {
+    return this.httpClient
+      .put<Job<{ users: number }>>(this.apiBaseUrl + '/admin/import', data, {
         headers: { enctype: 'multipart/form-data' },
-      },
-    );
+      })
+      .pipe(switchMap((job) => this.waitForJob(job)));
   }
 
   deleteUser(username: string, code: string): Observable<{}> {
@@ -517,22 +528,55 @@ export class ApiService {
     );
   }
 
-  getHealthWatchData(year: number): Observable<HealthWatchData[]> {
+  getHealthAnalytics(
+    year: number,
+    latestOnly: boolean,
+  ): Observable<HealthAnalytics> {
     let params = new HttpParams();
     params = params.set('year', year);
+    params = params.set('latest_only', latestOnly);
 
-    return this.httpClient.get<HealthWatchData[]>(
-      this.apiBaseUrl + '/stats/healthwatch',
+    return this.httpClient.get<HealthAnalytics>(
+      this.apiBaseUrl + '/stats/health',
       { params },
     );
   }
 
   postWhoopData(data: FormData): Observable<{ count: number }> {
     // data is either a link:str or file: File
-    return this.httpClient.post<{ count: number }>(
-      this.apiBaseUrl + '/stats/whoop_archive',
-      data,
-      { headers: { enctype: 'multipart/form-data' } },
+    return this.httpClient
+      .post<Job<{ count: number }>>(
+        this.apiBaseUrl + '/stats/whoop_archive',
+        data,
+        { headers: { enctype: 'multipart/form-data' } },
+      )
+      .pipe(switchMap((job) => this.waitForJob(job)));
+  }
+
+  getJob<T>(job_id: number): Observable<Job<T>> {
+    return this.httpClient.get<Job<T>>(this.apiBaseUrl + `/jobs/${job_id}`);
+  }
+
+  cancelJob(job_id: number): Observable<Job> {
+    return this.httpClient.delete<Job>(this.apiBaseUrl + `/jobs/${job_id}`);
+  }
+
+  // Imports run in the background, poll the job until it is over and emit its result
+  waitForJob<T>(job: Job<T>, interval = 1000): Observable<T> {
+    return timer(0, interval).pipe(
+      switchMap(() => this.getJob<T>(job.id)),
+      filter((j) => !['pending', 'running'].includes(j.status)),
+      take(1),
+      switchMap((j) => {
+        if (j.status === 'done') return [j.result as T];
+        this.utilsService.toast(
+          'error',
+          'Error',
+          j.error || `Job was ${j.status}`,
+          5000,
+        );
+        return throwError(() => new Error(j.error || j.status));
+      }),
     );
   }
 }
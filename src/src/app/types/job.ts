@@ -0,0 +1,11 @@
+export interface Job<T = any> {
+  id: number;
+  kind: string;
+  status: 'pending' | 'running' | 'done' | 'failed' | 'cancelled';
+  progress: number;
+  counts?: Record<string, number>;
+  result?: T;
+  error?: string;
+  created_at: string;
+  finished_at?: string;
+}
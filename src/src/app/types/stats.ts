@@ -1,21 +1,35 @@
 import { BlocCategory } from './bloc';
 
-export interface HealthWatchData {
-  id: number;
-  cdate: string;
-  recovery: number;
-  resting_hr: number;
-  hrv: number;
-  temperature: number;
-  oxy_level: number;
-  strain: number;
-  sleep_score: number;
-  sleep_duration_light: number; //minutes
-  sleep_duration_deep: number; //minutes
-  sleep_duration_rem: number; //minutes
-  sleep_duration_awake: number; //minutes
-  sleep_efficiency: number;
-  sleep_duration_total: number; //minutes
+export interface HealthMetric {
+  average: number;
+  std: number;
+  min: number;
+  q1: number;
+  median: number;
+  q3: number;
+  max: number;
+  trailing_7d_mean: number;
+  zscore: number;
+  trend: {
+    previous: number;
+    change: number;
+    direction: 'up' | 'down' | '';
+  } | null;
+}
+
+export interface HealthAnalytics {
+  count: number;
+  latest: string | null;
+  // Empty when the year has no data
+  metrics: Partial<
+    Record<'sleep' | 'hrv' | 'strain' | 'recovery' | 'resting_hr', HealthMetric>
+  >;
+  series: {
+    dates: string[];
+    hrv: number[];
+    strain: number[];
+    recovery: number[];
+  };
 }
 
 export interface BlocsByCategory extends BlocCategory {